@@ -0,0 +1,364 @@
+"""
+Per-page cache of chat answers that also catches paraphrased questions.
+
+Answers are keyed by page fingerprint. A lookup first tries the normalized
+question exactly, then compares it with the questions already answered on
+the same page: TF-IDF weighted content words (with a few synonyms folded
+together and light suffix stripping) plus character trigrams, scored by
+cosine similarity. The closest question at or above the threshold is a hit,
+and only if both name the same identifiers ("plan B", "v2").
+Everything is local; no embedding service is involved.
+
+Entries live in one LRU bounded by count with a TTL. When a URL shows up
+with a new fingerprint its content changed, so the old page's answers are
+dropped. With SHARED_STATE_DB set, every worker process keeps a replica fed
+from a log in the shared database (SharedAnswerCache).
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from shared_state import SHARED_STATE_DB, Database
+from text_utils import STOPWORDS, normalize_query
+
+CHAT_CACHE_ENABLED = os.environ.get("CHAT_ANSWER_CACHE", "true").lower() == "true"
+CHAT_CACHE_SIMILARITY = float(os.environ.get("CHAT_CACHE_SIMILARITY", "0.6"))
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", "2048"))
+CHAT_CACHE_MAX_PER_PAGE = int(os.environ.get("CHAT_CACHE_MAX_PER_PAGE", "64"))
+CHAT_CACHE_TTL_SECONDS = float(os.environ.get("CHAT_CACHE_TTL_SECONDS", str(60 * 60)))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Names a question can only share with the same name: "plan B", "v2", "2024"
+_IDENTIFIER = re.compile(r"\b(?:[A-HJ-Z]|[A-Za-z]*[0-9][A-Za-z0-9]*)\b")
+# Question filler on top of the retrieval stopwords
+_QUESTION_WORDS = frozenset("much many tell about please there any get know explain show give find".split())
+# Multi-word spellings of one term
+PHRASES = {"sign up": "signup", "log in": "login", "set up": "setup", "free of charge": "free", "how much": "price"}
+# Folded before stemming so paraphrases share a feature
+SYNONYMS = {
+    "cost": "price", "costs": "price", "pricing": "price", "prices": "price", "priced": "price",
+    "fee": "price", "fees": "price", "charge": "price",
+    "purchase": "buy", "order": "buy", "subscribe": "signup", "register": "signup", "join": "signup",
+    "contact": "reach", "email": "reach", "phone": "reach", "call": "reach",
+    "summarize": "summary", "summarise": "summary", "overview": "summary", "tldr": "summary",
+    "begin": "start", "started": "start", "setup": "install", "installation": "install",
+    "docs": "documentation", "doc": "documentation", "manual": "documentation", "guide": "documentation",
+    "unsubscribe": "cancel", "refunds": "refund",
+}
+# Character trigrams count for less than whole words
+TRIGRAM_WEIGHT = 0.35
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def question_features(query: str) -> Dict[str, float]:
+    """
+    Content words and their character trigrams, as raw term weights, plus one
+    "i:" feature per identifier (a capital letter or a token with digits).
+    """
+    text = query.lower().replace("'s ", " ")
+    for phrase, term in PHRASES.items():
+        text = text.replace(phrase, term)
+    words = [_stem(SYNONYMS.get(w, w)) for w in _WORD.findall(text)
+             if w not in STOPWORDS and w not in _QUESTION_WORDS]
+    # A sentence-initial "A" is the article
+    names = _IDENTIFIER.findall(re.sub(r"^\W*A\b", "", query))
+    features: Dict[str, float] = {f"i:{name.lower()}": 1.0 for name in names}
+    for word in words:
+        features[f"w:{word}"] = features.get(f"w:{word}", 0.0) + 1.0
+    padded = f" {' '.join(words)} "
+    for i in range(len(padded) - 2):
+        gram = f"c:{padded[i:i + 3]}"
+        features[gram] = features.get(gram, 0.0) + TRIGRAM_WEIGHT
+    return features
+
+
+def _identifiers(features: Dict[str, float]) -> Set[str]:
+    return {feature for feature in features if feature.startswith("i:")}
+
+
+@dataclass
+class CachedAnswer:
+    page: str
+    query: str
+    features: Dict[str, float]
+    answer: dict
+    expires_at: float
+    # TF-IDF vector and norm, recomputed when the document frequencies changed
+    vector: Optional[Dict[str, float]] = None
+    norm: float = 0.0
+    version: int = -1
+
+
+class AnswerCache:
+    def __init__(self, enabled: bool = CHAT_CACHE_ENABLED, threshold: float = CHAT_CACHE_SIMILARITY,
+                 max_entries: int = CHAT_CACHE_MAX_ENTRIES, max_per_page: int = CHAT_CACHE_MAX_PER_PAGE,
+                 ttl_seconds: float = CHAT_CACHE_TTL_SECONDS):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_per_page = max_per_page
+        self.ttl_seconds = ttl_seconds
+        # (page fingerprint, normalized query) -> answer, least recently used first
+        self._entries: "OrderedDict[Tuple[str, str], CachedAnswer]" = OrderedDict()
+        self._pages: Dict[str, Set[str]] = {}
+        # url -> fingerprint of the version cached, and back
+        self._page_urls: Dict[str, str] = {}
+        self._urls: Dict[str, str] = {}
+        # Document frequency of each feature over all cached questions, for IDF
+        self._df: Dict[str, int] = {}
+        self._df_version = 0
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lookup_seconds = 0.0
+
+    def _idf(self, feature: str) -> float:
+        return math.log(1 + (len(self._entries) + 1) / (self._df.get(feature, 0) + 1))
+
+    def _vector(self, features: Dict[str, float]) -> Tuple[Dict[str, float], float]:
+        vector = {feature: weight * self._idf(feature) for feature, weight in features.items()}
+        return vector, math.sqrt(sum(v * v for v in vector.values()))
+
+    def _similarity(self, query: Tuple[Dict[str, float], float], entry: CachedAnswer) -> float:
+        if entry.version != self._df_version:
+            entry.vector, entry.norm = self._vector(entry.features)
+            entry.version = self._df_version
+        vector, norm = query
+        if not norm or not entry.norm:
+            return 0.0
+        # "plan A" and "plan B" read alike but are different questions
+        if _identifiers(vector) != _identifiers(entry.features):
+            return 0.0
+        other = entry.vector
+        dot = sum(weight * other[feature] for feature, weight in vector.items() if feature in other)
+        return dot / (norm * entry.norm)
+
+    def _check_page(self, url: str, page: str):
+        """A URL with a new fingerprint means the page changed; forget the old version's answers."""
+        previous = self._page_urls.get(url.split("#", 1)[0].rstrip("/"))
+        if previous is not None and previous != page:
+            self._drop_page(previous)
+            self.invalidations += 1
+
+    def get(self, url: str, page: str, query: str, record: bool = True) -> Tuple[Optional[dict], str]:
+        """(answer, "exact" | "similar") on a hit, (None, "miss") otherwise; record=False leaves the stats alone."""
+        if not self.enabled:
+            return None, "miss"
+        start = time.perf_counter()
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._check_page(url, page)
+            match, kind = self._entries.get((page, key)), "exact"
+            if match is None or match.expires_at <= now:
+                match, kind = None, "miss"
+                features = question_features(query)
+                if features:
+                    vector = self._vector(features)
+                    best = self.threshold
+                    for candidate in list(self._pages.get(page, ())):
+                        entry = self._entries[(page, candidate)]
+                        if entry.expires_at <= now:
+                            self._remove((page, candidate))
+                            continue
+                        score = self._similarity(vector, entry)
+                        if score >= best:
+                            match, kind, best = entry, "similar", score
+
+            if not record:
+                pass
+            elif match is not None:
+                self._entries.move_to_end((page, match.query))
+                if kind == "exact":
+                    self.exact_hits += 1
+                else:
+                    self.similar_hits += 1
+                self.lookup_seconds += time.perf_counter() - start
+            else:
+                self.misses += 1
+                self.lookup_seconds += time.perf_counter() - start
+        return (match.answer if match is not None else None), kind
+
+    def set(self, url: str, page: str, query: str, answer: dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._insert(url, page, query, answer, time.time() + self.ttl_seconds)
+
+    def _insert(self, url: str, page: str, query: str, answer: dict, expires_at: float):
+        """Adds an answer; the caller holds the lock."""
+        key = normalize_query(query)
+        features = question_features(query)
+        self._check_page(url, page)
+        if (page, key) in self._entries:
+            self._remove((page, key))
+        questions = self._pages.setdefault(page, set())
+        url = url.split("#", 1)[0].rstrip("/")
+        self._page_urls[url] = page
+        self._urls[page] = url
+        # Per-page bound: make room by evicting this page's least recently used answer
+        if len(questions) >= self.max_per_page:
+            oldest = next(k for k in self._entries if k[0] == page)
+            self._remove(oldest)
+            self.evictions += 1
+        self._entries[(page, key)] = CachedAnswer(page, key, features, answer, expires_at)
+        questions.add(key)
+        for feature in features:
+            self._df[feature] = self._df.get(feature, 0) + 1
+        self._df_version += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key)
+        questions = self._pages.get(entry.page)
+        if questions is not None:
+            questions.discard(entry.query)
+            if not questions:
+                del self._pages[entry.page]
+                url = self._urls.pop(entry.page, None)
+                if self._page_urls.get(url) == entry.page:
+                    del self._page_urls[url]
+        for feature in entry.features:
+            count = self._df.get(feature, 0) - 1
+            if count > 0:
+                self._df[feature] = count
+            else:
+                self._df.pop(feature, None)
+        self._df_version += 1
+
+    def _drop_page(self, page: str):
+        for query in list(self._pages.get(page, ())):
+            self._remove((page, query))
+
+    def invalidate_page(self, page: str):
+        with self._lock:
+            self._drop_page(page)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._pages.clear()
+        self._page_urls.clear()
+        self._urls.clear()
+        self._df.clear()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "pages": len(self._pages),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "avg_lookup_us": round(self.lookup_seconds / lookups * 1e6, 1) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class SharedAnswerCache(AnswerCache):
+    """
+    An AnswerCache replicated across worker processes. Writes are appended to a
+    log in the shared database and each worker replays the records it has not
+    seen before every lookup, so it holds the whole question set of a page for
+    paraphrase matching and an answer cached by one worker is a hit in all of
+    them. Records are pruned once the answers they carry have expired, and the
+    log keeps at most max_entries of them: a worker that finds records it never
+    saw were pruned rebuilds its copy from what is left, which is the newest
+    state since everything before a pruned record went with it.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self._db = Database(path, [
+            "CREATE TABLE IF NOT EXISTS chat_answers (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, "
+            "url TEXT, page TEXT, query TEXT, answer TEXT, expires_at REAL NOT NULL)",
+        ])
+        # Last log record applied here
+        self._seq = 0
+        self.replayed = 0
+        self.resyncs = 0
+
+    def _append(self, op: str, url: str = None, page: str = None, query: str = None, answer: dict = None):
+        now = time.time()
+        with self._db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO chat_answers (op, url, page, query, answer, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (op, url, page, query, json.dumps(answer) if answer is not None else None, now + self.ttl_seconds))
+            conn.execute("DELETE FROM chat_answers WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM chat_answers WHERE seq <= (SELECT MAX(seq) FROM chat_answers) - ?",
+                         (self.max_entries,))
+        self._sync()
+
+    def _sync(self):
+        """Applies the records written since the last sync, by any worker including this one."""
+        rows = self._db.execute(
+            "SELECT seq, op, url, page, query, answer, expires_at FROM chat_answers WHERE seq > ? ORDER BY seq", (self._seq,))
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            if rows[0][0] != self._seq + 1 and self._seq:
+                # Records this worker had not applied were pruned: start over from the log
+                self._clear()
+                self.resyncs += 1
+            for seq, op, url, page, query, answer, expires_at in rows:
+                if seq <= self._seq:
+                    continue
+                if op == "set" and expires_at > now:
+                    self._insert(url, page, query, json.loads(answer), expires_at)
+                elif op == "drop":
+                    self._drop_page(page)
+                    self.invalidations += 1
+                elif op == "clear":
+                    self._clear()
+                self._seq = seq
+                self.replayed += 1
+
+    def get(self, url: str, page: str, query: str, record: bool = True) -> Tuple[Optional[dict], str]:
+        if self.enabled:
+            self._sync()
+        return super().get(url, page, query, record)
+
+    def set(self, url: str, page: str, query: str, answer: dict):
+        if self.enabled:
+            self._append("set", url, page, query, answer)
+
+    def invalidate_page(self, page: str):
+        self._append("drop", page=page)
+
+    def clear(self):
+        self._append("clear")
+
+    def stats(self) -> dict:
+        return {**super().stats(), "shared": True, "replayed": self.replayed, "resyncs": self.resyncs}
+
+
+answer_cache = SharedAnswerCache(SHARED_STATE_DB) if SHARED_STATE_DB else AnswerCache()
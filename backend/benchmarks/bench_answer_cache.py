@@ -0,0 +1,103 @@
+"""
+Paraphrase matching of the chat answer cache.
+
+Each set below is one question asked several ways. For every threshold the
+first phrasing of each set is answered and cached, then the other phrasings
+are looked up on the same page: a hit on the set's own answer is correct, a
+hit on another set's answer is a false hit. Near misses are different
+questions worded almost the same, which must not hit each other. Lookup
+latency is measured with --filler extra unrelated questions cached on the
+page; the slowest lookups are the first after a write, which re-weights the
+cached questions.
+
+    python benchmarks/bench_answer_cache.py [--filler 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import AnswerCache
+
+PARAPHRASE_SETS = [
+    ["What is the pricing?", "How much does it cost?", "what are the prices", "How much is it"],
+    ["How do I sign up?", "How can I register?", "how to create an account", "Where do I sign up for this"],
+    ["What is this page about?", "What's this page for?", "Summarize this page", "Give me an overview of the page"],
+    ["How do I contact support?", "How can I reach customer support?", "support contact", "Is there a support email?"],
+    ["Does it have a free trial?", "Is there a free trial?", "can I try it for free", "free trial available?"],
+    ["How do I install it?", "Installation steps", "how to set it up", "What's the setup process?"],
+    ["Which languages are supported?", "What languages does it support?", "supported languages", "Does it support Python?"],
+    ["Can I cancel my subscription?", "How do I cancel?", "cancel subscription", "How to unsubscribe"],
+    ["Where is the documentation?", "Is there any documentation?", "Where can I find the docs?", "link to docs"],
+    ["What is the refund policy?", "Can I get a refund?", "refunds", "Do you offer refunds?"],
+]
+
+# (cached question, different question that must not get its answer)
+NEAR_MISSES = [
+    ("What is the price of the pro plan?", "What is the price of the enterprise plan?"),
+    ("How do I install it on Windows?", "How do I install it on Linux?"),
+    ("How do I cancel my subscription?", "How do I cancel my order?"),
+    ("Is there a free trial?", "Is there a student discount?"),
+    ("Does it support Python?", "Does it support Java?"),
+    ("Where is the documentation?", "Where is the changelog?"),
+    ("How do I sign up?", "How do I log in?"),
+    ("What is the refund policy?", "What is the privacy policy?"),
+    ("What is the price of plan A?", "What is the price of plan B?"),
+    ("How much is the v1 license?", "How much is the v2 license?"),
+    ("Is it cheap?", "Is it expensive?"),
+    ("Can I get a refund?", "Can I get money?"),
+]
+
+FILLER = [f"What does section {i} say about feature {i * 7} and option {i * 3}?" for i in range(1000)]
+
+
+def run(threshold: float, filler: int):
+    cache = AnswerCache(enabled=True, threshold=threshold, max_per_page=filler + len(PARAPHRASE_SETS) + 1)
+    url, page = "https://example.com/product", "page-fingerprint"
+    for question in FILLER[:filler]:
+        cache.set(url, page, question, {"answer": "filler"})
+    for i, phrasings in enumerate(PARAPHRASE_SETS):
+        cache.set(url, page, phrasings[0], {"answer": i})
+
+    correct = false = missed = 0
+    timings = []
+    for i, phrasings in enumerate(PARAPHRASE_SETS):
+        for question in phrasings[1:]:
+            start = time.perf_counter()
+            answer, _ = cache.get(url, page, question)
+            timings.append(time.perf_counter() - start)
+            if answer is None:
+                missed += 1
+            elif answer["answer"] == i:
+                correct += 1
+            else:
+                false += 1
+    timings.sort()
+
+    near = AnswerCache(enabled=True, threshold=threshold)
+    near_hits = 0
+    for i, (cached, other) in enumerate(NEAR_MISSES):
+        near.set(url, page, cached, {"answer": i})
+    for cached, other in NEAR_MISSES:
+        near_hits += near.get(url, page, other)[0] is not None
+    return correct, false, missed, near_hits / len(NEAR_MISSES), timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filler", type=int, default=50, help="unrelated questions cached on the page")
+    args = parser.parse_args()
+
+    total = sum(len(phrasings) - 1 for phrasings in PARAPHRASE_SETS)
+    print(f"{total} paraphrased lookups, {len(PARAPHRASE_SETS)} answers + {args.filler} filler questions cached")
+    print("threshold  correct  false hits  missed  near-miss hits   p50 lookup   p99 lookup")
+    for threshold in (0.5, 0.6, 0.7, 0.75, 0.8, 0.9):
+        correct, false, missed, near, timings = run(threshold, args.filler)
+        print(f"  {threshold:4.2f}    {correct / total:6.1%}   {false / total:6.1%}    {missed / total:6.1%}      {near:6.1%}"
+              f"   {timings[len(timings) // 2] * 1e6:7.0f} us   {timings[int(len(timings) * 0.99)] * 1e6:7.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-request chain setup overhead: building a fresh chain on every request
+(the old behaviour) versus fetching it from the shared ChainRegistry.
+
+    python benchmarks/bench_chain_registry.py [iterations]
+
+No network calls are made; only client/parser/prompt construction is timed.
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Construction only validates the key format, it never calls the API
+os.environ.setdefault("GOOGLE_API_KEY", "AIza" + "x" * 35)
+
+from chains import build_tour_generator_chain, build_chat_chain, ChainRegistry, DEFAULT_MODEL
+
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} mean={statistics.mean(samples):9.3f}ms  p50={statistics.median(samples):9.3f}ms  p95={p95:9.3f}ms")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    # Warm imports and lazy module state so neither side pays for them
+    build_tour_generator_chain()
+    build_chat_chain()
+
+    registry = ChainRegistry()
+    registry.register("tour", build_tour_generator_chain)
+    registry.register("chat", build_chat_chain)
+
+    print(f"{iterations} iterations per case\n")
+    for kind, builder, temperature in (("tour", build_tour_generator_chain, 0.7), ("chat", build_chat_chain, 0.5)):
+        registry.get(kind, DEFAULT_MODEL, temperature)  # first use builds, like app startup
+        before = time_calls(lambda: builder(DEFAULT_MODEL, temperature), iterations)
+        after = time_calls(lambda: registry.get(kind, DEFAULT_MODEL, temperature), iterations)
+        report(f"{kind}: build per request", before)
+        report(f"{kind}: registry lookup", after)
+        print(f"{'':<28} speedup x{statistics.mean(before) / max(statistics.mean(after), 1e-9):,.0f}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Prompt size before/after the compaction pipeline on the benchmark corpus,
+with each step's saving and the time compaction itself takes.
+
+Generation latency is estimated from prompt size with a simple prefill
+model (--prefill-ms-per-1k input tokens); it is an estimate, not a
+measurement against Gemini.
+
+    python benchmarks/bench_compaction.py [--prefill-ms-per-1k 60]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import parse_elements
+from compaction import CompactionPipeline, tour_compactor, chat_compactor
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=60.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for label, template in (("tour", tour_compactor), ("chat", chat_compactor)):
+        print(f"== {label} pipeline: {' -> '.join(template.step_names)}")
+        total_before = total_after = 0
+        for path in sorted(glob.glob(os.path.join(CORPUS, "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                page = json.load(f)
+            elements = parse_elements(page["elements"])
+
+            # Fresh pipeline without memoization so every run is timed
+            pipeline = CompactionPipeline(template.step_names, baseline=template.baseline)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = pipeline.run(elements, "models/gemini-2.5-flash")
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+            before, after = result.tokens_before, result.tokens_after
+            total_before += before
+            total_after += after
+            saved = "  ".join(f"{name}={value}" for name, value in result.saved_by_step.items())
+            latency_saved = (before - after) / 1000 * args.prefill_ms_per_1k
+            print(f"{os.path.basename(path):<14} {len(page['elements']):4d} -> {len(result.elements):4d} elements  "
+                  f"{before:6d} -> {after:6d} tokens ({1 - after / before:6.1%})  compaction {elapsed_ms:6.2f}ms  "
+                  f"est. prefill saved {latency_saved:6.0f}ms")
+            print(f"{'':<14} saved by step: {saved}")
+        print(f"{'total':<14} {total_before} -> {total_after} tokens ({1 - total_after / total_before:.1%})\n")
+
+
+if __name__ == "__main__":
+    main()
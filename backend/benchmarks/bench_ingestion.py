@@ -0,0 +1,96 @@
+"""
+Micro-benchmarks for the non-LLM part of a request: parsing PageContent
+payloads and serializing responses, on the benchmark corpus pages.
+
+  parse:      request body bytes -> validated PageContent
+  prompt:     PageContent -> rendered element lines
+  serialize:  TourPlan -> response body bytes
+
+"before" re-creates the previous code paths (List[Dict] validation plus one
+DOMElement model per element, and jsonable_encoder + json.dumps for
+responses) so the two can be compared side by side.
+
+    python benchmarks/bench_ingestion.py [--repeat 200]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+from typing import Any, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, TypeAdapter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import DOMElement, PageContent, TourPlan, TourStep
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+class LegacyPageContent(BaseModel):
+    url: str
+    title: str
+    elements: List[Dict[str, Any]]
+
+
+def legacy_parse(body: bytes):
+    content = LegacyPageContent.model_validate_json(body)
+    return content, [DOMElement(**el) for el in content.elements]
+
+
+def legacy_prompt(parsed):
+    content, dom_elements = parsed
+    return "\n".join(f"<{el.tagName} id='{el.id}'>{el.text}</{el.tagName}>" for el in dom_elements)
+
+
+def typed_prompt(content):
+    return "\n".join(f"<{el.tagName} id='{el.id}'>{el.text}</{el.tagName}>" for el in content.elements)
+
+
+def sample_plan(steps=15):
+    return TourPlan(steps=[
+        TourStep(element_selector=f"body > main > section:nth-of-type({i}) > p", narrative="Here we can see the next part of the page. " * 4)
+        for i in range(steps)
+    ])
+
+
+def bench(label, fn, repeat):
+    seconds = min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat
+    print(f"  {label:<34} {seconds * 1e6:10.1f} us")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(os.path.join(CORPUS, "*.json"))):
+        with open(path, "rb") as f:
+            body = f.read()
+        elements = len(json.loads(body)["elements"])
+        print(f"{os.path.basename(path)} ({elements} elements, {len(body) / 1024:.0f} KiB)")
+
+        before = bench("parse: List[Dict] + DOMElement", lambda: legacy_parse(body), args.repeat)
+        after = bench("parse: PageElement slots records", lambda: PageContent.model_validate_json(body), args.repeat)
+        print(f"  {'':<34} x{before / after:.1f}")
+
+        legacy = legacy_parse(body)
+        typed = PageContent.model_validate_json(body)
+        before = bench("prompt lines: DOMElement", lambda: legacy_prompt(legacy), args.repeat)
+        after = bench("prompt lines: PageElement", lambda: typed_prompt(typed), args.repeat)
+        print(f"  {'':<34} x{before / after:.1f}\n")
+
+    plan = sample_plan()
+    adapter = TypeAdapter(TourPlan)
+    print("TourPlan response (15 steps)")
+    before = bench("serialize: jsonable_encoder+json", lambda: json.dumps(jsonable_encoder(plan)).encode(), args.repeat * 5)
+    after = bench("serialize: response_model", lambda: adapter.dump_json(plan), args.repeat * 5)
+    print(f"  {'':<34} x{before / after:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Intent-specific tours: full-page regeneration vs. planning from a page digest.
+
+For each of --intents intents on one page, the full-page way sends the whole
+compacted page with the intent; the two-stage way builds the page digest once
+(in the background, paid for by the first intent, which is answered from
+the whole page) and plans every later tour from the digest plus the
+elements matching the intent. Runs against the fake model, whose time to first
+token grows with prompt size (--prefill tokens/s), and reports per-intent
+latency and tokens, with the digest charged to the first intent.
+
+    python benchmarks/bench_intent_tours.py [--sections 12 --paragraphs 15]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+import main
+from chains import get_tour_generator_chain
+from digest import digest_cache, digest_cache_key
+from schemas import PageContent
+
+TOPICS = ["pricing", "signup", "installation", "security", "integrations", "billing", "support", "api keys",
+          "data export", "team roles", "notifications", "limits"]
+WORDS = ("plan account workspace project token request dashboard setting user admin invoice report webhook "
+         "region backup audit session password email browser mobile storage upload download").split()
+
+
+def build_page(sections: int, paragraphs: int, seed: int = 1) -> PageContent:
+    rng = random.Random(seed)
+    elements = [{"tagName": "H1", "text": "Product handbook", "selector": "h1"}]
+    for s in range(sections):
+        topic = TOPICS[s % len(TOPICS)]
+        elements.append({"tagName": "H2", "text": f"{topic.title()} guide", "selector": f"#{topic.replace(' ', '-')}"})
+        for p in range(paragraphs):
+            words = " ".join(rng.choice(WORDS) for _ in range(24))
+            elements.append({"tagName": "P", "selector": f"#{topic.replace(' ', '-')} ~ p:nth-of-type({p + 1})",
+                             "text": f"{topic.capitalize()} {words}."})
+        elements.append({"tagName": "BUTTON", "text": f"Open {topic} settings", "selector": f"#{topic.replace(' ', '-')}-cta"})
+    return PageContent(url=f"https://example.com/handbook-{sections}x{paragraphs}", title="Handbook", elements=elements)
+
+
+async def full_page_tour(content: PageContent, intent: str):
+    decision = main.route_tour(content, "tour")
+
+    async def run(model: str):
+        return await get_tour_generator_chain(model).ainvoke({**main.tour_inputs(content, model), "user_intent": intent})
+
+    return await main.model_router.call("tour", decision, run)
+
+
+async def two_stage_tour(content: PageContent, intent: str):
+    plan, _ = await main.generate_tour(content, None, intent)
+    return plan
+
+
+def tokens(usage) -> tuple:
+    counts = usage.usage_metadata.values()
+    return sum(c["input_tokens"] for c in counts), sum(c["output_tokens"] for c in counts)
+
+
+async def measure(content: PageContent, intents, tour):
+    runs = []
+    for intent in intents:
+        with get_usage_metadata_callback() as usage:
+            start = time.perf_counter()
+            plan = await tour(content, intent)
+            seconds = time.perf_counter() - start
+            # A digest built in the background is charged to the intent that started it
+            await asyncio.gather(*main.digest_builds)
+            runs.append((seconds, *tokens(usage), len(plan.steps)))
+    return runs
+
+
+def report(name: str, runs):
+    seconds = [r[0] for r in runs]
+    print(f"{name:22} p50 {statistics.median(seconds):5.2f} s  mean {statistics.mean(seconds):5.2f} s  "
+          f"prompt {statistics.mean(r[1] for r in runs):7.0f}  completion {statistics.mean(r[2] for r in runs):5.0f} "
+          f"tokens/intent  total {sum(r[1] + r[2] for r in runs):7d} tokens")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=12)
+    parser.add_argument("--paragraphs", type=int, default=15)
+    parser.add_argument("--intents", type=int, default=10)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--prefill", type=float, default=5000, help="fake prompt tokens processed per second")
+    parser.add_argument("--tokens-per-second", type=float, default=150)
+    args = parser.parse_args()
+
+    os.environ.update({"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+                       "FAKE_LLM_PREFILL_TOKENS_PER_SECOND": str(args.prefill),
+                       "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second)})
+    content = build_page(args.sections, args.paragraphs)
+    intents = [f"Show me the {topic} section" for topic in (TOPICS * 3)[:args.intents]]
+    print(f"{len(content.elements)} elements, {args.intents} intents")
+
+    main.registry.clear()
+    digest_cache.invalidate(digest_cache_key(content))
+    full = asyncio.run(measure(content, intents, full_page_tour))
+    staged = asyncio.run(measure(content, intents, two_stage_tour))
+
+    report("full-page per intent", full)
+    report("two-stage (all)", staged)
+    report("two-stage (warm)", staged[1:])
+    first = staged[0]
+    print(f"first intent: {first[0]:.2f} s, {first[1] + first[2]} tokens including the digest")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,62 @@
+"""
+Cost of the /metrics instrumentation on the request path.
+
+Times a single histogram observation, then runs the chat chain against the
+zero-latency fake model with and without the LLMMetricsCallback, so the
+difference is the per-call overhead of stage timing and token counting. The
+fake model gets a quota scheduler of its own with no practical limit; the
+default Gemini quotas would throttle the loop and swamp the difference.
+
+    python benchmarks/bench_metrics.py [--calls 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.update({"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1e9"})
+
+import ratelimit
+from chains import build_chat_chain
+from metrics import STAGE_SECONDS
+from ratelimit import QuotaScheduler
+
+INPUTS = {"page_title": "Bench", "page_content": "h1| Benchmark page\np| Some text", "query": "What is this?"}
+
+
+async def time_chain(chain, calls):
+    for _ in range(50):
+        await chain.ainvoke(INPUTS)
+    start = time.perf_counter()
+    for _ in range(calls):
+        await chain.ainvoke(INPUTS)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    child = STAGE_SECONDS.labels("bench", "observe")
+    n = 1_000_000
+    start = time.perf_counter()
+    for _ in range(n):
+        child.observe(0.012)
+    print(f"histogram observe:          {(time.perf_counter() - start) / n * 1e9:8.0f} ns")
+
+    ratelimit.quota_scheduler = QuotaScheduler(quotas={}, default_quota=(10 ** 9, 10 ** 12))
+    instrumented = build_chat_chain()
+    plain = instrumented.bound  # the same chain without the bound callbacks
+    with_callbacks = asyncio.run(time_chain(instrumented, args.calls))
+    without = asyncio.run(time_chain(plain, args.calls))
+    print(f"chat chain, no callbacks:   {without * 1e6:8.0f} us/call")
+    print(f"chat chain, with metrics:   {with_callbacks * 1e6:8.0f} us/call  "
+          f"(+{(with_callbacks - without) * 1e6:.0f} us, {with_callbacks / without - 1:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
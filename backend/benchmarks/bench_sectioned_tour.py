@@ -0,0 +1,83 @@
+"""
+Single-prompt vs section-by-section tours for large pages.
+
+Builds a long documentation page (--sections headings with --paragraphs
+paragraphs each) and generates its tour both ways against the fake model,
+whose time to first token grows with prompt size (--prefill tokens/s) like a
+real model's. Reports wall-clock time, the prompt tokens sent, and how far
+down the page the tour reaches.
+
+    python benchmarks/bench_sectioned_tour.py [--sections 40 --paragraphs 60]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+import main
+from schemas import PageContent
+from sectioning import split_sections
+
+
+WORDS = ("cache replica shard index query token budget latency schema migration rollout cluster node lease "
+         "quorum snapshot journal checksum backoff deadline tenant region bucket stream cursor batch window "
+         "policy credential secret rotation audit trace span metric alert threshold").split()
+
+
+def build_page(sections: int, paragraphs: int, seed: int = 1) -> PageContent:
+    # Varied text, so compaction's near-duplicate removal does not collapse the page
+    rng = random.Random(seed)
+    elements = []
+    for s in range(sections):
+        elements.append({"tagName": "H2", "text": f"Chapter {s}: the {' '.join(rng.sample(WORDS, 3))}", "selector": f"#chapter-{s}"})
+        for p in range(paragraphs):
+            elements.append({"tagName": "P", "selector": f"#chapter-{s} ~ p:nth-of-type({p + 1})",
+                             "text": " ".join(rng.choice(WORDS) for _ in range(28)).capitalize() + "."})
+    return PageContent(url=f"https://docs.example.com/long-{sections}x{paragraphs}", title="Long reference", elements=elements)
+
+
+async def timed_tour(content: PageContent):
+    with get_usage_metadata_callback() as usage:
+        start = time.perf_counter()
+        plan, _ = await main.generate_tour(content, None)
+        seconds = time.perf_counter() - start
+    positions = {el.selector: i for i, el in enumerate(content.elements)}
+    reached = max((positions.get(step.element_selector, 0) for step in plan.steps), default=0)
+    prompt = sum(counts["input_tokens"] for counts in usage.usage_metadata.values())
+    return seconds, len(plan.steps), reached / len(content.elements), prompt
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=40)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--prefill", type=float, default=5000, help="fake prompt tokens processed per second")
+    parser.add_argument("--tokens-per-second", type=float, default=150)
+    args = parser.parse_args()
+
+    os.environ.update({"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+                       "FAKE_LLM_PREFILL_TOKENS_PER_SECOND": str(args.prefill),
+                       "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second)})
+    content = build_page(args.sections, args.paragraphs)
+    sections = split_sections(content.elements, content.title)
+    print(f"{len(content.elements)} elements, {sum(s.tokens for s in sections)} tokens, {len(sections)} sections "
+          f"(largest {max(s.tokens for s in sections)} tokens)")
+
+    main.registry.clear()
+    with patch.object(main, "is_large_page", lambda elements: False):
+        single = asyncio.run(timed_tour(content))
+    sectioned = asyncio.run(timed_tour(content))
+    for name, (seconds, steps, reached, prompt) in (("single prompt", single), ("sectioned", sectioned)):
+        print(f"{name:14} {seconds:6.2f} s  {steps:3d} steps  reaches {reached:6.1%} of the page  {prompt:6d} prompt tokens")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,100 @@
+"""
+Speculative suggestion answers: follow-up latency, hit rate and wasted tokens.
+
+Simulates chat sessions against the app in-process with the fake model: each
+session asks a question, "reads" the answer for --think seconds, then taps one
+of the suggestions with probability --tap-rate (otherwise asks something new),
+for --turns turns. Runs once without and once with speculation.
+
+    python benchmarks/bench_speculation.py [--sessions 40 --ttft-ms 400 --tap-rate 0.6]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from unittest.mock import patch
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from speculation import Speculator
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def session(client, page, args, rng, latencies):
+    query = "What is this page about?"
+    for turn in range(args.turns):
+        start = time.perf_counter()
+        response = await client.post("/api/chat", json={"query": query, "content": page})
+        if turn:
+            latencies.append(time.perf_counter() - start)
+        suggestions = response.json().get("suggestions") or []
+        await asyncio.sleep(args.think)
+        if suggestions and rng.random() < args.tap_rate:
+            query = rng.choice(suggestions)
+        else:
+            query = f"Tell me about item {rng.randint(1, 1000)} on this page"
+
+
+async def run(args, speculate: bool):
+    pages = []
+    for name in sorted(os.listdir(CORPUS)):
+        if name.endswith(".json"):
+            with open(os.path.join(CORPUS, name)) as f:
+                page = json.load(f)
+            pages += [{**page, "url": f"{page['url']}?session={i}"} for i in range(args.sessions)]
+    rng = random.Random(args.seed)
+    pages = rng.sample(pages, args.sessions)
+
+    speculator = Speculator(enabled=speculate, tokens_per_minute=args.budget, max_in_flight=args.max_in_flight)
+    latencies = []
+    main.registry.clear()
+    with patch.object(main, "speculator", speculator):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            await asyncio.gather(*(session(client, page, args, random.Random(rng.random()), latencies) for page in pages))
+    # Sessions are over: whatever is still unclaimed was wasted
+    while speculator.in_flight:
+        await asyncio.sleep(0.05)
+    speculator.clear()
+    return latencies, speculator.stats()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--think", type=float, default=1.0, help="seconds between answer and next question")
+    parser.add_argument("--tap-rate", type=float, default=0.6)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--budget", type=int, default=200000, help="speculation tokens per minute")
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.update({"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": str(args.ttft_ms), "FAKE_LLM_TOKENS_PER_SECOND": "400"})
+    for speculate in (False, True):
+        latencies, stats = asyncio.run(run(args, speculate))
+        print(f"speculation {'on ' if speculate else 'off'}: follow-up p50={percentile(latencies, 0.5) * 1000:6.0f} ms  "
+              f"p95={percentile(latencies, 0.95) * 1000:6.0f} ms")
+        if speculate:
+            print(f"  hit rate {stats['hit_rate']:.1%} of {stats['lookups']} questions ({stats['hits_in_flight']} joined in flight), "
+                  f"{stats['used_ratio']:.1%} of {stats['completed']} speculations used")
+            print(f"  tokens spent {stats['tokens_spent']}, wasted {stats['tokens_wasted']} "
+                  f"({stats['wasted_token_ratio']:.1%}), "
+                  f"skipped busy={stats['skipped_busy']} budget={stats['skipped_budget']} cap={stats['skipped_in_flight']}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+"""
+Time to first TourStep: /api/analyze (whole plan at once) versus
+/api/analyze/stream (steps as soon as their JSON closes).
+
+The LLM is simulated by a stub that streams a canned TourPlan at a fixed
+rate, so the numbers reflect the endpoint shape rather than Gemini itself.
+
+    python benchmarks/bench_stream_ttfs.py --steps 12 --chars-per-second 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from chains import tour_plan_parser
+
+PAGE = {"url": "https://example.com/bench", "title": "Bench", "elements": [{"tagName": "H1", "text": "Benchmark page", "selector": "h1"}]}
+
+
+def canned_plan(steps):
+    return json.dumps({"steps": [
+        {
+            "element_selector": f"section:nth-of-type({i + 1}) > p",
+            "narrative": f"Step {i + 1}: here we can see a paragraph describing this part of the page in some detail.",
+            "action": "scroll",
+        }
+        for i in range(steps)
+    ]}, indent=2)
+
+
+class StubModel:
+    """Emits `text` in 16-char chunks at `chars_per_second`."""
+
+    def __init__(self, text, chars_per_second):
+        self.text = text
+        self.delay = 16 / chars_per_second
+
+    async def astream(self, inputs):
+        for i in range(0, len(self.text), 16):
+            await asyncio.sleep(self.delay)
+            yield self.text[i:i + 16]
+
+    async def ainvoke(self, inputs):
+        chunks = [chunk async for chunk in self.astream(inputs)]
+        return tour_plan_parser.parse("".join(chunks))
+
+
+async def measure(path):
+    """
+    Calls the ASGI app directly and timestamps each body message, because
+    httpx's ASGITransport buffers the whole response before returning it.
+    """
+    body = json.dumps(PAGE).encode()
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "POST", "path": path, "raw_path": path.encode(),
+        "root_path": "", "scheme": "http", "query_string": b"", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"), (b"cache-control", b"no-store"),
+                    (b"content-length", str(len(body)).encode())],
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    start = time.perf_counter()
+    first = None
+
+    async def send(message):
+        nonlocal first
+        if message["type"] == "http.response.body" and message.get("body") and first is None:
+            first = time.perf_counter() - start
+
+    await main.app(scope, receive, send)
+    return first, time.perf_counter() - start
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=12)
+    parser.add_argument("--chars-per-second", type=float, default=400)
+    args = parser.parse_args()
+
+    stub = StubModel(canned_plan(args.steps), args.chars_per_second)
+    print(f"{args.steps} steps, {len(stub.text)} chars at {args.chars_per_second:.0f} chars/s\n")
+
+    with patch.object(main, "get_tour_generator_chain", lambda model=None: stub), \
+            patch.object(main, "get_tour_stream_chain", lambda model=None: stub), \
+            patch.dict(os.environ, {"GOOGLE_API_KEY": "AIza" + "x" * 35}):
+        for label, path in (("/api/analyze", "/api/analyze"), ("/api/analyze/stream", "/api/analyze/stream")):
+            first, total = asyncio.run(measure(path))
+            print(f"{label:<22} first step after {first * 1000:8.1f}ms   complete after {total * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main_cli()
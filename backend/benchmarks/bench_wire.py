@@ -0,0 +1,106 @@
+"""
+Bytes on the wire and decode time for each request format, on the corpus
+pages (captured-shape PageContent payloads).
+
+  plain:            JSON list of element objects (what older clients send)
+  gzip:             the same, Content-Encoding: gzip
+  columnar:         elements as columns (wire.encode_columnar)
+  columnar+gzip:    what the extension sends for bodies over 1 KiB
+  brotli variants:  only when the optional brotli package is installed
+
+Decode is what the server does before the handler runs: inflate the body
+(RequestDecompressionMiddleware) and validate it into PageContent. Upload
+is bytes / link speed, for a few slow uplinks. The last table does the same
+for a tour response, which CompressionMiddleware gzips on the way out.
+
+    python benchmarks/bench_wire.py [--repeat 100]
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import PageContent, TourPlan, TourStep
+from wire import RESPONSE_COMPRESSION_LEVEL, brotli, decompress, encode_columnar
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+# Uplinks in kbit/s
+LINKS = {"3G": 750, "DSL up": 1000, "4G": 5000}
+
+
+def encodings(page: dict):
+    plain = json.dumps(page, separators=(",", ":")).encode()  # as JSON.stringify sends it
+    columnar = json.dumps({**page, "elements": encode_columnar(page["elements"])}, separators=(",", ":")).encode()
+    yield "plain", plain, None
+    yield "gzip", gzip.compress(plain, RESPONSE_COMPRESSION_LEVEL), "gzip"
+    yield "columnar", columnar, None
+    yield "columnar+gzip", gzip.compress(columnar, RESPONSE_COMPRESSION_LEVEL), "gzip"
+    if brotli is not None:
+        yield "brotli", brotli.compress(plain, quality=5), "br"
+        yield "columnar+brotli", brotli.compress(columnar, quality=5), "br"
+
+
+def decode(body: bytes, coding):
+    if coding:
+        body = decompress(body, coding)
+    return PageContent.model_validate_json(body)
+
+
+def timed(fn, repeat) -> float:
+    return min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat
+
+
+def header():
+    links = "".join(f" {name + ' ms':>10}" for name in LINKS)
+    print(f"  {'format':<16} {'bytes':>9} {'ratio':>6} {'decode us':>10}{links}")
+
+
+def row(label, size, baseline, seconds):
+    links = "".join(f" {size * 8 / kbps:10.1f}" for kbps in LINKS.values())
+    decode_us = f"{seconds * 1e6:10.1f}" if seconds is not None else f"{'-':>10}"
+    print(f"  {label:<16} {size:9d} {baseline / size:5.1f}x {decode_us}{links}")
+
+
+def sample_plan(steps=15):
+    return TourPlan(steps=[
+        TourStep(element_selector=f"body > main > section:nth-of-type({i}) > p",
+                 narrative="Here we can see the next part of the page and what it is for. " * 3)
+        for i in range(steps)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+    print(f"brotli {'available' if brotli is not None else 'not installed (pip install brotli to compare)'}\n")
+
+    for path in sorted(glob.glob(os.path.join(CORPUS, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            page = json.load(f)
+        print(f"{os.path.basename(path)} ({len(page['elements'])} elements)")
+        header()
+        expected = PageContent(**page).fingerprint()
+        baseline = None
+        for label, body, coding in encodings(page):
+            assert decode(body, coding).fingerprint() == expected, label
+            baseline = baseline or len(body)
+            row(label, len(body), baseline, timed(lambda: decode(body, coding), args.repeat))
+        print()
+
+    body = sample_plan().model_dump_json().encode()
+    print("TourPlan response (15 steps)")
+    header()
+    row("plain", len(body), len(body), None)
+    row("gzip", len(gzip.compress(body, RESPONSE_COMPRESSION_LEVEL)), len(body), None)
+    if brotli is not None:
+        row("brotli", len(brotli.compress(body, quality=5)), len(body), None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Throughput of serve.py from one to N worker processes.
+
+For each worker count the server is started with the fake model and driven
+with the loadgen workload: unique tours and chat questions, so every request
+reaches the model and does its CPU work on the way (parsing, compaction,
+retrieval, prompt building, parsing the reply). The fake model answers
+quickly, so the server's CPU rather than the model is the bottleneck and
+throughput can only scale up to the machine's core count. Reports
+requests/second, latency and the speedup over one worker.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 20
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import Workload, drive, load_pages, summarize
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, state_dir: str, args) -> subprocess.Popen:
+    env = {**os.environ, "LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": str(args.ttft_ms),
+           "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second), "MAX_CONCURRENT_LLM_CALLS": "1024",
+           "ADMISSION_QUEUE_DEPTH": "4096",
+           # Longer than the slowest response, so pooled client connections are never closed under it
+           "SERVER_KEEP_ALIVE_SECONDS": "75", "SHARED_STATE_DB": os.path.join(state_dir, f"state-{workers}.db")}
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1",
+                               "--port", str(port), "--log-level", "warning"], cwd=BACKEND, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.kill()
+    raise TimeoutError("server did not start")
+
+
+async def load(url: str, args):
+    workload = Workload(load_pages(), args.chat_ratio, seed=0)
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        # Warm-up: first requests pay for connection setup and lazy imports in each worker
+        await drive(client, workload, args.concurrency, args.concurrency * 2, 30)
+        return await drive(client, workload, args.concurrency, 10 ** 9, args.duration)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--chat-ratio", type=float, default=0.5)
+    parser.add_argument("--ttft-ms", type=float, default=20)
+    parser.add_argument("--tokens-per-second", type=float, default=100000)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, concurrency {args.concurrency}, fake model TTFT {args.ttft_ms:g} ms")
+    print(f"{'workers':>7} {'rps':>8} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as state_dir:
+        for workers in args.workers:
+            port = free_port()
+            server = start_server(workers, port, state_dir, args)
+            try:
+                samples, elapsed = asyncio.run(load(f"http://127.0.0.1:{port}", args))
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+            row = summarize(samples, elapsed)["all"]
+            baseline = baseline or row["throughput_rps"]
+            print(f"{workers:7d} {row['throughput_rps']:8.1f} {row['throughput_rps'] / baseline:7.2f}x "
+                  f"{row['p50_ms']:8.1f} {row['p99_ms']:8.1f} {row['error_rate']:7.2%}")
+
+
+if __name__ == "__main__":
+    main_cli()
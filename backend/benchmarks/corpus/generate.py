@@ -0,0 +1,128 @@
+"""
+Regenerates the benchmark page corpus.
+
+Each file is a PageContent payload in exactly the shape domScanner.ts
+produces (tagName/text/id/className/selector, text capped at 300 chars,
+at most 500 elements). The pages are synthetic but reproduce the layouts
+that inflate real captures: containers whose innerText repeats their
+children, nav/footer links on every section, and long near-identical lists.
+
+    python benchmarks/corpus/generate.py
+"""
+import json
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAX_ELEMENTS = 500
+MAX_TEXT = 300
+
+WORDS = (
+    "platform team customers data secure workflow integrate analytics dashboard automate "
+    "reports growth cloud pricing support release feature onboarding account billing export "
+    "performance reliable global partners insights history mission product design developer"
+).split()
+
+
+def sentence(rng, n=14):
+    words = [rng.choice(WORDS) for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def paragraph(rng, sentences=3):
+    return " ".join(sentence(rng, rng.randint(10, 18)) for _ in range(sentences))
+
+
+def el(tag, text, selector, id_="", class_name=""):
+    return {"tagName": tag, "text": text[:MAX_TEXT], "id": id_, "className": class_name, "selector": selector}
+
+
+def nav(prefix):
+    links = ["Home", "Product overview", "Pricing and plans", "Documentation hub", "Customer stories", "Sign in to your account"]
+    return [el("A", text, f"{prefix} > a:nth-of-type({i + 1})", class_name="nav-link") for i, text in enumerate(links)]
+
+
+def landing(rng):
+    elements = nav("body > header > nav")
+    elements.append(el("H1", "Build better workflows with Acme Cloud", "#hero-title", id_="hero-title"))
+    for s in range(1, 13):
+        section = f"body > main > section:nth-of-type({s})"
+        heading = f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} for modern teams"
+        body = [paragraph(rng, 2) for _ in range(3)]
+        elements.append(el("SECTION", " ".join([heading] + body), section, class_name="section"))
+        elements.append(el("H2", heading, f"{section} > h2"))
+        for p, text in enumerate(body):
+            elements.append(el("P", text, f"{section} > p:nth-of-type({p + 1})"))
+        elements.append(el("A", "Learn more about this feature", f"{section} > a", class_name="cta"))
+        elements.append(el("BUTTON", "Start your free trial today", f"{section} > button", class_name="btn btn-primary"))
+    elements += nav("body > footer > nav")
+    return elements
+
+
+def docs(rng):
+    elements = nav("body > div > aside > nav")
+    elements.append(el("H1", "Getting started with the Acme API", "#docs-title", id_="docs-title"))
+    for a in range(1, 25):
+        article = f"body > div > main > article:nth-of-type({a})"
+        heading = f"{a}. {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} reference"
+        paragraphs = [paragraph(rng, 3) for _ in range(4)]
+        elements.append(el("ARTICLE", " ".join([heading] + paragraphs), article))
+        elements.append(el("H2", heading, f"{article} > h2"))
+        for p, text in enumerate(paragraphs):
+            elements.append(el("P", text, f"{article} > p:nth-of-type({p + 1})"))
+        elements.append(el("A", "Edit this page on GitHub", f"{article} > a.edit"))
+        elements.append(el("A", "Was this page helpful? Send feedback", f"{article} > a.feedback"))
+    return elements
+
+
+def listing(rng):
+    elements = nav("body > header > nav")
+    elements.append(el("H1", "All integrations", "#catalog", id_="catalog"))
+    categories = ["Analytics", "Billing", "Security", "Storage", "Messaging"]
+    for c, category in enumerate(categories):
+        section = f"body > main > section:nth-of-type({c + 1})"
+        elements.append(el("H2", f"{category} integrations", f"{section} > h2"))
+        for i in range(1, 60):
+            li = f"{section} > ul > li:nth-of-type({i})"
+            name = f"{category} connector {i}"
+            elements.append(el("LI", f"{name} Connect your {category.lower()} data in minutes. Install", li, class_name="card"))
+            elements.append(el("A", f"{name} Connect your {category.lower()} data in minutes.", f"{li} > a"))
+    elements += nav("body > footer > nav")
+    return elements
+
+
+def blog(rng):
+    elements = nav("body > header > nav")
+    elements.append(el("H1", "How we scaled our platform to a billion events", "#post", id_="post"))
+    elements.append(el("P", "Posted by the engineering team, 8 minute read", "body > main > p.byline"))
+    for s in range(1, 16):
+        section = f"body > main > section:nth-of-type({s})"
+        heading = f"{rng.choice(WORDS).capitalize()} and {rng.choice(WORDS)}"
+        elements.append(el("H3", heading, f"{section} > h3"))
+        for p in range(1, 6):
+            elements.append(el("P", paragraph(rng, 3), f"{section} > p:nth-of-type({p})"))
+        elements.append(el("IMG", "", f"{section} > img"))
+        elements.append(el("A", "Share this post on social media", f"{section} > a.share"))
+    elements += nav("body > footer > nav")
+    return elements
+
+
+PAGES = {
+    "landing.json": ("https://acme.example/", "Acme Cloud - Build better workflows", landing),
+    "docs.json": ("https://acme.example/docs/getting-started", "Getting started - Acme Docs", docs),
+    "listing.json": ("https://acme.example/integrations", "Integrations - Acme", listing),
+    "blog.json": ("https://acme.example/blog/scaling", "How we scaled - Acme Blog", blog),
+}
+
+
+def main():
+    for filename, (url, title, build) in PAGES.items():
+        rng = random.Random(filename)
+        page = {"url": url, "title": title, "elements": build(rng)[:MAX_ELEMENTS]}
+        with open(os.path.join(HERE, filename), "w", encoding="utf-8") as f:
+            json.dump(page, f, indent=1)
+        print(f"{filename}: {len(page['elements'])} elements")
+
+
+if __name__ == "__main__":
+    main()
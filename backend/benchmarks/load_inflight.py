@@ -0,0 +1,106 @@
+"""
+How many slow LLM calls one process can hold in flight.
+
+Drives /api/chat with a stubbed chain that sleeps for --latency seconds and
+compares it against the old blocking handler shape (a plain `def` endpoint
+running chain.invoke on Starlette's threadpool).
+
+    python benchmarks/load_inflight.py --requests 500 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from concurrency import AdmissionController
+from schemas import ChatResponse
+
+CHAT = {
+    "query": "What is this page?",
+    "content": {"url": "https://example.com", "title": "Example", "elements": [{"tagName": "H1", "text": "Example Domain"}]}
+}
+
+
+class StubChain:
+    def __init__(self, latency):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+
+    def _enter(self):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+
+    def invoke(self, inputs):
+        self._enter()
+        time.sleep(self.latency)
+        self.in_flight -= 1
+        return ChatResponse(answer="ok", suggestions=[])
+
+    async def ainvoke(self, inputs):
+        self._enter()
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+        return ChatResponse(answer="ok", suggestions=[])
+
+
+def blocking_app(chain):
+    app = FastAPI()
+
+    @app.post("/api/chat")
+    def chat(request: main.ChatRequest):
+        result = chain.invoke({"query": request.query})
+        return {"response": result.answer, "suggestions": result.suggestions}
+
+    return app
+
+
+async def drive(app, requests):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/api/chat", json={**CHAT, "query": f"Question {i}"}) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return responses, elapsed
+
+
+def report(label, chain, responses, elapsed):
+    ok = sum(r.status_code == 200 for r in responses)
+    busy = sum(r.status_code == 503 for r in responses)
+    print(f"{label:<34} peak_in_flight={chain.peak:5d}  ok={ok:5d}  503={busy:5d}  "
+          f"wall={elapsed:6.2f}s  throughput={ok / elapsed:8.1f} req/s")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--limits", type=int, nargs="*", default=[64, 256, 1024])
+    args = parser.parse_args()
+
+    print(f"{args.requests} concurrent requests, stub LLM latency {args.latency}s\n")
+
+    chain = StubChain(args.latency)
+    responses, elapsed = asyncio.run(drive(blocking_app(chain), args.requests))
+    report("sync def + chain.invoke", chain, responses, elapsed)
+
+    for limit in args.limits:
+        chain = StubChain(args.latency)
+        controller = AdmissionController(max_concurrency=limit, max_queue=args.requests, queue_timeout=60)
+        with patch.object(main, "llm_admission", controller), \
+                patch.object(main, "get_chat_chain", lambda model=None: chain), \
+                patch.dict(os.environ, {"GOOGLE_API_KEY": "AIza" + "x" * 35}):
+            responses, elapsed = asyncio.run(drive(main.app, args.requests))
+        report(f"async ainvoke, limit={limit}", chain, responses, elapsed)
+
+
+if __name__ == "__main__":
+    main_cli()
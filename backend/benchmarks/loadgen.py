@@ -0,0 +1,221 @@
+"""
+Repeatable load test for /api/analyze and /api/chat.
+
+By default the app runs in-process against the deterministic fake model
+(fake_llm.py), so runs need no API key and cost nothing. Each scenario sets the
+fake's latency and failure profile; --url points the same workload at a
+running server instead (start it with LLM_BACKEND=fake for offline runs).
+
+    python benchmarks/loadgen.py                       # every scenario
+    python benchmarks/loadgen.py --suite baseline --concurrency 128 --requests 2000
+    python benchmarks/loadgen.py --url http://localhost:8000 --suite live --json results.json
+
+Tour requests send Cache-Control: no-store and a per-request URL, and chat
+questions are unique, so the cache and request coalescing do not hide model
+latency. Closed loop: --concurrency workers each send their next request as
+soon as the previous one finishes. In-process runs give the fake model a
+quota scheduler of its own with no practical limit, so only the scenario's
+injected 429s exercise the rate-limit path, not the default Gemini quotas.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+# Fake model settings per scenario (see FakeGeminiChatModel.from_env)
+SCENARIOS: Dict[str, Dict[str, str]] = {
+    "baseline": {"FAKE_LLM_TTFT_MS": "300", "FAKE_LLM_TOKENS_PER_SECOND": "200"},
+    "slow": {"FAKE_LLM_TTFT_MS": "1200", "FAKE_LLM_TOKENS_PER_SECOND": "60"},
+    "rate_limited": {"FAKE_LLM_TTFT_MS": "300", "FAKE_LLM_TOKENS_PER_SECOND": "200", "FAKE_LLM_429_RATE": "0.2"},
+    "flaky": {"FAKE_LLM_TTFT_MS": "300", "FAKE_LLM_TOKENS_PER_SECOND": "200", "FAKE_LLM_FAILURE_RATE": "0.05"},
+    "tail_latency": {"FAKE_LLM_TTFT_MS": "300", "FAKE_LLM_TOKENS_PER_SECOND": "200", "FAKE_LLM_TAIL_RATE": "0.05", "FAKE_LLM_TAIL_MS": "4000"},
+}
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    seconds: float
+    status: int
+    fallback: bool
+
+
+@dataclass
+class Workload:
+    pages: List[dict]
+    chat_ratio: float
+    seed: int
+    _counter: int = 0
+    _rng: random.Random = field(init=False)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def next_request(self):
+        i = self._counter
+        self._counter += 1
+        page = dict(self._rng.choice(self.pages))
+        page["url"] = f"{page['url']}?load={i}"
+        if self._rng.random() < self.chat_ratio:
+            body = {"query": f"What does this page say about item {i}?", "content": page}
+            return "chat", "/api/chat", body, {}
+        return "tour", "/api/analyze", page, {"Cache-Control": "no-store"}
+
+
+def load_pages() -> List[dict]:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(CORPUS, "*.json"))):
+        with open(path) as f:
+            pages.append(json.load(f))
+    return pages
+
+
+def is_fallback(endpoint: str, response: httpx.Response) -> bool:
+    """Rate-limited answers come back as degraded 200s, key failures as 200s with a canned message."""
+    if response.headers.get("X-Degraded"):
+        return True
+    body = response.json()
+    if endpoint == "chat":
+        return "quota" in body.get("response", "").lower()
+    steps = body.get("steps", [])
+    return len(steps) == 1 and steps[0].get("action") == "none"
+
+
+async def worker(client: httpx.AsyncClient, workload: Workload, samples: List[Sample], deadline: float, remaining: list):
+    while time.perf_counter() < deadline and remaining[0] > 0:
+        remaining[0] -= 1
+        endpoint, path, body, headers = workload.next_request()
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=body, headers=headers)
+            status = response.status_code
+            fallback = status == 200 and is_fallback(endpoint, response)
+        except httpx.HTTPError:
+            status, fallback = 0, False
+        samples.append(Sample(endpoint, time.perf_counter() - start, status, fallback))
+
+
+async def drive(client: httpx.AsyncClient, workload: Workload, concurrency: int, requests: int, duration: float):
+    samples: List[Sample] = []
+    remaining = [requests]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client, workload, samples, start + duration, remaining) for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    summary = {}
+    for endpoint in ("all", "tour", "chat"):
+        group = [s for s in samples if endpoint == "all" or s.endpoint == endpoint]
+        if not group:
+            continue
+        latencies = sorted(s.seconds for s in group if s.status == 200)
+        ok = len(latencies)
+        summary[endpoint] = {
+            "requests": len(group),
+            "ok": ok,
+            "throughput_rps": round(ok / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "error_rate": round((len(group) - ok) / len(group), 4),
+            "fallback_rate": round(sum(s.fallback for s in group) / len(group), 4),
+            "status_counts": {str(code): sum(s.status == code for s in group) for code in sorted({s.status for s in group})},
+        }
+    return summary
+
+
+async def run_in_process(scenario: Dict[str, str], args, workload: Workload):
+    for key in [key for key in os.environ if key.startswith("FAKE_LLM_")]:
+        del os.environ[key]
+    os.environ.update({"LLM_BACKEND": "fake", "FAKE_LLM_SEED": str(args.seed), **scenario})
+    import concurrency
+    import main
+    import ratelimit
+    from chains import registry
+    from concurrency import AdmissionController
+    from ratelimit import QuotaScheduler
+    from sectioning import TOUR_SECTION_CONCURRENCY
+
+    # Chains are built from the environment, so rebuild them for each scenario
+    registry.clear()
+    scheduler = QuotaScheduler(quotas={}, default_quota=(10 ** 9, 10 ** 12), seed=args.seed)
+    ratelimit.quota_scheduler = main.quota_scheduler = scheduler
+    # Room for every worker's sections at once: a large-page tour waits for one slot per section
+    queue = max(args.concurrency, 1) * TOUR_SECTION_CONCURRENCY
+    # Handlers use main's controller; hedging (routing) and speculation look up concurrency's
+    main.llm_admission = concurrency.llm_admission = AdmissionController(
+        max_concurrency=args.max_llm_calls, max_queue=queue, queue_timeout=60)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadgen", timeout=None) as client:
+        return await drive(client, workload, args.concurrency, args.requests, args.duration)
+
+
+async def run_remote(args, workload: Workload):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        return await drive(client, workload, args.concurrency, args.requests, args.duration)
+
+
+def print_report(name: str, summary: dict, elapsed: float):
+    print(f"\n== {name} ({elapsed:.1f}s) ==")
+    print(f"{'endpoint':<8} {'reqs':>6} {'ok':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'fallback':>9}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<8} {row['requests']:6d} {row['ok']:6d} {row['throughput_rps']:8.1f} {row['p50_ms']:9.1f} "
+              f"{row['p95_ms']:9.1f} {row['p99_ms']:9.1f} {row['error_rate']:7.2%} {row['fallback_rate']:9.2%}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suite", nargs="*", default=list(SCENARIOS), help=f"scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000, help="stop after this many requests")
+    parser.add_argument("--duration", type=float, default=60.0, help="or after this many seconds")
+    parser.add_argument("--chat-ratio", type=float, default=0.5)
+    parser.add_argument("--max-llm-calls", type=int, default=64, help="admission limit for in-process runs")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    results = {}
+    for name in args.suite:
+        if not args.url and name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+        workload = Workload(pages, args.chat_ratio, args.seed)
+        if args.url:
+            samples, elapsed = asyncio.run(run_remote(args, workload))
+        else:
+            samples, elapsed = asyncio.run(run_in_process(SCENARIOS[name], args, workload))
+        summary = summarize(samples, elapsed)
+        print_report(name, summary, elapsed)
+        results[name] = {"config": SCENARIOS.get(name, {}), "elapsed_s": round(elapsed, 2), "results": summary}
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"concurrency": args.concurrency, "requests": args.requests, "seed": args.seed, "scenarios": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
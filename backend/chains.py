@@ -1,27 +1,36 @@
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+from google import genai
+from google.genai import types as genai_types
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from schemas import TourPlan, ChatResponse
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from metrics import LLMMetricsCallback
+from ratelimit import ScheduledModel
+from schemas import TourPlan, ChatResponse, PageDigest
 
-# 1. Chain to Generate the Tour Script
-def get_tour_generator_chain():
-    # Using gemini-pro as it is available
-    llm = ChatGoogleGenerativeAI(model="models/gemini-2.5-flash", temperature=0.7)
-    
-    parser = PydanticOutputParser(pydantic_object=TourPlan)
-    
-    template = """
+DEFAULT_MODEL = "models/gemini-2.5-flash"
+
+# Connection pool shared by every Gemini client the registry builds
+HTTP_MAX_CONNECTIONS = int(os.environ.get("GEMINI_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get("GEMINI_HTTP_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("GEMINI_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+TOUR_TEMPLATE = """
     You are an expert interactive tour guide for websites.
     Your goal is to create a voice-guided tour for a webpage based on its simplified DOM structure.
-    
+
     User Intent: {user_intent}
-    
+
     Page Context:
     Title: {page_title}
-    
+
     Visible Elements (Simplified):
     {dom_elements}
-    
+
     Instructions:
     1. Analyze the 'Visible Elements' to understand the page content flow.
     2. Create a tour script that feels like a human guide reading the most interesting parts to the user.
@@ -29,38 +38,202 @@ def get_tour_generator_chain():
     4. **Scrolling**: The tour must scroll down the page. Select elements occurring later in the list to trigger scrolling.
     5. **Narrative**: The narrative should be conversational, informative, and connect steps logically. (e.g. "Now, moving down to the history section...", "Here we can see...").
     6. Ensure the CSS selectors are accurate based on the provided JSON. Use the exact selectors provided.
-    
+
     {format_instructions}
     """
-    
-    prompt = ChatPromptTemplate.from_template(template, partial_variables={"format_instructions": parser.get_format_instructions()})
-    
-    chain = prompt | llm | parser
-    return chain
 
-# 2. Chain to Answer Questions (Chat)
-def get_chat_chain():
-    llm = ChatGoogleGenerativeAI(model="models/gemini-2.5-flash", temperature=0.5)
-    
-    parser = PydanticOutputParser(pydantic_object=ChatResponse)
-    
-    template = """
+DIGEST_TEMPLATE = """
+    You are indexing a webpage so that voice-guided tours for specific user requests can later be planned without re-reading the whole page.
+
+    Page Context:
+    Title: {page_title}
+
+    Visible Elements (Simplified):
+    {dom_elements}
+
+    Instructions:
+    1. Summarize what the page is for in one or two sentences.
+    2. Outline the page as its sections, in page order, following the headings. Summarize each section in one sentence.
+    3. For each section pick up to 4 key elements a tour might point at (headings, calls to action, forms, prices, key facts), each with its exact selector from the list above and a few words on what it shows.
+
+    {format_instructions}
+    """
+
+CHAT_TEMPLATE = """
     You are a helpful assistant viewing a webpage.
-    
+
     Page Title: {page_title}
     Content Snippets:
     {page_content}
-    
+
     User Query: {query}
-    
-    Answer the user's question based *only* on the page content provided. 
+
+    Answer the user's question based *only* on the page content provided.
     If you need to scroll to a specific section to see more, suggest it.
-    
+
     Also provide 3 relevant follow-up questions the user might want to ask next.
-    
+
     {format_instructions}
     """
-    
-    prompt = ChatPromptTemplate.from_template(template, partial_variables={"format_instructions": parser.get_format_instructions()})
+
+# -------------------------
+# Shared HTTP clients
+# -------------------------
+_client_lock = threading.Lock()
+_genai_client: Optional[genai.Client] = None
+
+def get_genai_client() -> genai.Client:
+    """
+    Returns the process-wide Gemini client. Its sync and async httpx pools are
+    shared by every chain so keep-alive connections survive across requests.
+    """
+    global _genai_client
+    if _genai_client is None:
+        with _client_lock:
+            if _genai_client is None:
+                limits = httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                )
+                http_options = genai_types.HttpOptions(
+                    httpx_client=httpx.Client(limits=limits),
+                    httpx_async_client=httpx.AsyncClient(limits=limits),
+                )
+                _genai_client = genai.Client(
+                    api_key=os.environ.get("GOOGLE_API_KEY"),
+                    http_options=http_options,
+                )
+    return _genai_client
+
+def llm_backend() -> str:
+    """"gemini" (default) or "fake" for the offline model in fake_llm.py."""
+    return os.environ.get("LLM_BACKEND", "gemini").strip().lower()
+
+def build_llm(model: str, temperature: float):
+    if llm_backend() == "fake":
+        from fake_llm import FakeGeminiChatModel
+        return FakeGeminiChatModel.from_env(model, temperature)
+
+    llm = ChatGoogleGenerativeAI(model=model, temperature=temperature)
+    # Swap in the pooled client so all models share warm connections
+    llm.client = get_genai_client()
+    return llm
+
+def build_scheduled_llm(model: str, temperature: float, priority: str) -> ScheduledModel:
+    """The model behind the quota scheduler; `priority` applies unless the caller overrides it."""
+    return ScheduledModel(build_llm(model, temperature), model, priority)
+
+# -------------------------
+# Chain registry
+# -------------------------
+ChainKey = Tuple[str, str, float]
+
+class ChainRegistry:
+    """
+    Builds each (kind, model, temperature) chain once and hands the same
+    instance to every request. LangChain runnables are stateless between
+    invocations, so a shared chain is safe under concurrent requests.
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Callable[[str, float], object]] = {}
+        self._chains: Dict[ChainKey, object] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def register(self, kind: str, builder: Callable[[str, float], object]):
+        self._builders[kind] = builder
+
+    def get(self, kind: str, model: str = DEFAULT_MODEL, temperature: float = 0.7):
+        key = (kind, model, float(temperature))
+        chain = self._chains.get(key)
+        if chain is not None:
+            self.hits += 1
+            return chain
+
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is None:
+                chain = self._builders[kind](model, temperature)
+                self._chains[key] = chain
+                self.builds += 1
+            return chain
+
+    def warm(self):
+        """Builds the default chains up front (called at app startup)."""
+        get_tour_generator_chain()
+        get_tour_stream_chain()
+        get_digest_chain()
+        get_chat_chain()
+
+    def clear(self):
+        with self._lock:
+            self._chains.clear()
+
+    def stats(self) -> dict:
+        return {"chains": len(self._chains), "builds": self.builds, "hits": self.hits}
+
+registry = ChainRegistry()
+
+# 1. Chain to Generate the Tour Script
+def build_tour_generator_chain(model: str = DEFAULT_MODEL, temperature: float = 0.7):
+    llm = build_scheduled_llm(model, temperature, "tour")
+
+    parser = PydanticOutputParser(pydantic_object=TourPlan)
+
+    prompt = ChatPromptTemplate.from_template(TOUR_TEMPLATE, partial_variables={"format_instructions": parser.get_format_instructions()})
+
     chain = prompt | llm | parser
-    return chain
+    return chain.with_config(callbacks=[LLMMetricsCallback("tour")])
+
+# 1b. Same prompt and model, but yielding raw text chunks for streaming.
+# The caller parses the accumulated text with tour_plan_parser at the end.
+tour_plan_parser = PydanticOutputParser(pydantic_object=TourPlan)
+
+def build_tour_stream_chain(model: str = DEFAULT_MODEL, temperature: float = 0.7):
+    llm = build_scheduled_llm(model, temperature, "tour")
+
+    prompt = ChatPromptTemplate.from_template(TOUR_TEMPLATE, partial_variables={"format_instructions": tour_plan_parser.get_format_instructions()})
+
+    chain = prompt | llm | StrOutputParser()
+    # The caller times its own final parse; StrOutputParser runs alongside the model
+    return chain.with_config(callbacks=[LLMMetricsCallback("tour_stream", time_parser=False)])
+
+# 1c. Page digest that intent-specific tours are planned from
+def build_digest_chain(model: str = DEFAULT_MODEL, temperature: float = 0.2):
+    llm = build_scheduled_llm(model, temperature, "tour")
+
+    parser = PydanticOutputParser(pydantic_object=PageDigest)
+
+    prompt = ChatPromptTemplate.from_template(DIGEST_TEMPLATE, partial_variables={"format_instructions": parser.get_format_instructions()})
+    chain = prompt | llm | parser
+    return chain.with_config(callbacks=[LLMMetricsCallback("digest")])
+
+# 2. Chain to Answer Questions (Chat)
+def build_chat_chain(model: str = DEFAULT_MODEL, temperature: float = 0.5):
+    llm = build_scheduled_llm(model, temperature, "chat")
+
+    parser = PydanticOutputParser(pydantic_object=ChatResponse)
+
+    prompt = ChatPromptTemplate.from_template(CHAT_TEMPLATE, partial_variables={"format_instructions": parser.get_format_instructions()})
+    chain = prompt | llm | parser
+    return chain.with_config(callbacks=[LLMMetricsCallback("chat")])
+
+registry.register("tour", build_tour_generator_chain)
+registry.register("tour_stream", build_tour_stream_chain)
+registry.register("digest", build_digest_chain)
+registry.register("chat", build_chat_chain)
+
+def get_tour_generator_chain(model: str = DEFAULT_MODEL, temperature: float = 0.7):
+    return registry.get("tour", model, temperature)
+
+def get_tour_stream_chain(model: str = DEFAULT_MODEL, temperature: float = 0.7):
+    return registry.get("tour_stream", model, temperature)
+
+def get_digest_chain(model: str = DEFAULT_MODEL, temperature: float = 0.2):
+    return registry.get("digest", model, temperature)
+
+def get_chat_chain(model: str = DEFAULT_MODEL, temperature: float = 0.5):
+    return registry.get("chat", model, temperature)
@@ -0,0 +1,309 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+
+from schemas import PageElement
+from text_utils import estimate_tokens
+
+# Prompt budget for the page elements, per model
+MODEL_TOKEN_BUDGETS: Dict[str, int] = {
+    "models/gemini-2.5-flash": int(os.environ.get("COMPACTION_BUDGET_FLASH", "6000")),
+    "models/gemini-2.5-flash-lite": int(os.environ.get("COMPACTION_BUDGET_FLASH_LITE", "4000")),
+    "models/gemini-2.5-pro": int(os.environ.get("COMPACTION_BUDGET_PRO", "12000")),
+}
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("COMPACTION_BUDGET_DEFAULT", "6000"))
+
+HEADING_TAGS = frozenset({"H1", "H2", "H3", "H4", "H5", "H6"})
+CONTAINER_TAGS = frozenset({"SECTION", "ARTICLE", "TABLE", "LI", "DIV", "MAIN", "ASIDE"})
+NEAR_DUPLICATE_THRESHOLD = 0.85
+NEAR_DUPLICATE_WINDOW = 30
+NEAR_DUPLICATE_KEEP = 2
+MIN_RESIDUAL_CHARS = 20
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_NUMBER = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(str(text).split()).lower()
+
+
+def legacy_tour_line(el: PageElement) -> str:
+    """How main.py rendered tour elements before compaction existed."""
+    return f"<{el.tagName} id='{el.id}'>{el.text}</{el.tagName}>"
+
+
+def legacy_chat_line(el: PageElement) -> str:
+    """How main.py rendered chat elements before compaction existed."""
+    return f"<{el.tagName}>{el.text}</{el.tagName}>"
+
+
+def compact_line(el: PageElement, with_selectors: bool = False) -> str:
+    """
+    `tag| text`, or `tag selector| text`, with no empty attributes or closing
+    tags. Tours need the selector to point at; chat prompts leave it out.
+    """
+    tag = el.tagName.lower()
+    text = " ".join(el.text.split())
+    if not with_selectors:
+        return f"{tag}| {text}"
+    selector = el.selector or (f"#{el.id}" if el.id else "")
+    return f"{tag} {selector}| {text}" if selector else f"{tag}| {text}"
+
+
+@dataclass
+class CompactionState:
+    elements: List[PageElement]
+    render: Callable[[PageElement], str]
+    token_budget: int
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(self.render(el)) + 1 for el in self.elements)
+
+
+@dataclass
+class CompactionResult:
+    elements: List[PageElement]
+    text: str
+    tokens_before: int
+    tokens_after: int
+    saved_by_step: Dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+# -------------------------
+# Steps
+# -------------------------
+def exact_dedup(state: CompactionState):
+    """Drops elements whose normalized text was already seen (repeated nav/footer links, etc.)."""
+    seen = set()
+    kept = []
+    for el in state.elements:
+        key = normalize_text(el.text)
+        if key and key in seen and el.tagName not in HEADING_TAGS:
+            continue
+        seen.add(key)
+        kept.append(el)
+    state.elements = kept
+
+
+def _shingles(text: str) -> frozenset:
+    words = _NON_WORD.sub(" ", text.lower()).split()
+    if len(words) < 3:
+        return frozenset(words)
+    return frozenset(zip(words, words[1:], words[2:]))
+
+
+def near_dedup(state: CompactionState):
+    """
+    Keeps at most NEAR_DUPLICATE_KEEP elements per cluster of near-identical
+    elements: same tag, the same numbers and word 3-gram Jaccard similarity
+    above NEAR_DUPLICATE_THRESHOLD with a recently kept element. Rows that
+    differ only by a number (prices, versions, dates, counts) are different
+    facts, so they are never clustered.
+    """
+    recent: List[list] = []  # [tag, numbers, shingles, kept count]
+    kept = []
+    for el in state.elements:
+        tag = el.tagName
+        numbers = _NUMBER.findall(el.text)
+        shingles = _shingles(el.text)
+        cluster = None
+        if tag not in HEADING_TAGS and shingles:
+            cluster = next((
+                entry for entry in recent
+                if entry[0] == tag and entry[1] == numbers
+                and len(shingles & entry[2]) >= NEAR_DUPLICATE_THRESHOLD * len(shingles | entry[2])
+            ), None)
+        if cluster is not None:
+            if cluster[3] >= NEAR_DUPLICATE_KEEP:
+                continue
+            cluster[3] += 1
+            kept.append(el)
+            continue
+        kept.append(el)
+        recent.append([tag, numbers, shingles, 1])
+        if len(recent) > NEAR_DUPLICATE_WINDOW:
+            recent.pop(0)
+    state.elements = kept
+
+
+def _is_descendant(parent: PageElement, child: PageElement) -> bool:
+    if parent.selector and child.selector.startswith(parent.selector + " > "):
+        return True
+    child_text = normalize_text(child.text)
+    return len(child_text) >= MIN_RESIDUAL_CHARS and child_text in normalize_text(parent.text)
+
+
+def containment_dedup(state: CompactionState):
+    """
+    Containers (SECTION, ARTICLE, LI, ...) are scanned with their whole
+    innerText, which repeats the P/H/A elements listed right after them.
+    Text that a descendant already carries is removed from the container;
+    containers left with nothing meaningful are dropped.
+    """
+    elements = state.elements
+    kept = []
+    for i, el in enumerate(elements):
+        if el.tagName not in CONTAINER_TAGS:
+            kept.append(el)
+            continue
+
+        residual = normalize_text(el.text)
+        for child in elements[i + 1:i + 1 + NEAR_DUPLICATE_WINDOW]:
+            if not _is_descendant(el, child):
+                continue
+            child_text = normalize_text(child.text)
+            if child_text in residual:
+                residual = residual.replace(child_text, " ")
+                continue
+            # The container's text is cut at 300 chars, usually mid-way through its last child
+            cut = residual.find(child_text[:MIN_RESIDUAL_CHARS])
+            if cut != -1 and child_text.startswith(residual[cut:].rstrip()):
+                residual = residual[:cut]
+        residual = " ".join(residual.split())
+
+        if len(residual) < MIN_RESIDUAL_CHARS:
+            continue
+        if residual != normalize_text(el.text):
+            el = replace(el, text=residual)
+        kept.append(el)
+    state.elements = kept
+
+
+def compact_encoding(state: CompactionState):
+    state.render = compact_line
+
+
+def with_selectors(state: CompactionState):
+    """
+    Adds each element's selector so the tour can use the exact selectors its
+    instructions ask for. This costs tokens and is reported as a negative saving.
+    """
+    state.render = lambda el: compact_line(el, with_selectors=True)
+
+
+def token_budget(state: CompactionState):
+    """
+    Trims to the model's budget. Headings are kept first so the outline of
+    the page survives; remaining room goes to other elements in document order.
+    """
+    costs = [estimate_tokens(state.render(el)) + 1 for el in state.elements]
+    if sum(costs) <= state.token_budget:
+        return
+
+    keep = set()
+    used = 0
+    for i, el in enumerate(state.elements):
+        if el.tagName in HEADING_TAGS and used + costs[i] <= state.token_budget:
+            keep.add(i)
+            used += costs[i]
+    for i in range(len(state.elements)):
+        if i not in keep and used + costs[i] <= state.token_budget:
+            keep.add(i)
+            used += costs[i]
+    state.elements = [el for i, el in enumerate(state.elements) if i in keep]
+
+
+STEPS: Dict[str, Callable[[CompactionState], None]] = {
+    "exact_dedup": exact_dedup,
+    "near_dedup": near_dedup,
+    "containment_dedup": containment_dedup,
+    "compact_encoding": compact_encoding,
+    "with_selectors": with_selectors,
+    "token_budget": token_budget,
+}
+
+
+class CompactionPipeline:
+    """
+    Runs a configurable list of steps over the scanned elements and renders
+    the prompt text. Each step's token saving is measured with the encoding in
+    effect at that point. Results are memoized per (page fingerprint, model).
+    """
+
+    def __init__(self, step_names: List[str], baseline: Callable[[PageElement], str] = legacy_tour_line,
+                 cache_size: int = 256):
+        unknown = [name for name in step_names if name not in STEPS]
+        if unknown:
+            raise ValueError(f"Unknown compaction steps: {unknown}")
+        self.step_names = step_names
+        self.baseline = baseline
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, CompactionResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.saved_by_step: Dict[str, int] = {name: 0 for name in step_names}
+
+    def run(self, elements: List[PageElement], model: Optional[str] = None, page_key: Optional[str] = None) -> CompactionResult:
+        cache_key = (page_key, model) if page_key else None
+        if cache_key is not None:
+            with self._lock:
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    self._cache.move_to_end(cache_key)
+                    return cached
+
+        start = time.perf_counter()
+        state = CompactionState(
+            elements=list(elements),
+            render=self.baseline,
+            token_budget=MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET),
+        )
+        tokens_before = tokens = state.tokens()
+        saved: Dict[str, int] = {}
+        for name in self.step_names:
+            STEPS[name](state)
+            after = state.tokens()
+            saved[name] = tokens - after
+            tokens = after
+
+        result = CompactionResult(
+            elements=state.elements,
+            text="\n".join(state.render(el) for el in state.elements),
+            tokens_before=tokens_before,
+            tokens_after=tokens,
+            saved_by_step=saved,
+            seconds=time.perf_counter() - start,
+        )
+
+        with self._lock:
+            self.runs += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens
+            for name, value in saved.items():
+                self.saved_by_step[name] += value
+            if cache_key is not None:
+                self._cache[cache_key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.step_names,
+            "runs": self.runs,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "saved_by_step": dict(self.saved_by_step),
+        }
+
+
+def _steps_from_env(name: str, default: str) -> List[str]:
+    return [step.strip() for step in os.environ.get(name, default).split(",") if step.strip()]
+
+
+# Chat keeps budgeting to the retriever, which knows the question, and keeps every
+# near-duplicate: the one answering the question may be any row of a list
+tour_compactor = CompactionPipeline(_steps_from_env(
+    "TOUR_COMPACTION_STEPS", "exact_dedup,near_dedup,containment_dedup,compact_encoding,with_selectors,token_budget"))
+chat_compactor = CompactionPipeline(_steps_from_env(
+    "CHAT_COMPACTION_STEPS", "exact_dedup,containment_dedup,compact_encoding"),
+    baseline=legacy_chat_line)
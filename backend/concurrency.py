@@ -0,0 +1,129 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import ADMISSION_WAIT_SECONDS, record_timing
+
+MAX_CONCURRENT_LLM_CALLS = int(os.environ.get("MAX_CONCURRENT_LLM_CALLS", "64"))
+ADMISSION_QUEUE_DEPTH = int(os.environ.get("ADMISSION_QUEUE_DEPTH", "256"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; surfaced to clients as a 503."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds how many LLM calls run at once. Requests over the limit wait in a
+    FIFO queue of bounded depth; a full queue or a wait longer than
+    queue_timeout rejects the request with Overloaded instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_LLM_CALLS,
+                 max_queue: int = ADMISSION_QUEUE_DEPTH,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: deque = deque()
+
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.peak_in_flight = 0
+        self._avg_hold_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained, rounded up."""
+        backlog = (self.queued + 1) / max(self.max_concurrency, 1)
+        return max(1, min(60, math.ceil(backlog * self._avg_hold_seconds)))
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now; never queues. Pair with release()."""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self._admit()
+            return True
+        return False
+
+    async def acquire(self):
+        if self.try_acquire():
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise Overloaded("admission queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            # release() may have handed us the slot just as we gave up; pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            if isinstance(exc, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                raise Overloaded("timed out waiting for capacity", self.retry_after())
+            raise
+        # The slot was transferred to us by release(), in_flight already counts it
+        self.admitted += 1
+        waited = time.perf_counter() - start
+        ADMISSION_WAIT_SECONDS.observe(waited)
+        record_timing("admission_wait", waited)
+
+    def _admit(self):
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - start
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "peak_in_flight": self.peak_in_flight,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+llm_admission = AdmissionController()
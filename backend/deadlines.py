@@ -0,0 +1,78 @@
+"""
+Per-request deadlines, and cancellation when the client goes away.
+
+A client sets its time budget in seconds with the X-Request-Timeout header;
+the server caps it at REQUEST_TIMEOUT_MAX_SECONDS and falls back to the
+priority's default deadline. Handlers install the deadline with
+ratelimit.scheduling(), so every LLM call made for the request (quota waits,
+retries and the call itself) shares it, and run their work through guard(),
+which cancels it as soon as the client disconnects or the deadline passes.
+Cancelling the work releases its admission slot on the way out.
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import Request
+
+from metrics import CANCELLED_REQUESTS
+from ratelimit import DEFAULT_DEADLINES, DeadlineExceeded
+
+T = TypeVar("T")
+
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.environ.get("REQUEST_TIMEOUT_MAX_SECONDS", "60"))
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the answer was ready."""
+
+
+def request_deadline(priority: str, timeout: Optional[str] = None) -> float:
+    """time.monotonic() deadline: the client's timeout or the priority's default, capped by the server."""
+    default = DEFAULT_DEADLINES.get(priority) or REQUEST_TIMEOUT_MAX_SECONDS
+    try:
+        seconds = float(timeout) if timeout else default
+    except ValueError:
+        seconds = default
+    if not math.isfinite(seconds) or seconds <= 0:
+        seconds = default
+    return time.monotonic() + min(seconds, REQUEST_TIMEOUT_MAX_SECONDS)
+
+
+async def wait_for_disconnect(request: Request):
+    # The body has been read already, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def guard(request: Request, work: Awaitable[T], deadline: float, endpoint: str) -> T:
+    """
+    Runs `work` as a task until it finishes, the client disconnects
+    (ClientDisconnected) or `deadline` passes (DeadlineExceeded). Either way
+    out, the task is cancelled and has finished cleaning up before this
+    returns.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if task not in done:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if task.cancelled():
+                reason = "disconnect" if watcher in done else "deadline"
+                CANCELLED_REQUESTS.labels(endpoint, reason).inc()
+                if reason == "disconnect":
+                    raise ClientDisconnected()
+                raise DeadlineExceeded()
+        # Also covers work that finished in the moment before it was cancelled
+        return task.result()
+    finally:
+        watcher.cancel()
+        task.cancel()
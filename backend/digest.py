@@ -0,0 +1,101 @@
+"""
+Two-stage tours for a specific intent ("show me pricing").
+
+Stage one asks the model once per page fingerprint for a PageDigest: a short
+summary, the section outline and a few key elements per section with their
+selectors. The digest is checked against the scanned elements, rendered to
+prompt lines and cached. Stage two plans each intent's tour from that outline
+plus the few elements that match the intent, a prompt a fraction of the size
+of the full page.
+"""
+import os
+from typing import List, Optional
+
+from compaction import compact_line
+from retrieval import page_retriever
+from schemas import PageContent, PageDigest, TourStep
+from selector_repair import ALWAYS_VALID, SelectorIndex
+from shared_state import SHARED_STATE_DB
+from text_utils import estimate_tokens
+from tour_cache import TourCache
+
+DIGEST_CACHE_MAX_ENTRIES = int(os.environ.get("DIGEST_CACHE_MAX_ENTRIES", "512"))
+DIGEST_CACHE_TTL_SECONDS = float(os.environ.get("DIGEST_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Page elements matching the intent that are sent along with the digest
+INTENT_TOP_K = int(os.environ.get("INTENT_TOUR_TOP_K", "12"))
+INTENT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("INTENT_TOUR_CONTEXT_TOKENS", "600"))
+MAX_INTENT_CHARS = 200
+MAX_KEY_ELEMENTS = 4
+
+
+def digest_cache_key(content: PageContent) -> str:
+    return f"{content.fingerprint()}:digest"
+
+
+def prepare_digest(content: PageContent, digest: PageDigest) -> dict:
+    """
+    Snaps each key element to a scanned element (dropping the ones that match
+    nothing) and renders the outline as prompt lines. Returns the cache value:
+    the checked digest plus its rendered `outline`.
+    """
+    selectors = SelectorIndex(content.fingerprint(), content.elements)
+    lines = [f"Summary: {' '.join(digest.summary.split())}", "Outline:"]
+    sections = []
+    dropped = 0
+    for number, section in enumerate(digest.sections, 1):
+        lines.append(f"section| {number}. {' '.join(section.title.split())}: {' '.join(section.summary.split())}")
+        kept = []
+        for key in section.key_elements[:MAX_KEY_ELEMENTS]:
+            step, _ = selectors.resolve(TourStep(element_selector=key.element_selector, narrative=key.description))
+            position = None if step is None else selectors.find(step.element_selector)
+            if position is None or step.element_selector in ALWAYS_VALID:
+                dropped += 1
+                continue
+            key = key.model_copy(update={"element_selector": step.element_selector})
+            kept.append(key)
+            tag = content.elements[position].tagName.lower()
+            lines.append(f"{tag} {key.element_selector}| {' '.join(key.description.split())}")
+        sections.append(section.model_copy(update={"key_elements": kept}))
+
+    checked = PageDigest(summary=digest.summary, sections=sections)
+    return {"digest": checked.model_dump(), "outline": "\n".join(lines), "dropped": dropped}
+
+
+def intent_context(content: PageContent, digest: dict, intent: str,
+                   top_k: int = INTENT_TOP_K, token_budget: int = INTENT_CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    The digest outline followed by the page elements that best match the
+    intent and are not in the outline already, best first and within
+    `token_budget`.
+    """
+    outlined = {key["element_selector"] for section in digest["digest"]["sections"] for key in section["key_elements"]}
+    # Own index key: chat and selector repair index other element lists under this fingerprint
+    matches = page_retriever.top(f"{content.fingerprint()}:intent", content.elements, intent, top_k)
+    lines: List[str] = []
+    used = 0
+    for el in matches:
+        if el.selector in outlined or (el.id and f"#{el.id}" in outlined):
+            continue
+        line = compact_line(el, with_selectors=True)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            continue
+        lines.append(line)
+        used += cost
+
+    if not lines:
+        return digest["outline"]
+    return f"{digest['outline']}\n\nElements matching the request:\n" + "\n".join(lines)
+
+
+def normalize_intent(intent: Optional[str], default: str) -> str:
+    """Collapses whitespace; an empty intent, or the default in any case, is the default."""
+    intent = " ".join((intent or "").split())
+    if not intent or intent.lower() == default.lower():
+        return default
+    return intent
+
+
+digest_cache = TourCache(max_entries=DIGEST_CACHE_MAX_ENTRIES, ttl_seconds=DIGEST_CACHE_TTL_SECONDS,
+                         db_path=os.environ.get("TOUR_CACHE_DB") or SHARED_STATE_DB, table="digests",
+                         shared=SHARED_STATE_DB is not None)
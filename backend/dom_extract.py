@@ -0,0 +1,177 @@
+"""
+Server-side version of the extension's domScanner.ts, for saved HTML.
+
+Applies the same rules: the same relevant tags in document order, text
+under 15 characters dropped (except IMG), text cut at 300 characters, the
+same nth-of-type selector path stopping at the nearest id, and at most 3000
+elements. Without a layout engine, "hidden" means a `hidden` attribute or an
+inline display:none on the element or an ancestor, and innerText is
+approximated by text content with line breaks at block boundaries.
+"""
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from schemas import PageContent, parse_elements
+
+RELEVANT_TAGS = frozenset({"h1", "h2", "h3", "p", "button", "a", "img", "li", "table", "article", "section"})
+MIN_TEXT_LENGTH = 15
+MAX_TEXT_LENGTH = 300
+MAX_ELEMENTS = 3000
+
+VOID_TAGS = frozenset({"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                       "param", "source", "track", "wbr"})
+# Content never rendered as text
+SKIP_TEXT_TAGS = frozenset({"script", "style", "noscript", "template", "head", "title"})
+BLOCK_TAGS = frozenset({"address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset",
+                        "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+                        "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "tr", "td", "th", "ul"})
+# Opening one of these closes an open <p> (HTML's implied end tags)
+CLOSES_P = frozenset({"address", "article", "aside", "blockquote", "div", "dl", "fieldset", "figure", "footer",
+                      "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol", "p",
+                      "pre", "section", "table", "ul"})
+
+_DISPLAY_NONE = re.compile(r"display\s*:\s*none", re.IGNORECASE)
+
+
+class Node:
+    __slots__ = ("tag", "attrs", "parent", "children", "text_parts", "hidden")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"]):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children: List["Node"] = []
+        # Strings and child nodes, in order
+        self.text_parts: list = []
+        self.hidden = (parent is not None and parent.hidden) or "hidden" in attrs \
+            or bool(_DISPLAY_NONE.search(attrs.get("style", "")))
+
+    def inner_text(self) -> str:
+        parts: List[str] = []
+        self._collect(parts)
+        lines = (" ".join(line.split()) for line in "".join(parts).split("\n"))
+        return "\n".join(line for line in lines if line)
+
+    def _collect(self, parts: List[str]):
+        for part in self.text_parts:
+            if isinstance(part, str):
+                parts.append(part)
+            elif not part.hidden and part.tag not in SKIP_TEXT_TAGS:
+                block = part.tag in BLOCK_TAGS
+                if block:
+                    parts.append("\n")
+                part._collect(parts)
+                if block:
+                    parts.append("\n")
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document", {}, None)
+        self.stack: List[Node] = [self.root]
+        self.order: List[Node] = []
+        self.title = ""
+        self._in_title = False
+
+    def _close(self, tag: str):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_starttag(self, tag, attrs):
+        if tag in CLOSES_P and any(node.tag == "p" for node in self.stack[-3:]):
+            self._close("p")
+        if tag == "li" and self.stack[-1].tag == "li":
+            self._close("li")
+        parent = self.stack[-1]
+        node = Node(tag, {name: value or "" for name, value in attrs}, parent)
+        parent.children.append(node)
+        parent.text_parts.append(node)
+        self.order.append(node)
+        if tag == "title":
+            self._in_title = True
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag not in VOID_TAGS:
+            self._close(tag)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        self.stack[-1].text_parts.append(data)
+
+
+def selector_for(node: Node) -> str:
+    """Same path as getSelector() in domScanner.ts."""
+    if node.attrs.get("id"):
+        return f"#{node.attrs['id']}"
+    path = []
+    while node is not None and node.tag != "#document":
+        selector = node.tag
+        if node.attrs.get("id"):
+            path.insert(0, f"{selector}#{node.attrs['id']}")
+            break
+        siblings = node.parent.children
+        nth = sum(1 for sib in siblings[:siblings.index(node)] if sib.tag == node.tag) + 1
+        if nth != 1:
+            selector += f":nth-of-type({nth})"
+        path.insert(0, selector)
+        node = node.parent
+    return " > ".join(path)
+
+
+def _parse(html: str) -> _TreeBuilder:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder
+
+
+def extract_elements(html: str) -> List[dict]:
+    return _scan(_parse(html))
+
+
+def _scan(builder: _TreeBuilder) -> List[dict]:
+    elements = []
+    for node in builder.order:
+        if node.tag not in RELEVANT_TAGS or node.hidden:
+            continue
+        text = "" if node.tag == "img" else node.inner_text().strip()
+        if node.tag != "img" and len(text) < MIN_TEXT_LENGTH:
+            continue
+        elements.append({
+            "tagName": node.tag.upper(),
+            "text": text[:MAX_TEXT_LENGTH],
+            "id": node.attrs.get("id", ""),
+            "className": node.attrs.get("class", ""),
+            "selector": selector_for(node),
+        })
+    return elements[:MAX_ELEMENTS]
+
+
+def page_url(html: str) -> Optional[str]:
+    """The page's canonical URL if the snapshot records one."""
+    match = re.search(r"<link[^>]+rel=[\"']canonical[\"'][^>]*>", html, re.IGNORECASE) \
+        or re.search(r"<meta[^>]+property=[\"']og:url[\"'][^>]*>", html, re.IGNORECASE)
+    if not match:
+        return None
+    value = re.search(r"(?:href|content)=[\"']([^\"']+)[\"']", match.group(0), re.IGNORECASE)
+    return value.group(1) if value else None
+
+
+def page_from_html(html: str, url: Optional[str] = None) -> PageContent:
+    builder = _parse(html)
+    return PageContent(url=url or page_url(html) or "", title=" ".join(builder.title.split()),
+                       elements=parse_elements(_scan(builder)))
@@ -0,0 +1,234 @@
+"""
+Deterministic stand-in for ChatGoogleGenerativeAI, for offline tests and load
+benchmarks. Select it with LLM_BACKEND=fake; chains.build_llm then returns
+this model instead of Gemini, so prompts, parsers and endpoints run for real.
+
+Latency is modelled as time-to-first-token plus output tokens at a fixed
+rate. Failures are injected from a seeded RNG: "429" errors carry the same
+text as Gemini quota errors so they take the real fallback paths.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field, PrivateAttr
+
+from text_utils import estimate_tokens
+
+# `tag selector| text` lines from the compacted tour prompt's element section
+_ELEMENT_SECTION = re.compile(r"Visible Elements.*?\n(.*?)\n\s*Instructions:", re.DOTALL)
+_ELEMENT_LINE = re.compile(r"^\s*(\w+) (\S[^|]*)\| (.*)$", re.MULTILINE)
+_QUERY = re.compile(r"User Query: (.*)")
+# Step limit stated in the intent of section tours
+_MAX_STEPS = re.compile(r"at most (\d+) steps")
+# Field name that only the page digest's format instructions contain
+_DIGEST_FIELD = "key_elements"
+_SECTION_HEADINGS = ("h1", "h2", "h3")
+
+CHUNK_TOKENS = 4
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the google-genai 429 error text."""
+
+
+class FakeGeminiChatModel(BaseChatModel):
+    model: str = "fake-gemini"
+    temperature: float = 0.7
+    ttft_seconds: float = 0.3
+    tokens_per_second: float = 200.0
+    failure_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    # Share of calls that take tail_seconds longer, for hedging experiments
+    tail_rate: float = 0.0
+    tail_seconds: float = 0.0
+    # Prompt processing speed; 0 leaves the time to first token independent of prompt size
+    prefill_tokens_per_second: float = 0.0
+    seed: int = 0
+    # Usage deltas on every streamed chunk, as langchain-google-genai reports them, instead of once at the end
+    usage_per_chunk: bool = False
+    max_tour_steps: int = 6
+    # Responses to return verbatim instead of the generated canned JSON
+    responses: Optional[List[str]] = Field(default=None)
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _calls: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context: Any):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    @classmethod
+    def from_env(cls, model: str, temperature: float) -> "FakeGeminiChatModel":
+        return cls(
+            model=model,
+            temperature=temperature,
+            ttft_seconds=float(os.environ.get("FAKE_LLM_TTFT_MS", "300")) / 1000,
+            tokens_per_second=float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND", "200")),
+            failure_rate=float(os.environ.get("FAKE_LLM_FAILURE_RATE", "0")),
+            rate_limit_rate=float(os.environ.get("FAKE_LLM_429_RATE", "0")),
+            tail_rate=float(os.environ.get("FAKE_LLM_TAIL_RATE", "0")),
+            tail_seconds=float(os.environ.get("FAKE_LLM_TAIL_MS", "0")) / 1000,
+            prefill_tokens_per_second=float(os.environ.get("FAKE_LLM_PREFILL_TOKENS_PER_SECOND", "0")),
+            seed=int(os.environ.get("FAKE_LLM_SEED", "0")),
+            usage_per_chunk=os.environ.get("FAKE_LLM_USAGE_PER_CHUNK", "false").lower() == "true",
+        )
+
+    # -------------------------
+    # Canned output
+    # -------------------------
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        """Picks the outcome for one call; raises for injected failures."""
+        with self._lock:
+            roll = self._rng.random()
+            call = self._calls
+            self._calls += 1
+
+        if roll < self.rate_limit_rate:
+            raise FakeRateLimitError("429 RESOURCE_EXHAUSTED. You exceeded your current quota (fake).")
+        if roll < self.rate_limit_rate + self.failure_rate:
+            raise RuntimeError("500 INTERNAL. Fake model failure.")
+
+        if self.responses:
+            return self.responses[call % len(self.responses)]
+
+        prompt = "\n".join(str(m.content) for m in messages)
+        query = _QUERY.search(prompt)
+        if query:
+            return self._chat_json(query.group(1).strip())
+        if _DIGEST_FIELD in prompt:
+            return self._digest_json(prompt)
+        return self._tour_json(prompt)
+
+    def _first_token_delay(self, messages: List[BaseMessage]) -> float:
+        with self._lock:
+            tail = self._rng.random() < self.tail_rate
+        prefill = 0.0
+        if self.prefill_tokens_per_second:
+            prefill = sum(estimate_tokens(str(m.content)) for m in messages) / self.prefill_tokens_per_second
+        return self.ttft_seconds + prefill + (self.tail_seconds if tail else 0.0)
+
+    def _tour_json(self, prompt: str) -> str:
+        section = _ELEMENT_SECTION.search(prompt)
+        elements = _ELEMENT_LINE.findall(section.group(1)) if section else []
+        if not elements:
+            elements = [("body", "body", "this page")]
+        limit = _MAX_STEPS.search(prompt)
+        max_steps = min(self.max_tour_steps, int(limit.group(1))) if limit else self.max_tour_steps
+        stride = max(1, len(elements) // max_steps)
+        steps = [
+            {
+                "element_selector": selector.strip(),
+                "narrative": f"Here we can see the {tag.lower()} that says: {text[:120]}",
+                "action": "scroll",
+            }
+            for tag, selector, text in elements[::stride][:max_steps]
+        ]
+        return json.dumps({"steps": steps}, indent=2)
+
+    def _digest_json(self, prompt: str) -> str:
+        """One section per h1-h3 in the element list, keyed by its heading and first few elements."""
+        section = _ELEMENT_SECTION.search(prompt)
+        sections = []
+        for tag, selector, text in _ELEMENT_LINE.findall(section.group(1)) if section else []:
+            if tag.lower() in _SECTION_HEADINGS or not sections:
+                sections.append({"title": text[:60], "summary": f"This part of the page is about {text[:80]}",
+                                 "key_elements": []})
+            if len(sections[-1]["key_elements"]) < 3:
+                sections[-1]["key_elements"].append({"element_selector": selector.strip(), "description": text[:60]})
+        return json.dumps({"summary": "A page with several sections.", "sections": sections[:12]}, indent=2)
+
+    @staticmethod
+    def _chat_json(query: str) -> str:
+        return json.dumps({
+            "answer": f"Based on the page content, here is what I found about: {query}",
+            "suggestions": ["What else is on this page?", "Summarize the page", "Where is the pricing?"],
+        }, indent=2)
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> dict:
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _stream_usage(self, messages: List[BaseMessage], text: str, chunks: List[str]) -> List[Optional[dict]]:
+        """usage_metadata for each streamed chunk plus the final empty one; the totals add up to _usage."""
+        total = self._usage(messages, text)
+        if not self.usage_per_chunk:
+            return [None] * len(chunks) + [total]
+        usages = []
+        for i, chunk in enumerate(chunks):
+            input_tokens = total["input_tokens"] if i == 0 else 0
+            output_tokens = estimate_tokens(chunk)
+            usages.append({"input_tokens": input_tokens, "output_tokens": output_tokens,
+                           "total_tokens": input_tokens + output_tokens})
+        # Rounding per chunk: the last delta brings the sum to the real total
+        output_sent = sum(u["output_tokens"] for u in usages)
+        rest = total["output_tokens"] - output_sent
+        usages.append({"input_tokens": 0 if chunks else total["input_tokens"], "output_tokens": rest,
+                       "total_tokens": rest + (0 if chunks else total["input_tokens"])})
+        return usages
+
+    def _chunks(self, text: str) -> List[str]:
+        size = CHUNK_TOKENS * 4
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _chunk_delay(self) -> float:
+        return CHUNK_TOKENS / self.tokens_per_second
+
+    # -------------------------
+    # BaseChatModel hooks
+    # -------------------------
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._first_token_delay(messages))
+        text = self._respond(messages)
+        time.sleep(len(self._chunks(text)) * self._chunk_delay())
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text),
+                            response_metadata={"model_name": self.model})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._first_token_delay(messages))
+        text = self._respond(messages)
+        await asyncio.sleep(len(self._chunks(text)) * self._chunk_delay())
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text),
+                            response_metadata={"model_name": self.model})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._first_token_delay(messages))
+        text = self._respond(messages)
+        chunks = self._chunks(text)
+        usages = self._stream_usage(messages, text, chunks)
+        for chunk, usage in zip(chunks, usages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))
+            time.sleep(self._chunk_delay())
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usages[-1],
+                                                                response_metadata={"model_name": self.model}))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_token_delay(messages))
+        text = self._respond(messages)
+        chunks = self._chunks(text)
+        usages = self._stream_usage(messages, text, chunks)
+        for chunk, usage in zip(chunks, usages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage))
+            await asyncio.sleep(self._chunk_delay())
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=usages[-1],
+                                                                response_metadata={"model_name": self.model}))
@@ -5,15 +5,40 @@
 from dotenv import load_dotenv
 load_dotenv()  # MUST be first
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import json
 import traceback
 import sys
 import asyncio
-
-from chains import get_tour_generator_chain, get_chat_chain
-from schemas import PageContent, ChatRequest
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from chains import (DEFAULT_MODEL, llm_backend, get_tour_generator_chain, get_tour_stream_chain, get_digest_chain, get_chat_chain,
+                    registry, tour_plan_parser)
+from concurrency import Overloaded, llm_admission
+from deadlines import REQUEST_TIMEOUT_HEADER, ClientDisconnected, guard, request_deadline
+from langchain_core.exceptions import OutputParserException
+from ratelimit import DeadlineExceeded, RateLimited, quota_scheduler, scheduling
+from routing import RouteDecision, model_router
+from text_utils import estimate_tokens, normalize_query
+from metrics import CANCELLED_REQUESTS, ERRORS, REGISTRY, TOUR_SECTIONS, MetricsMiddleware, record_request_parse, stage
+from answer_cache import answer_cache
+from schemas import PageContent, ChatRequest, ChatReply, ChatResponse, PageDigest, TourPlan, PageDelta, PageSessionInfo
+from sessions import PageNotFound, page_sessions
+from singleflight import inflight
+from speculation import speculator
+from compaction import chat_compactor, compact_line, tour_compactor
+from digest import MAX_INTENT_CHARS, digest_cache, digest_cache_key, intent_context, normalize_intent, prepare_digest
+from retrieval import page_retriever
+from sectioning import (TOUR_SECTION_CONCURRENCY, Section, TourMerger, is_large_page, section_intent,
+                        split_sections, steps_per_section)
+from selector_repair import RepairReport, SelectorIndex, selector_repairer
+from streaming import TourStepStreamParser
+from tour_cache import tour_cache, tour_cache_key
+from wire import CompressionMiddleware, RequestDecompressionMiddleware
 
 # -------------------------
 # Windows asyncio fix
@@ -24,8 +49,18 @@ if sys.platform == "win32":
 # -------------------------
 # App setup
 # -------------------------
-app = FastAPI()
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build chains (and their pooled HTTP clients) once, before the first request
+    if llm_available():
+        registry.warm()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# Inside CORS, so its 4xx replies (unsupported or corrupt bodies) still carry CORS headers
+app.add_middleware(RequestDecompressionMiddleware)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # OK for local extension dev
@@ -33,6 +68,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+ENDPOINT_NAMES = {"/api/analyze": "tour", "/api/analyze/stream": "tour_stream", "/api/chat": "chat"}
+
+def error_class(e: Exception) -> str:
+    if isinstance(e, Overloaded):
+        return "overloaded"
+    if isinstance(e, RateLimited):
+        return "rate_limited"
+    if isinstance(e, DeadlineExceeded):
+        return "deadline_exceeded"
+    if isinstance(e, OutputParserException):
+        return "parse_failure"
+    msg = str(e).lower()
+    if "quota" in msg or "429" in msg:
+        return "quota"
+    if "api key not valid" in msg:
+        return "invalid_key"
+    return "other"
+
+def count_error(endpoint: str, e: Exception):
+    ERRORS.labels(endpoint, error_class(e)).inc()
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    count_error(ENDPOINT_NAMES.get(request.url.path, "other"), exc)
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy: {exc.reason}"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    count_error(ENDPOINT_NAMES.get(request.url.path, "other"), exc)
+    return JSONResponse(status_code=504, content={"detail": f"Deadline exceeded: {exc.reason}"})
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is left to read it; 499 is the status proxies log for a client that closed the request
+    return Response(status_code=499)
+
+@app.exception_handler(PageNotFound)
+async def page_not_found_handler(request: Request, exc: PageNotFound):
+    return JSONResponse(status_code=404, content={"detail": "Unknown or expired page_id, register the page again"})
 
 # -------------------------
 # Strong API key guard
@@ -62,6 +142,12 @@ def is_valid_google_api_key() -> bool:
 
     return True
 
+def llm_available() -> bool:
+    """True when requests should reach a model: a valid key, or the offline fake backend."""
+    if os.environ.get("USE_MOCK_AI", "").lower() == "true":
+        return False
+    return llm_backend() == "fake" or is_valid_google_api_key()
+
 # -------------------------
 # Root health check
 # -------------------------
@@ -69,83 +155,566 @@ def is_valid_google_api_key() -> bool:
 def read_root():
     return {
         "status": "running",
+        "worker_pid": os.getpid(),
         "has_valid_google_key": is_valid_google_api_key(),
-        "mock_mode": os.environ.get("USE_MOCK_AI", "false").lower() == "true"
+        "llm_backend": llm_backend(),
+        "mock_mode": os.environ.get("USE_MOCK_AI", "false").lower() == "true",
+        "tour_cache": tour_cache.stats(),
+        "digest_cache": digest_cache.stats(),
+        "admission": llm_admission.stats(),
+        "retrieval": page_retriever.stats(),
+        "page_sessions": page_sessions.stats(),
+        "compaction": {"tour": tour_compactor.stats(), "chat": chat_compactor.stats()},
+        "coalescing": inflight.stats(),
+        "quota": quota_scheduler.stats(),
+        "routing": model_router.stats(),
+        "selector_repair": selector_repairer.stats(),
+        "speculation": speculator.stats(),
+        "answer_cache": answer_cache.stats()
     }
 
+# -------------------------
+# Prometheus metrics
+# -------------------------
+REGISTRY.register_stats("tour_cache", tour_cache.stats)
+REGISTRY.register_stats("digest_cache", digest_cache.stats)
+REGISTRY.register_stats("admission", llm_admission.stats)
+REGISTRY.register_stats("retrieval", page_retriever.stats)
+REGISTRY.register_stats("page_sessions", page_sessions.stats)
+REGISTRY.register_stats("compaction_tour", tour_compactor.stats)
+REGISTRY.register_stats("compaction_chat", chat_compactor.stats)
+REGISTRY.register_stats("coalescing", inflight.stats)
+REGISTRY.register_stats("chains", registry.stats)
+REGISTRY.register_stats("quota", quota_scheduler.stats)
+REGISTRY.register_stats("routing", model_router.stats)
+REGISTRY.register_stats("selector_repair", selector_repairer.stats)
+REGISTRY.register_stats("speculation", speculator.stats)
+REGISTRY.register_stats("answer_cache", answer_cache.stats)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# -------------------------
+# Page sessions
+# -------------------------
+def session_info(page_id: str, content: PageContent) -> PageSessionInfo:
+    return PageSessionInfo(
+        page_id=page_id,
+        fingerprint=content.fingerprint(),
+        element_count=len(content.elements),
+        expires_in=page_sessions.idle_seconds,
+    )
+
+def resolve_page(content: Optional[PageContent], page_id: Optional[str]) -> PageContent:
+    """The full payload wins when both are sent, so old clients are unaffected."""
+    if content is not None:
+        return content
+    if page_id is None:
+        raise HTTPException(status_code=422, detail="Either a page body or page_id is required")
+    return page_sessions.get(page_id)
+
+@app.post("/api/pages", status_code=201)
+def register_page(content: PageContent) -> PageSessionInfo:
+    return session_info(page_sessions.create(content), content)
+
+@app.patch("/api/pages/{page_id}")
+def update_page(page_id: str, delta: PageDelta) -> PageSessionInfo:
+    return session_info(page_id, page_sessions.update(page_id, delta))
+
+@app.delete("/api/pages/{page_id}")
+def delete_page(page_id: str):
+    if page_sessions.delete(page_id) is None:
+        raise PageNotFound(page_id)
+    return {"ok": True}
+
 # -------------------------
 # Analyze page (tour)
 # -------------------------
-@app.post("/api/analyze")
-def analyze_page(content: PageContent):
-    if not is_valid_google_api_key():
-        print("⚠️ Using MOCK tour (invalid or missing API key)")
+TOUR_INTENT = "Give me a general tour"
+DEGRADED_TOUR_STEPS = 6
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def mock_tour(content: PageContent) -> dict:
+    return {
+        "steps": [
+            {
+                "element_selector": "h1, h2",
+                "narrative": f"Welcome to {content.title}. This is a mock tour step.",
+                "action": "scroll"
+            },
+            {
+                "element_selector": "p, article",
+                "narrative": "This page contains the main content.",
+                "action": "highlight"
+            },
+            {
+                "element_selector": "button, a",
+                "narrative": "These are interactive elements on the page.",
+                "action": "click"
+            }
+        ]
+    }
+
+def tour_error_fallback(e: Exception, endpoint: str = "tour") -> dict:
+    """Maps known Gemini failures to a single-step tour, anything else to a 500."""
+    traceback.print_exc()
+    count_error(endpoint, e)
+    msg = str(e).lower()
+
+    if "quota" in msg or "429" in msg:
         return {
-            "steps": [
-                {
-                    "element_selector": "h1, h2",
-                    "narrative": f"Welcome to {content.title}. This is a mock tour step.",
-                    "action": "scroll"
-                },
-                {
-                    "element_selector": "p, article",
-                    "narrative": "This page contains the main content.",
-                    "action": "highlight"
-                },
-                {
-                    "element_selector": "button, a",
-                    "narrative": "These are interactive elements on the page.",
-                    "action": "click"
-                }
-            ]
+            "steps": [{
+                "element_selector": "body",
+                "narrative": "⚠️ AI quota exceeded. Please try again later.",
+                "action": "none"
+            }]
         }
 
+    if "api key not valid" in msg:
+        return {
+            "steps": [{
+                "element_selector": "body",
+                "narrative": "❌ Invalid Google API key.",
+                "action": "none"
+            }]
+        }
+
+    raise HTTPException(status_code=500, detail=str(e))
+
+def degraded_tour(content: PageContent, cache_key: Optional[str] = None) -> dict:
+    """
+    Served when Gemini quota would not free up before the deadline: a tour
+    another request has cached in the meantime, else an outline of the
+    page's headings built without the model.
+    """
+    if cache_key is not None:
+        cached = tour_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    headings = [el for el in content.elements if el.tagName in ("H1", "H2", "H3") and el.text.strip()][:DEGRADED_TOUR_STEPS]
+    steps = [{
+        "element_selector": el.selector or (f"#{el.id}" if el.id else el.tagName.lower()),
+        "narrative": f"Next up: {' '.join(el.text.split())}.",
+        "action": "scroll"
+    } for el in headings]
+    intro = "The AI guide is busy right now, so here is a quick outline of the page."
+    if steps:
+        steps[0]["narrative"] = f"{intro} {steps[0]['narrative']}"
+    else:
+        steps = [{"element_selector": "body", "narrative": intro, "action": "none"}]
+    return {"steps": steps}
+
+def tour_inputs(content: PageContent, model: str = DEFAULT_MODEL, endpoint: str = "tour") -> dict:
+    with stage(endpoint, "compaction"):
+        compacted = tour_compactor.run(content.elements, model, content.fingerprint())
+    return {
+        "user_intent": TOUR_INTENT,
+        "page_title": content.title,
+        "dom_elements": compacted.text
+    }
+
+def route_tour(content: PageContent, endpoint: str) -> RouteDecision:
+    """Routes on the size of the compacted prompt; compaction is memoized per page and model."""
+    with stage(endpoint, "compaction"):
+        compacted = tour_compactor.run(content.elements, DEFAULT_MODEL, content.fingerprint())
+    return model_router.route(endpoint, compacted.tokens_after)
+
+def tour_prompt(content: PageContent, intent: str, endpoint: str) -> Tuple[RouteDecision, Callable[[str], dict]]:
+    """
+    Model choice and prompt inputs (per model) for a single-prompt tour: the
+    compacted page for the general tour, the cached page digest plus the
+    elements matching the intent for any other intent (the compacted page
+    again until that digest exists).
+    """
+    if intent == TOUR_INTENT:
+        return route_tour(content, endpoint), lambda model: tour_inputs(content, model, endpoint)
+
+    digest = cached_digest(content, endpoint)
+    if digest is None:
+        # First intent on this page: answered from the whole page while the digest is built
+        return route_tour(content, endpoint), lambda model: {**tour_inputs(content, model, endpoint), "user_intent": intent}
+    with stage(endpoint, "retrieval"):
+        elements = intent_context(content, digest, intent)
+    inputs = {"user_intent": intent, "page_title": content.title, "dom_elements": elements}
+    return model_router.route(endpoint, estimate_tokens(elements)), lambda model: inputs
+
+# -------------------------
+# Page digest for intent tours, one per page
+# -------------------------
+async def build_digest(content: PageContent, key: str, endpoint: str) -> dict:
+    with stage(endpoint, "compaction"):
+        compacted = tour_compactor.run(content.elements, DEFAULT_MODEL, content.fingerprint())
+    # Not in the router's fast-model limits, so digests always go to the strong model
+    decision = model_router.route("digest", compacted.tokens_after)
+
+    async def run(model: str):
+        with stage(endpoint, "compaction"):
+            page = tour_compactor.run(content.elements, model, content.fingerprint())
+        return await get_digest_chain(model).ainvoke({"page_title": content.title, "dom_elements": page.text})
+
+    result = await model_router.call("digest", decision, run)
+    digest = result if isinstance(result, PageDigest) else PageDigest.model_validate(result)
+    with stage(endpoint, "selector_repair"):
+        value = prepare_digest(content, digest)
+    digest_cache.set(key, value)
+    return value
+
+# Digest builds running off the request path, referenced until they finish
+digest_builds = set()
+
+async def background_digest(content: PageContent, key: str, endpoint: str):
     try:
-        chain = get_tour_generator_chain()
+        with scheduling(priority="prewarm"):
+            # Several intents asked for at once on a new page share one digest call
+            await inflight.do(("digest", key), lambda: build_digest(content, key, endpoint))
+    except Exception as e:
+        count_error("digest", e)
+
+def cached_digest(content: PageContent, endpoint: str) -> Optional[dict]:
+    """The page's digest, or None after starting to build it in the background."""
+    key = digest_cache_key(content)
+    with stage(endpoint, "cache_lookup"):
+        cached = digest_cache.get(key)
+    if cached is None:
+        task = asyncio.ensure_future(background_digest(content, key, endpoint))
+        digest_builds.add(task)
+        task.add_done_callback(digest_builds.discard)
+    return cached
 
-        dom_text = "\n".join(
-            f"<{el.tagName} id='{el.id}'>{el.text}</{el.tagName}>"
-            for el in content.to_dom_elements()
-        )
+# -------------------------
+# Large pages: one tour generation per section
+# -------------------------
+async def generate_section(content: PageContent, section: Section, count: int, steps: int,
+                           endpoint: str, report: RepairReport, limit: asyncio.Semaphore) -> List:
+    section_key = f"{content.fingerprint()}:section{section.index}:{count}"
 
-        result = chain.invoke({
-            "user_intent": "Give me a general tour",
+    def inputs(model: str) -> dict:
+        with stage(endpoint, "compaction"):
+            compacted = tour_compactor.run(section.elements, model, section_key)
+        return {
+            "user_intent": section_intent(TOUR_INTENT, section, count, steps),
             "page_title": content.title,
-            "dom_elements": dom_text
-        })
+            "dom_elements": compacted.text
+        }
+
+    async def run(model: str):
+        return await get_tour_generator_chain(model).ainvoke(inputs(model))
+
+    with stage(endpoint, "compaction"):
+        prompt_tokens = tour_compactor.run(section.elements, DEFAULT_MODEL, section_key).tokens_after
+    decision = model_router.route(endpoint, prompt_tokens)
+    async with limit, llm_admission.slot():
+        result = await model_router.call(endpoint, decision, run)
+
+    plan = result if isinstance(result, TourPlan) else TourPlan.model_validate(result)
+    selectors = SelectorIndex(section_key, section.elements)
+    with stage(endpoint, "selector_repair"):
+        return [step for step in (selector_repairer.repair_step(selectors, step, report) for step in plan.steps)
+                if step is not None]
+
+async def sectioned_tour(content: PageContent, endpoint: str, report: RepairReport,
+                         errors: Optional[list] = None) -> AsyncIterator:
+    """
+    Tours a large page section by section: every section is generated in
+    parallel (up to TOUR_SECTION_CONCURRENCY per request) and merged in page
+    order as soon as it and the sections before it are done. Failed sections
+    are left out and their errors appended to `errors`; the first error is
+    raised only when no section succeeded. Each section takes an admission
+    slot of its own while its model call runs.
+    """
+    sections = split_sections(content.elements, content.title)
+    steps = steps_per_section(len(sections))
+    merger = TourMerger(content.elements, steps)
+    limit = asyncio.Semaphore(TOUR_SECTION_CONCURRENCY)
+    tasks = [asyncio.ensure_future(generate_section(content, section, len(sections), steps, endpoint, report, limit))
+             for section in sections]
+    errors = [] if errors is None else errors
+    try:
+        for section, task in zip(sections, tasks):
+            try:
+                section_steps = await task
+            except Exception as e:
+                errors.append(e)
+                TOUR_SECTIONS.labels(endpoint, "failed").inc()
+                continue
+            TOUR_SECTIONS.labels(endpoint, "ok").inc()
+            with stage(endpoint, "merge"):
+                merged = merger.add(section, section_steps)
+            for step in merged:
+                yield step
+        if errors and not merger.steps:
+            raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def tour_cache_lookup(content: PageContent, cache_control: Optional[str], intent: str = TOUR_INTENT):
+    """
+    Cache-Control: no-cache -> regenerate and overwrite, no-store -> skip the cache entirely.
+    Returns (cache_key or None, cached plan or None, X-Cache status).
+    """
+    cache_directives = (cache_control or "").lower()
+    if "no-store" in cache_directives:
+        return None, None, "BYPASS"
+
+    cache_key = tour_cache_key(content, intent)
+    if "no-cache" not in cache_directives:
+        cached = tour_cache.get(cache_key)
+        if cached is not None:
+            return cache_key, cached, "HIT"
+    return cache_key, None, "MISS"
+
+async def generate_tour(content: PageContent, cache_key: Optional[str], intent: str = TOUR_INTENT):
+    if intent == TOUR_INTENT and is_large_page(content.elements):
+        report, errors = RepairReport(), []
+        plan = TourPlan(steps=[step async for step in sectioned_tour(content, "tour", report, errors)])
+        selector_repairer.record(report)
+        if errors:
+            # A tour missing sections is served once but not cached
+            cache_key = None
+    else:
+        async with llm_admission.slot():
+            decision, inputs = tour_prompt(content, intent, "tour")
+
+            async def run(model: str):
+                return await get_tour_generator_chain(model).ainvoke(inputs(model))
+
+            result = await model_router.call("tour", decision, run)
+
+        # Check every selector against the scanned elements before anything is cached
+        plan = result if isinstance(result, TourPlan) else TourPlan.model_validate(result)
+        with stage("tour", "selector_repair"):
+            plan, report = selector_repairer.repair(SelectorIndex(content.fingerprint(), content.elements), plan)
+
+    if cache_key is not None:
+        tour_cache.set(cache_key, plan.model_dump())
+
+    return plan, report
+
+# A response model lets FastAPI serialize straight to JSON bytes through pydantic-core
+@app.post("/api/analyze", response_model=TourPlan)
+async def analyze_page(request: Request, response: Response, content: Optional[PageContent] = None, page_id: Optional[str] = None,
+                       intent: Optional[str] = Query(None, max_length=MAX_INTENT_CHARS),
+                       cache_control: Optional[str] = Header(None)):
+    record_request_parse("tour")
+    content = resolve_page(content, page_id)
+    intent = normalize_intent(intent, TOUR_INTENT)
+    if not llm_available():
+        print("⚠️ Using MOCK tour (invalid or missing API key)")
+        return mock_tour(content)
 
-        return result
+    with stage("tour", "cache_lookup"):
+        cache_key, cached, cache_status = tour_cache_lookup(content, cache_control, intent)
+    response.headers["X-Cache"] = cache_status
+    if cached is not None:
+        # Cached plans were repaired when they were generated
+        response.headers["X-Tour-Repaired-Steps"] = "0"
+        return cached
+
+    deadline = request_deadline("tour", request.headers.get(REQUEST_TIMEOUT_HEADER))
+    try:
+        # Identical concurrent requests share one LLM call, cancelled once none of them is waiting
+        flight_key = ("tour", cache_key or tour_cache_key(content, intent))
+        with scheduling(deadline=deadline):
+            plan, report = await guard(request, inflight.do(flight_key, lambda: generate_tour(content, cache_key, intent)),
+                                       deadline, "tour")
+        response.headers["X-Tour-Repaired-Steps"] = str(report.repaired)
+        response.headers["X-Tour-Dropped-Steps"] = str(report.dropped)
+        return plan
+
+    except (Overloaded, DeadlineExceeded, ClientDisconnected):
+        raise
+
+    except RateLimited as e:
+        count_error("tour", e)
+        response.headers["X-Degraded"] = "rate-limited"
+        return degraded_tour(content, cache_key)
 
     except Exception as e:
-        traceback.print_exc()
-        msg = str(e).lower()
+        return tour_error_fallback(e, "tour")
 
-        if "quota" in msg or "429" in msg:
-            return {
-                "steps": [{
-                    "element_selector": "body",
-                    "narrative": "⚠️ AI quota exceeded. Please try again later.",
-                    "action": "none"
-                }]
-            }
+# -------------------------
+# Analyze page, streamed
+# -------------------------
+def ndjson(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
 
-        if "api key not valid" in msg:
-            return {
-                "steps": [{
-                    "element_selector": "body",
-                    "narrative": "❌ Invalid Google API key.",
-                    "action": "none"
-                }]
-            }
+async def replay_tour(plan: dict):
+    for index, step in enumerate(plan["steps"]):
+        yield ndjson({"type": "step", "index": index, "step": step})
+    yield ndjson({"type": "plan", "plan": plan})
 
-        raise HTTPException(status_code=500, detail=str(e))
+async def stream_tour(content: PageContent, cache_key: Optional[str], intent: str = TOUR_INTENT,
+                      deadline: Optional[float] = None):
+    """
+    Streams the LLM output, emitting each TourStep as soon as its JSON object
+    closes, then the full TourPlan parsed by the same PydanticOutputParser as
+    the non-streaming endpoint. Model calls share the request's `deadline`.
+    """
+    parser = TourStepStreamParser()
+    selectors = SelectorIndex(content.fingerprint(), content.elements)
+    report = RepairReport()
+    emitted = []
+    errors = []
+    with scheduling(deadline=deadline):
+        try:
+            if intent == TOUR_INTENT and is_large_page(content.elements):
+                # Sections finish out of order; steps go out as soon as everything before them is merged
+                async for step in sectioned_tour(content, "tour_stream", report, errors):
+                    emitted.append(step)
+                    yield ndjson({"type": "step", "index": len(emitted) - 1, "step": step.model_dump()})
+            else:
+                # Routed but not hedged: a second stream would duplicate steps already sent
+                decision, inputs = tour_prompt(content, intent, "tour_stream")
+                model = decision.model
+                async for chunk in get_tour_stream_chain(model).astream(inputs(model)):
+                    for step in parser.feed(chunk):
+                        step = selector_repairer.repair_step(selectors, step, report)
+                        if step is not None:
+                            emitted.append(step)
+                            yield ndjson({"type": "step", "index": len(emitted) - 1, "step": step.model_dump()})
+
+                with stage("tour_stream", "output_parse"):
+                    # Validates the whole document; the steps are the repaired ones already sent
+                    tour_plan_parser.parse(parser.buffer)
+            plan = TourPlan(steps=emitted)
+            selector_repairer.record(report)
+            if cache_key is not None and not errors:
+                tour_cache.set(cache_key, plan.model_dump())
+            yield ndjson({"type": "plan", "plan": plan.model_dump(), "repaired_steps": report.repaired, "dropped_steps": report.dropped})
+
+        except RateLimited as e:
+            count_error("tour_stream", e)
+            yield ndjson({"type": "plan", "plan": degraded_tour(content, cache_key), "degraded": True})
+
+        except Overloaded as e:
+            # Only sections admit once the stream is running; the response has started, so no 503
+            count_error("tour_stream", e)
+            yield ndjson({"type": "error", "detail": f"Server busy: {e.reason}", "status": 503})
+
+        except DeadlineExceeded as e:
+            count_error("tour_stream", e)
+            CANCELLED_REQUESTS.labels("tour_stream", "deadline").inc()
+            yield ndjson({"type": "error", "detail": f"Deadline exceeded: {e.reason}", "status": 504})
+
+        except asyncio.CancelledError:
+            # The client went away; StreamingResponse cancels the stream and whatever model call it was in
+            CANCELLED_REQUESTS.labels("tour_stream", "disconnect").inc()
+            raise
+
+        except Exception as e:
+            try:
+                fallback = tour_error_fallback(e, "tour_stream")
+            except HTTPException as http_error:
+                yield ndjson({"type": "error", "detail": http_error.detail})
+            else:
+                yield ndjson({"type": "plan", "plan": fallback})
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """Holds an already-acquired admission slot until the stream finishes or the client goes away."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            llm_admission.release()
+
+@app.post("/api/analyze/stream")
+async def analyze_page_stream(request: Request, content: Optional[PageContent] = None, page_id: Optional[str] = None,
+                              intent: Optional[str] = Query(None, max_length=MAX_INTENT_CHARS),
+                              cache_control: Optional[str] = Header(None)):
+    """
+    NDJSON stream of {"type": "step"} events followed by one {"type": "plan"}
+    event carrying the complete TourPlan (or {"type": "error"}).
+    """
+    record_request_parse("tour_stream")
+    content = resolve_page(content, page_id)
+    intent = normalize_intent(intent, TOUR_INTENT)
+    if not llm_available():
+        return StreamingResponse(replay_tour(mock_tour(content)), media_type=NDJSON_MEDIA_TYPE)
+
+    with stage("tour_stream", "cache_lookup"):
+        cache_key, cached, cache_status = tour_cache_lookup(content, cache_control, intent)
+    headers = {"X-Cache": cache_status}
+    if cached is not None:
+        return StreamingResponse(replay_tour(cached), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+    # Admit before the response starts so overload is still a clean 503, and a client gone meanwhile is not served
+    deadline = request_deadline("tour", request.headers.get(REQUEST_TIMEOUT_HEADER))
+    await guard(request, llm_admission.acquire(), deadline, "tour_stream")
+    if intent == TOUR_INTENT and is_large_page(content.elements):
+        # Every section takes a slot of its own, as in /api/analyze; one slot must not cover several calls
+        llm_admission.release()
+        return StreamingResponse(stream_tour(content, cache_key, intent, deadline), media_type=NDJSON_MEDIA_TYPE,
+                                 headers=headers)
+    return AdmittedStreamingResponse(stream_tour(content, cache_key, intent, deadline), media_type=NDJSON_MEDIA_TYPE,
+                                     headers=headers)
+
+@app.delete("/api/analyze/cache")
+def clear_tour_cache(content: Optional[PageContent] = None, intent: Optional[str] = Query(None, max_length=MAX_INTENT_CHARS)):
+    """
+    Drops the cached tour (for `intent`, the general tour by default) and the
+    digest of one page, or every cached tour and digest when no page is sent.
+    """
+    if content is None:
+        tour_cache.clear()
+        digest_cache.clear()
+    else:
+        tour_cache.invalidate(tour_cache_key(content, normalize_intent(intent, TOUR_INTENT)))
+        digest_cache.invalidate(digest_cache_key(content))
+    return {"ok": True, "tour_cache": tour_cache.stats()}
 
 # -------------------------
 # Chat with page
 # -------------------------
-@app.post("/api/chat")
-def chat_with_page(request: ChatRequest):
-    if not is_valid_google_api_key():
+DEGRADED_CHAT_SNIPPETS = 3
+
+async def answer_chat(content: PageContent, query: str) -> ChatResponse:
+    # Deduplicate the page, then keep only the elements relevant to the question
+    with stage("chat", "compaction"):
+        compacted = chat_compactor.run(content.elements, DEFAULT_MODEL, content.fingerprint())
+    with stage("chat", "retrieval"):
+        relevant = page_retriever.select(content.fingerprint(), compacted.elements, query)
+        dom_text = "\n".join(compact_line(el) for el in relevant)
+
+    inputs = {
+        "page_title": content.title,
+        "page_content": dom_text,
+        "query": query
+    }
+    decision = model_router.route("chat", estimate_tokens(dom_text) + estimate_tokens(query))
+
+    async def run(model: str):
+        return await get_chat_chain(model).ainvoke(inputs)
+
+    async with llm_admission.slot():
+        return await model_router.call("chat", decision, run)
+
+def degraded_chat(content: PageContent, query: str) -> dict:
+    """Without the model, point the user at the passages retrieval ranks highest for the question."""
+    compacted = chat_compactor.run(content.elements, DEFAULT_MODEL, content.fingerprint())
+    relevant = page_retriever.top(content.fingerprint(), compacted.elements, query, DEGRADED_CHAT_SNIPPETS)
+    answer = "⚠️ The AI assistant is busy right now."
+    if relevant:
+        answer += " These parts of the page look most relevant to your question:\n" + "\n".join(
+            f"- {' '.join(el.text.split())[:200]}" for el in relevant)
+    return {"response": answer, "suggestions": []}
+
+def speculate_suggestions(content: PageContent, suggestions):
+    """Answers the suggested follow-ups in the background so a tap on one is served immediately."""
+    fingerprint = content.fingerprint()
+    for question in suggestions:
+        if answer_cache.get(content.url, fingerprint, question, record=False)[0] is not None:
+            continue
+        speculator.submit(("chat", fingerprint, normalize_query(question)), lambda q=question: answer_chat(content, q))
+
+@app.post("/api/chat", response_model=ChatReply)
+async def chat_with_page(request: ChatRequest, response: Response, http_request: Request):
+    record_request_parse("chat")
+    content = resolve_page(request.content, request.page_id)
+    if not llm_available():
         return {
             "response": "⚠️ AI is running in mock mode because no valid Google API key is configured.",
             "suggestions": [
@@ -156,26 +725,44 @@ def chat_with_page(request: ChatRequest):
         }
 
     try:
-        chain = get_chat_chain()
-
-        dom_text = "\n".join(
-            f"<{el['tagName']}>{el['text']}</{el['tagName']}>"
-            for el in request.content.elements
-        )
-
-        result = chain.invoke({
-            "page_title": request.content.title,
-            "page_content": dom_text,
-            "query": request.query
-        })
+        # Identical concurrent questions about the same page share one LLM call
+        flight_key = ("chat", content.fingerprint(), normalize_query(request.query))
+        with stage("chat", "answer_cache"):
+            cached, match = answer_cache.get(content.url, content.fingerprint(), request.query)
+        response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+        if cached is not None:
+            response.headers["X-Cache-Match"] = match
+            result = ChatResponse.model_validate(cached)
+        else:
+            async def fresh_answer() -> ChatResponse:
+                speculative = await speculator.take(flight_key)
+                if speculative is not None:
+                    response.headers["X-Speculative"] = "hit"
+                    return speculative
+                return await inflight.do(flight_key, lambda: answer_chat(content, request.query))
+
+            deadline = request_deadline("chat", http_request.headers.get(REQUEST_TIMEOUT_HEADER))
+            with scheduling(deadline=deadline):
+                result = await guard(http_request, fresh_answer(), deadline, "chat")
+            answer_cache.set(content.url, content.fingerprint(), request.query, result.model_dump())
+        speculate_suggestions(content, result.suggestions)
 
         return {
             "response": result.answer,
             "suggestions": result.suggestions
         }
 
+    except (Overloaded, DeadlineExceeded, ClientDisconnected):
+        raise
+
+    except RateLimited as e:
+        count_error("chat", e)
+        response.headers["X-Degraded"] = "rate-limited"
+        return degraded_chat(content, request.query)
+
     except Exception as e:
         traceback.print_exc()
+        count_error("chat", e)
         msg = str(e).lower()
 
         if "quota" in msg or "429" in msg:
@@ -217,7 +804,7 @@ def test_gemini():
         }
 
 # -------------------------
-# Run server
+# Run server (single process; see serve.py for several workers)
 # -------------------------
 if __name__ == "__main__":
     import uvicorn
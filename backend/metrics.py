@@ -0,0 +1,376 @@
+"""
+Prometheus metrics without extra dependencies.
+
+Counters, gauges and histograms are plain in-process objects; render()
+writes them in the Prometheus text format for GET /metrics. Recording is a
+dict lookup plus a lock around a few integer updates, cheap enough for the
+request path.
+
+Per-request stage timings are also collected in a context variable so the
+middleware can return them as a Server-Timing header (METRICS_SERVER_TIMING=true).
+"""
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "false").lower() == "true"
+
+# Seconds; covers sub-millisecond local stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PREFIX = "tourguide_"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [f"{self.name}_total{_label_text(self.labelnames, values)} {_number(child.value)}"
+                for values, child in list(self._children.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}"
+                for values, child in list(self._children.items())]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        lines = []
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def register_stats(self, component: str, stats: Callable[[], dict]):
+        """
+        Exposes a component's existing stats() dict as gauges, read at scrape
+        time (e.g. tourguide_tour_cache_hits). Non-numeric values are skipped.
+        """
+        self._collectors.append((component, stats))
+
+    def render(self) -> str:
+        parts = [metric.render() for metric in self._metrics]
+        for component, stats in self._collectors:
+            for key, value in _flatten(stats()):
+                name = f"{PREFIX}{component}_{key}"
+                parts.append(f"# TYPE {name} gauge\n{name} {_number(value)}")
+        return "\n".join(parts) + "\n"
+
+
+_INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _flatten(stats: dict, prefix: str = ""):
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        elif isinstance(value, (int, float)):
+            yield _INVALID_NAME_CHARS.sub("_", f"{prefix}{key}"), value
+
+
+REGISTRY = MetricsRegistry()
+
+# -------------------------
+# Application metrics
+# -------------------------
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "HTTP request latency by route.", ["method", "route", "status"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each stage of a request.", ["endpoint", "stage"])
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "Time spent waiting for an LLM admission slot.")
+LLM_IN_FLIGHT = Gauge("llm_calls_in_flight", "LLM calls currently running.", ["endpoint"])
+LLM_TOKENS = Counter("llm_tokens", "Prompt and completion tokens reported by the model.", ["endpoint", "kind"])
+ERRORS = Counter("errors", "Request errors by class.", ["endpoint", "error_class"])
+ROUTING_DECISIONS = Counter("routing_decisions", "Model chosen per request and why.", ["endpoint", "model", "reason"])
+HEDGES = Counter("hedged_requests", "Hedged calls by which model answered first.", ["endpoint", "outcome"])
+CANCELLED_REQUESTS = Counter("cancelled_requests", "Requests stopped before their answer was ready, by reason.", ["endpoint", "reason"])
+TOUR_SECTIONS = Counter("tour_sections", "Sections of large-page tours generated separately, by outcome.", ["endpoint", "outcome"])
+
+# -------------------------
+# Per-request stage timings
+# -------------------------
+_request_timings: ContextVar[Optional[list]] = ContextVar("request_timings", default=None)
+_request_start: ContextVar[Optional[float]] = ContextVar("request_start", default=None)
+
+
+def record_stage(endpoint: str, stage: str, seconds: float):
+    STAGE_SECONDS.labels(endpoint, stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def record_timing(stage: str, seconds: float):
+    """Adds to the Server-Timing header only (for stages without an endpoint label)."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def record_request_parse(endpoint: str):
+    """Call first thing in a handler: time from request arrival to here is body read plus validation."""
+    start = _request_start.get()
+    if start is not None:
+        record_stage(endpoint, "request_parse", time.perf_counter() - start)
+
+
+@contextmanager
+def stage(endpoint: str, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(endpoint, name, time.perf_counter() - start)
+
+
+def server_timing(timings: list) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware) so streaming responses and
+    context variables pass straight through. Records request latency by route
+    template and, when enabled, sends the stage timings as Server-Timing.
+    """
+
+    def __init__(self, app, server_timing_header: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing_header = server_timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: list = []
+        token = _request_timings.set(timings)
+        start_token = _request_start.set(start)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_header:
+                    timings.append(("total", time.perf_counter() - start))
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing(timings).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _request_timings.reset(token)
+            _request_start.reset(start_token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(time.perf_counter() - start)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Times the prompt, model and parser steps of a chain run and counts the
+    tokens the model reports. One instance per endpoint is shared by all
+    requests; open runs are keyed by run_id.
+    """
+
+    run_inline = True
+
+    def __init__(self, endpoint: str, time_parser: bool = True):
+        self.endpoint = endpoint
+        self.time_parser = time_parser
+        self._runs: Dict[UUID, Tuple[str, float]] = {}
+        self._first_token: set = set()
+        # Model run -> the chain run it belongs to
+        self._llm_parents: Dict[UUID, Optional[UUID]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, **kwargs):
+        run_type = kwargs.get("run_type")
+        if run_type == "prompt":
+            self._runs[run_id] = ("prompt_render", time.perf_counter())
+        elif run_type == "parser" and self.time_parser:
+            self._runs[run_id] = ("output_parse", time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs):
+        self._finish(run_id)
+        # A cancelled ainvoke never reports on_llm_error; close its model run with the chain
+        for llm_run, parent in list(self._llm_parents.items()):
+            if parent == run_id:
+                self._finish_llm(llm_run)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._runs[run_id] = ("llm", time.perf_counter())
+        self._llm_parents[run_id] = kwargs.get("parent_run_id")
+        LLM_IN_FLIGHT.labels(self.endpoint).inc()
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        if run_id in self._first_token or run_id not in self._runs:
+            return
+        self._first_token.add(run_id)
+        record_stage(self.endpoint, "llm_first_token", time.perf_counter() - self._runs[run_id][1])
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._finish_llm(run_id)
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            LLM_TOKENS.labels(self.endpoint, "prompt").inc(usage.get("input_tokens", 0))
+            LLM_TOKENS.labels(self.endpoint, "completion").inc(usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._finish_llm(run_id)
+
+    def _finish_llm(self, run_id: UUID):
+        self._first_token.discard(run_id)
+        self._llm_parents.pop(run_id, None)
+        if run_id in self._runs:
+            LLM_IN_FLIGHT.labels(self.endpoint).dec()
+        self._finish(run_id)
+
+    def _finish(self, run_id: UUID):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            record_stage(self.endpoint, run[0], time.perf_counter() - run[1])
@@ -0,0 +1,251 @@
+"""
+Batch tour prewarming.
+
+Generates tours for a directory of saved pages and stores them in the tour
+cache, so the first visitor gets a cache hit. Inputs are PageContent JSON
+files (like test_payload.json) or saved HTML, which is scanned with the same
+rules as the extension (dom_extract.py). For HTML the URL comes from the
+page's canonical link, or --base-url plus the file's relative path; it has to
+match what the extension sends for the cache key to line up.
+
+Calls run at "prewarm" priority through the same admission control, quota
+scheduler, routing and selector repair as live traffic, with at most
+--workers pages in flight. Every finished page is appended to a journal, so an
+interrupted run picks up where it stopped. Point --cache-db at the server's
+TOUR_CACHE_DB so it sees the results.
+
+    python prewarm.py snapshots/ --workers 4 --cache-db tour_cache.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+# USD per million (input, output) tokens, for the cost summary; unknown models price as flash
+MODEL_PRICES: Dict[str, tuple] = {
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+PAGE_SUFFIXES = (".json", ".html", ".htm")
+DONE = ("ok", "cached")
+
+
+def find_pages(paths: List[str]) -> List[str]:
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                found += [os.path.join(folder, name) for name in files if name.lower().endswith(PAGE_SUFFIXES)]
+        else:
+            found.append(path)
+    return sorted(found)
+
+
+def load_page(path: str, root: Optional[str], base_url: Optional[str]):
+    from dom_extract import page_from_html
+    from schemas import PageContent
+
+    with open(path, encoding="utf-8") as f:
+        raw = f.read()
+    if path.lower().endswith(".json"):
+        return PageContent.model_validate_json(raw)
+
+    url = None
+    if base_url:
+        relative = os.path.relpath(path, root) if root else os.path.basename(path)
+        url = base_url.rstrip("/") + "/" + relative.replace(os.sep, "/")
+    page = page_from_html(raw, url)
+    if not page.url:
+        page.url = "file://" + os.path.abspath(path)
+    return page
+
+
+def read_journal(path: str) -> Dict[str, dict]:
+    """Latest entry per source file; a torn last line from a crash is ignored."""
+    entries: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry["source"]] = entry
+    return entries
+
+
+def token_cost(usage: Dict[str, dict]) -> tuple:
+    prompt = completion = 0
+    cost = 0.0
+    for model, counts in usage.items():
+        input_tokens, output_tokens = counts.get("input_tokens", 0), counts.get("output_tokens", 0)
+        prompt += input_tokens
+        completion += output_tokens
+        input_price, output_price = MODEL_PRICES.get(model.rsplit("/", 1)[-1], MODEL_PRICES["gemini-2.5-flash"])
+        cost += (input_tokens * input_price + output_tokens * output_price) / 1e6
+    return prompt, completion, cost
+
+
+class Journal:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+async def prewarm_page(server, source: str, page, force: bool) -> dict:
+    from ratelimit import scheduling
+    from tour_cache import tour_cache, tour_cache_key
+
+    key = tour_cache_key(page, server.TOUR_INTENT)
+    entry = {"source": source, "url": page.url, "key": key, "elements": len(page.elements)}
+    if not force and tour_cache.get(key) is not None:
+        return {**entry, "status": "cached", "seconds": 0.0}
+
+    start = time.perf_counter()
+    try:
+        with scheduling(priority="prewarm"), get_usage_metadata_callback() as usage:
+            plan, report = await server.generate_tour(page, key)
+    except Exception as e:
+        return {**entry, "status": "error", "error": str(e)[:300], "seconds": round(time.perf_counter() - start, 3)}
+
+    prompt, completion, cost = token_cost(usage.usage_metadata)
+    return {
+        **entry,
+        "status": "ok",
+        "seconds": round(time.perf_counter() - start, 3),
+        "steps": len(plan.steps),
+        "repaired": report.repaired,
+        "dropped": report.dropped,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cost_usd": round(cost, 6),
+        "models": sorted(usage.usage_metadata),
+    }
+
+
+async def prewarm(paths: List[str], journal_path: str, workers: int = 4, force: bool = False,
+                  base_url: Optional[str] = None, progress=print) -> List[dict]:
+    import main as server
+
+    if not server.llm_available():
+        raise RuntimeError("No model configured: set GOOGLE_API_KEY, or LLM_BACKEND=fake for a dry run")
+
+    root = paths[0] if len(paths) == 1 and os.path.isdir(paths[0]) else None
+    sources = find_pages(paths)
+    journal_entries = read_journal(journal_path)
+    results: List[dict] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for source in sources:
+        queue.put_nowait(source)
+    total = len(sources)
+    journal = Journal(journal_path)
+
+    def report(entry: dict):
+        results.append(entry)
+        detail = entry.get("error") or (
+            f"{entry.get('seconds', 0):6.2f}s  {entry.get('prompt_tokens', 0):6d}+{entry.get('completion_tokens', 0):5d} tok"
+            f"  ${entry.get('cost_usd', 0):.5f}" if entry["status"] == "ok" else "")
+        progress(f"[{len(results):{len(str(total))}d}/{total}] {entry['status']:<8} {entry['source']}  {detail}")
+
+    async def worker():
+        while True:
+            try:
+                source = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                page = load_page(source, root, base_url)
+            except Exception as e:
+                entry = {"source": source, "status": "error", "error": f"could not load page: {e}"[:300]}
+                journal.write(entry)
+                report(entry)
+                continue
+
+            done = journal_entries.get(source)
+            if not force and done and done["status"] in DONE and done.get("key") == server.tour_cache_key(page, server.TOUR_INTENT):
+                report({**done, "status": "resumed"})
+                continue
+
+            entry = await prewarm_page(server, source, page, force)
+            journal.write(entry)
+            report(entry)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    finally:
+        journal.close()
+    return results
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def print_summary(results: List[dict], slowest: int = 10):
+    counts: Dict[str, int] = {}
+    for entry in results:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    generated = [entry for entry in results if entry["status"] == "ok"]
+    latencies = [entry["seconds"] for entry in generated]
+
+    print("\nSummary: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())))
+    if generated:
+        print(f"  latency   p50={percentile(latencies, 0.5):.2f}s  p95={percentile(latencies, 0.95):.2f}s  max={max(latencies):.2f}s")
+        print(f"  tokens    prompt={sum(e['prompt_tokens'] for e in generated)}  completion={sum(e['completion_tokens'] for e in generated)}")
+        print(f"  cost      ${sum(e['cost_usd'] for e in generated):.4f} total, "
+              f"${sum(e['cost_usd'] for e in generated) / len(generated):.5f} per page")
+        print(f"  repaired  {sum(e['repaired'] for e in generated)} steps, dropped {sum(e['dropped'] for e in generated)}")
+        print("\n  slowest pages:")
+        for entry in sorted(generated, key=lambda e: -e["seconds"])[:slowest]:
+            print(f"    {entry['seconds']:6.2f}s  ${entry['cost_usd']:.5f}  {entry['elements']:4d} elements  {entry['source']}")
+    for entry in results:
+        if entry["status"] == "error":
+            print(f"  error: {entry['source']}: {entry['error']}")
+
+
+def run_cli():
+    parser = argparse.ArgumentParser(description="Generate and cache tours for saved pages.")
+    parser.add_argument("paths", nargs="+", help="page files or directories of .json/.html snapshots")
+    parser.add_argument("--workers", type=int, default=4, help="pages generated concurrently")
+    parser.add_argument("--journal", default="prewarm_journal.jsonl", help="progress journal used to resume")
+    parser.add_argument("--cache-db", help="SQLite tour cache to fill (the server's TOUR_CACHE_DB)")
+    parser.add_argument("--base-url", help="URL prefix for HTML snapshots without a canonical link")
+    parser.add_argument("--force", action="store_true", help="regenerate pages that are cached or journaled")
+    parser.add_argument("--summary-json", help="also write per-page results to this file")
+    args = parser.parse_args()
+
+    # Must be set before tour_cache is imported
+    if args.cache_db:
+        os.environ["TOUR_CACHE_DB"] = args.cache_db
+    elif not os.environ.get("TOUR_CACHE_DB"):
+        print("warning: no --cache-db or TOUR_CACHE_DB, tours only live as long as this process", file=sys.stderr)
+
+    results = asyncio.run(prewarm(args.paths, args.journal, args.workers, args.force, args.base_url))
+    print_summary(results)
+    if args.summary_json:
+        with open(args.summary_json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any(entry["status"] == "error" for entry in results) else 0)
+
+
+if __name__ == "__main__":
+    run_cli()
@@ -0,0 +1,422 @@
+"""
+Client-side Gemini quota scheduling.
+
+Every model call goes through QuotaScheduler: token buckets per model keep
+requests/minute and tokens/minute under the configured quota, a priority
+queue lets interactive chat go ahead of tour generation and batch prewarming,
+and retryable failures (429s, 5xx, timeouts) are retried with jittered
+exponential backoff. When the wait for quota would run past the request's
+deadline the call fails fast with RateLimited so the caller can serve a cached
+or degraded response instead. The deadline also bounds the call itself: a
+model call still running when it passes is cancelled with DeadlineExceeded.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, NoReturn, Optional, TypeVar
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from text_utils import estimate_tokens
+
+T = TypeVar("T")
+
+# Lower runs first
+PRIORITIES = {"chat": 0, "tour": 1, "prewarm": 2, "speculative": 3}
+
+# Per-model quota as (requests/minute, tokens/minute)
+DEFAULT_RPM = int(os.environ.get("GEMINI_RPM", "1000"))
+DEFAULT_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+MODEL_QUOTAS: Dict[str, tuple] = {
+    "models/gemini-2.5-flash": (int(os.environ.get("GEMINI_RPM_FLASH", DEFAULT_RPM)), int(os.environ.get("GEMINI_TPM_FLASH", DEFAULT_TPM))),
+    "models/gemini-2.5-flash-lite": (int(os.environ.get("GEMINI_RPM_FLASH_LITE", DEFAULT_RPM)), int(os.environ.get("GEMINI_TPM_FLASH_LITE", DEFAULT_TPM))),
+    "models/gemini-2.5-pro": (int(os.environ.get("GEMINI_RPM_PRO", "150")), int(os.environ.get("GEMINI_TPM_PRO", "2000000"))),
+}
+# Fraction of those quotas this process may use: serve.py gives each of N workers 1/N
+QUOTA_SHARE = float(os.environ.get("GEMINI_QUOTA_SHARE", "1"))
+
+# Reserved for the completion until the real usage is known
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get("LLM_EXPECTED_OUTPUT_TOKENS", "512"))
+
+# How long a call may wait for quota (and retries) before falling back, per priority
+DEFAULT_DEADLINES: Dict[str, Optional[float]] = {
+    "chat": float(os.environ.get("CHAT_DEADLINE_SECONDS", "20")),
+    "tour": float(os.environ.get("TOUR_DEADLINE_SECONDS", "45")),
+    "prewarm": None,
+    # Not worth waiting for: the user may never ask
+    "speculative": float(os.environ.get("SPECULATION_DEADLINE_SECONDS", "5")),
+}
+
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", "8"))
+
+_RETRYABLE_MARKERS = ("429", "resource_exhausted", "quota", "rate limit", "500", "502", "503", "504",
+                      "internal", "unavailable", "deadline exceeded", "timed out", "timeout")
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "quota", "rate limit")
+
+
+class RateLimited(Exception):
+    """The quota would not allow this call before its deadline."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out; surfaced to clients as a 504."""
+
+    def __init__(self, reason: str = "request deadline exceeded"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    msg = str(e).lower()
+    return any(marker in msg for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, DeadlineExceeded):
+        return False
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    msg = str(e).lower()
+    if "api key not valid" in msg:
+        return False
+    return any(marker in msg for marker in _RETRYABLE_MARKERS)
+
+
+async def within(deadline: Optional[float], awaitable: Awaitable[T]) -> T:
+    """Awaits `awaitable`, cancelling it with DeadlineExceeded at `deadline` (time.monotonic())."""
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, deadline - time.monotonic())
+    except asyncio.TimeoutError:
+        if time.monotonic() < deadline:
+            # A timeout of the call's own, e.g. from the HTTP client
+            raise
+        raise DeadlineExceeded() from None
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute`; holds at most one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request larger than the bucket waits for a full bucket, not forever
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        # Can go negative when the actual usage was above the estimate
+        self.level -= amount
+
+
+class ModelQuota:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        # Heap of [priority, sequence, tokens]
+        self.waiters: list = []
+        self._changed: Optional[asyncio.Event] = None
+
+    def wait_time(self, requests: int, tokens: int, now: float) -> float:
+        return max(self.blocked_until - now,
+                   self.requests.time_until(requests, now),
+                   self.tokens.time_until(tokens, now))
+
+    async def wait_changed(self, timeout: Optional[float]):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def notify(self):
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+
+class QuotaScheduler:
+    def __init__(self, quotas: Optional[Dict[str, tuple]] = None,
+                 default_quota: tuple = (DEFAULT_RPM, DEFAULT_TPM),
+                 max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+                 seed: Optional[int] = None, share: float = QUOTA_SHARE):
+        self.quota_config = dict(MODEL_QUOTAS if quotas is None else quotas)
+        self.default_quota = default_quota
+        self.share = share
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._quotas: Dict[str, ModelQuota] = {}
+        self._sequence = itertools.count()
+        self._rng = random.Random(seed)
+
+        self.admitted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.retries = 0
+        self.rate_limit_errors = 0
+        self.deadline_exceeded = 0
+        self.calls_timed_out = 0
+
+    def quota(self, model: str) -> ModelQuota:
+        quota = self._quotas.get(model)
+        if quota is None:
+            rpm, tpm = self.quota_config.get(model, self.default_quota)
+            quota = self._quotas[model] = ModelQuota(rpm * self.share, tpm * self.share)
+        return quota
+
+    async def acquire(self, model: str, tokens: int, priority: str = "tour", deadline: Optional[float] = None):
+        """
+        Waits until `model`'s buckets can take one request and `tokens`
+        tokens and no higher-priority (or earlier, same-priority) call is
+        waiting. Raises RateLimited as soon as the estimated wait runs past
+        `deadline` (a time.monotonic() value).
+        """
+        quota = self.quota(model)
+        entry = [PRIORITIES.get(priority, PRIORITIES["tour"]), next(self._sequence), tokens]
+        heapq.heappush(quota.waiters, entry)
+        start = time.monotonic()
+        slept = False
+        try:
+            while True:
+                now = time.monotonic()
+                ahead = [waiter for waiter in quota.waiters if waiter < entry]
+                wait = quota.wait_time(len(ahead) + 1, tokens + sum(waiter[2] for waiter in ahead), now)
+                if not ahead and wait <= 0:
+                    quota.requests.take(1, now)
+                    quota.tokens.take(tokens, now)
+                    self.admitted += 1
+                    if slept:
+                        self.waited += 1
+                        self.wait_seconds += now - start
+                    return
+                if deadline is not None and now + wait > deadline:
+                    self.deadline_exceeded += 1
+                    raise RateLimited(f"{model} quota would not be available before the deadline", wait)
+                # Head of the queue sleeps until the buckets refill; others until the queue moves
+                await quota.wait_changed(wait if not ahead else (deadline - now if deadline is not None else None))
+                slept = True
+        finally:
+            quota.waiters.remove(entry)
+            heapq.heapify(quota.waiters)
+            quota.notify()
+
+    def backlogged(self) -> bool:
+        """True while any call is waiting for quota or a model is paused after a 429."""
+        now = time.monotonic()
+        return any(quota.waiters or quota.blocked_until > now for quota in self._quotas.values())
+
+    def settle(self, model: str, reserved: int, actual: int):
+        """Corrects the token bucket once the real usage is known."""
+        self.quota(model).tokens.take(actual - reserved, time.monotonic())
+
+    def retry_delay(self, model: str, error: Exception, attempt: int, deadline: Optional[float]) -> float:
+        """
+        Backoff before retry number `attempt` (0-based), with full jitter.
+        Gives up when `error` is not retryable, retries are used up, or the
+        backoff would end past the deadline. A 429 also pauses every call to
+        the model for the same delay.
+        """
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._give_up(model, error)
+        delay = self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        now = time.monotonic()
+        if deadline is not None and now + delay > deadline:
+            self._give_up(model, error)
+        if is_rate_limit_error(error):
+            self.rate_limit_errors += 1
+            quota = self.quota(model)
+            quota.blocked_until = max(quota.blocked_until, now + delay)
+        self.retries += 1
+        return delay
+
+    def _give_up(self, model: str, error: Exception) -> NoReturn:
+        """Re-raises `error`; a 429 that outlasted the retries becomes RateLimited, so callers degrade."""
+        if is_rate_limit_error(error):
+            raise RateLimited(f"{model} still rate limited after retrying", self.backoff_max) from error
+        raise error
+
+    async def call(self, model: str, tokens: int, fn: Callable[[], Awaitable[T]],
+                   priority: str = "tour", deadline: Optional[float] = None) -> T:
+        attempt = 0
+        while True:
+            await self.acquire(model, tokens, priority, deadline)
+            try:
+                return await within(deadline, fn())
+            except DeadlineExceeded:
+                self.calls_timed_out += 1
+                raise
+            except Exception as e:
+                delay = self.retry_delay(model, e, attempt, deadline)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "avg_wait_ms": round(self.wait_seconds / self.waited * 1000, 1) if self.waited else 0.0,
+            "retries": self.retries,
+            "rate_limit_errors": self.rate_limit_errors,
+            "deadline_exceeded": self.deadline_exceeded,
+            "calls_timed_out": self.calls_timed_out,
+            "queued": sum(len(quota.waiters) for quota in self._quotas.values()),
+            "models": {
+                model: {
+                    "requests_available": round(quota.requests.level, 1),
+                    "tokens_available": round(quota.tokens.level),
+                    "queued": len(quota.waiters),
+                }
+                for model, quota in self._quotas.items()
+            },
+        }
+
+
+quota_scheduler = QuotaScheduler()
+
+# -------------------------
+# Per-request scheduling context
+# -------------------------
+@dataclass(frozen=True)
+class Schedule:
+    priority: Optional[str] = None
+    deadline: Optional[float] = None
+
+
+_schedule: ContextVar[Schedule] = ContextVar("llm_schedule", default=Schedule())
+
+
+@contextmanager
+def scheduling(priority: Optional[str] = None, deadline: Optional[float] = None):
+    """Overrides the priority and/or deadline (time.monotonic()) of LLM calls made inside the block."""
+    token = _schedule.set(Schedule(priority, deadline))
+    try:
+        yield
+    finally:
+        _schedule.reset(token)
+
+
+async def _bounded(stream: AsyncIterator, deadline: Optional[float]) -> AsyncIterator:
+    """Re-yields `stream`, raising DeadlineExceeded if the next chunk is not there by `deadline`."""
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await within(deadline, iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+class ScheduledModel(Runnable):
+    """
+    Wraps a chat model so every async call is admitted by quota_scheduler.
+    Sits where the model sits in a chain (prompt | ScheduledModel | parser).
+    Streams are only retried before their first chunk. The sync path is passed
+    through unscheduled; it is only used by the diagnostic endpoint.
+    """
+
+    def __init__(self, llm: Runnable, model: str, priority: str, scheduler: Optional[QuotaScheduler] = None):
+        self.llm = llm
+        self.model = model
+        self.priority = priority
+        self.scheduler = scheduler
+
+    @property
+    def _scheduler(self) -> QuotaScheduler:
+        return self.scheduler or quota_scheduler
+
+    def _plan(self, prompt: Any):
+        schedule = _schedule.get()
+        priority = schedule.priority or self.priority
+        deadline = schedule.deadline
+        if deadline is None and DEFAULT_DEADLINES.get(priority) is not None:
+            deadline = time.monotonic() + DEFAULT_DEADLINES[priority]
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        return priority, deadline, estimate_tokens(text) + EXPECTED_OUTPUT_TOKENS
+
+    def _settle(self, message: Any, reserved: int):
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self._scheduler.settle(self.model, reserved, usage.get("total_tokens", reserved))
+
+    @staticmethod
+    def _chunk_tokens(chunk: Any) -> Optional[int]:
+        usage = getattr(chunk, "usage_metadata", None)
+        return usage.get("total_tokens", 0) if usage else None
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        return self.llm.invoke(input, config, **kwargs)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        return self.llm.stream(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        priority, deadline, tokens = self._plan(input)
+        result = await self._scheduler.call(self.model, tokens, lambda: self.llm.ainvoke(input, config, **kwargs),
+                                            priority, deadline)
+        self._settle(result, tokens)
+        return result
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator:
+        priority, deadline, tokens = self._plan(input)
+        attempt = 0
+        while True:
+            await self._scheduler.acquire(self.model, tokens, priority, deadline)
+            started = False
+            # Gemini reports usage as deltas on each chunk: add them up and settle once
+            used: Optional[int] = None
+            try:
+                async for chunk in _bounded(self.llm.astream(input, config, **kwargs), deadline):
+                    started = True
+                    chunk_tokens = self._chunk_tokens(chunk)
+                    if chunk_tokens is not None:
+                        used = (used or 0) + chunk_tokens
+                    yield chunk
+                return
+            except DeadlineExceeded:
+                self._scheduler.calls_timed_out += 1
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                delay = self._scheduler.retry_delay(self.model, e, attempt, deadline)
+                attempt += 1
+                await asyncio.sleep(delay)
+            finally:
+                # Also when the stream ends early (cancelled, client gone): what was used so far
+                if used is not None:
+                    self._scheduler.settle(self.model, tokens, used)
@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+from schemas import PageElement
+from text_utils import estimate_tokens, tokenize
+
+CHAT_RETRIEVAL_TOP_K = int(os.environ.get("CHAT_RETRIEVAL_TOP_K", "40"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKEN_BUDGET", "2000"))
+RETRIEVAL_INDEX_CACHE_SIZE = int(os.environ.get("RETRIEVAL_INDEX_CACHE_SIZE", "128"))
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the elements of one page. Postings are stored per term as
+    NumPy arrays (doc ids, term frequencies) so a query only touches the
+    documents that contain its terms.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(texts)
+
+        doc_ids: Dict[str, List[int]] = {}
+        term_freqs: Dict[str, List[int]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            lengths[doc] = sum(counts.values())
+            for term, count in counts.items():
+                doc_ids.setdefault(term, []).append(doc)
+                term_freqs.setdefault(term, []).append(count)
+
+        avg_length = float(lengths.mean()) if self.size and lengths.any() else 1.0
+        self._norm = k1 * (1 - b + b * lengths / avg_length)
+        self._postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(term_freqs[term], dtype=np.float32))
+            for term, ids in doc_ids.items()
+        }
+        self._idf = {
+            term: float(np.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5)))
+            for term, ids in doc_ids.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tf = posting
+            scores[ids] += self._idf[term] * tf * (self.k1 + 1) / (tf + self._norm[ids])
+        return scores
+
+
+def element_line(el: PageElement) -> str:
+    return f"<{el.tagName}>{el.text}</{el.tagName}>"
+
+
+class PageRetriever:
+    """Per-page BM25 indexes, built once per page fingerprint and kept in an LRU."""
+
+    def __init__(self, cache_size: int = RETRIEVAL_INDEX_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.index_builds = 0
+        self.index_hits = 0
+        self.queries = 0
+        self.retrieval_seconds = 0.0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def index_for(self, page_key: str, elements: List[PageElement]) -> BM25Index:
+        with self._lock:
+            index = self._indexes.get(page_key)
+            if index is not None:
+                self._indexes.move_to_end(page_key)
+                self.index_hits += 1
+                return index
+
+        index = BM25Index([el.text for el in elements])
+        with self._lock:
+            self._indexes[page_key] = index
+            self.index_builds += 1
+            while len(self._indexes) > self.cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def select(self, page_key: str, elements: List[PageElement], query: str,
+               top_k: int = CHAT_RETRIEVAL_TOP_K, token_budget: int = CHAT_CONTEXT_TOKEN_BUDGET) -> List[PageElement]:
+        """
+        The elements most relevant to `query`, at most `top_k` of them and
+        within `token_budget`, returned in original document order. Pages that
+        already fit the budget are passed through untouched.
+        """
+        start = time.perf_counter()
+        costs = [estimate_tokens(element_line(el)) + 1 for el in elements]
+        total = sum(costs)
+
+        if total <= token_budget:
+            selected = list(elements)
+            used = total
+        else:
+            index = self.index_for(page_key, elements)
+            scores = index.scores(query)
+            # Highest score first; ties (including all-zero) keep document order
+            ranked = np.argsort(-scores, kind="stable")
+            picked: List[int] = []
+            used = 0
+            for doc in ranked:
+                if len(picked) >= top_k:
+                    break
+                if used + costs[doc] > token_budget:
+                    continue
+                picked.append(int(doc))
+                used += costs[doc]
+            picked.sort()
+            selected = [elements[i] for i in picked]
+
+        with self._lock:
+            self.queries += 1
+            self.retrieval_seconds += time.perf_counter() - start
+            self.tokens_before += total
+            self.tokens_after += used
+        return selected
+
+    def top(self, page_key: str, elements: List[PageElement], query: str, k: int) -> List[PageElement]:
+        """The `k` best-scoring elements that match the query at all, best first."""
+        scores = self.index_for(page_key, elements).scores(query)
+        ranked = np.argsort(-scores, kind="stable")[:k]
+        return [elements[int(doc)] for doc in ranked if scores[doc] > 0]
+
+    def stats(self) -> dict:
+        return {
+            "indexes": len(self._indexes),
+            "index_builds": self.index_builds,
+            "index_hits": self.index_hits,
+            "queries": self.queries,
+            "avg_retrieval_ms": round(1000 * self.retrieval_seconds / self.queries, 3) if self.queries else 0.0,
+            "prompt_tokens_before": self.tokens_before,
+            "prompt_tokens_after": self.tokens_after,
+            "prompt_reduction": round(1 - self.tokens_after / self.tokens_before, 4) if self.tokens_before else 0.0,
+        }
+
+
+page_retriever = PageRetriever()
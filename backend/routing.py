@@ -0,0 +1,228 @@
+"""
+Per-request model choice between a fast/cheap and a strong Gemini model,
+plus hedged calls.
+
+route() picks the fast model for prompts under the endpoint's size limit and
+the strong one above it, then switches to the other model when recent
+latency shows the chosen one is much slower. call() runs the request and,
+once it has been out longer than the chosen percentile of recent latencies,
+starts the same request on the other model, keeps whichever answers first
+and cancels the rest; a loser's time so far still counts as a lower bound
+on its latency when that is above its average. The hedge takes an admission
+slot of its own and is skipped when none is free, so hedging never adds
+calls to a saturated server.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import concurrency
+from concurrency import AdmissionController
+from metrics import HEDGES, ROUTING_DECISIONS
+
+T = TypeVar("T")
+
+ROUTING_ENABLED = os.environ.get("MODEL_ROUTING", "true").lower() == "true"
+FAST_MODEL = os.environ.get("ROUTER_FAST_MODEL", "models/gemini-2.5-flash-lite")
+STRONG_MODEL = os.environ.get("ROUTER_STRONG_MODEL", "models/gemini-2.5-flash")
+
+# Prompts up to this many tokens go to the fast model, per endpoint
+FAST_MAX_PROMPT_TOKENS: Dict[str, int] = {
+    "tour": int(os.environ.get("ROUTER_TOUR_FAST_MAX_TOKENS", "1500")),
+    "tour_stream": int(os.environ.get("ROUTER_TOUR_FAST_MAX_TOKENS", "1500")),
+    "chat": int(os.environ.get("ROUTER_CHAT_FAST_MAX_TOKENS", "2500")),
+}
+
+# Switch models when the chosen one's latency EWMA is this many times the other's
+LATENCY_SWITCH_RATIO = float(os.environ.get("ROUTER_LATENCY_SWITCH_RATIO", "2.0"))
+
+HEDGE_ENABLED = os.environ.get("HEDGE_REQUESTS", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = int(os.environ.get("ROUTER_LATENCY_WINDOW", "200"))
+EWMA_ALPHA = 0.2
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    model: str
+    reason: str
+
+
+class LatencyTracker:
+    """Recent call latencies per (endpoint, model): a window for percentiles and an EWMA."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._ewma: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, model: str, seconds: float):
+        key = (endpoint, model)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+            previous = self._ewma.get(key)
+            self._ewma[key] = seconds if previous is None else (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * seconds
+
+    def observe_at_least(self, endpoint: str, model: str, seconds: float):
+        """
+        A call cancelled after `seconds` would have taken at least that long.
+        Recorded only when it is above the EWMA, where it tells something new.
+        """
+        previous = self._ewma.get((endpoint, model))
+        if previous is None or seconds > previous:
+            self.observe(endpoint, model, seconds)
+
+    def count(self, endpoint: str, model: str) -> int:
+        return len(self._samples.get((endpoint, model), ()))
+
+    def ewma(self, endpoint: str, model: str) -> Optional[float]:
+        return self._ewma.get((endpoint, model))
+
+    def percentile(self, endpoint: str, model: str, q: float) -> Optional[float]:
+        samples = self._samples.get((endpoint, model))
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRouter:
+    def __init__(self, fast_model: str = FAST_MODEL, strong_model: str = STRONG_MODEL,
+                 fast_max_tokens: Optional[Dict[str, int]] = None, enabled: bool = ROUTING_ENABLED,
+                 default_model: str = STRONG_MODEL, hedge: bool = HEDGE_ENABLED,
+                 hedge_percentile: float = HEDGE_PERCENTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+                 latency_switch_ratio: float = LATENCY_SWITCH_RATIO, admission: Optional[AdmissionController] = None):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.fast_max_tokens = dict(FAST_MAX_PROMPT_TOKENS if fast_max_tokens is None else fast_max_tokens)
+        self.enabled = enabled
+        self.default_model = default_model
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency_switch_ratio = latency_switch_ratio
+        self.latency = LatencyTracker()
+        self.admission = admission
+
+        self.decisions: Dict[Tuple[str, str, str], int] = {}
+        self.hedges_started = 0
+        self.hedges_skipped = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+
+    @property
+    def _admission(self) -> AdmissionController:
+        return self.admission or concurrency.llm_admission
+
+    def alternate(self, model: str) -> str:
+        return self.fast_model if model == self.strong_model else self.strong_model
+
+    def route(self, endpoint: str, prompt_tokens: int) -> RouteDecision:
+        if not self.enabled:
+            decision = RouteDecision(self.default_model, "disabled")
+        elif prompt_tokens <= self.fast_max_tokens.get(endpoint, 0):
+            decision = RouteDecision(self.fast_model, "small_prompt")
+        else:
+            decision = RouteDecision(self.strong_model, "large_prompt")
+
+        if self.enabled:
+            chosen = self.latency.ewma(endpoint, decision.model)
+            other_model = self.alternate(decision.model)
+            other = self.latency.ewma(endpoint, other_model)
+            if (chosen is not None and other is not None
+                    and self.latency.count(endpoint, decision.model) >= self.hedge_min_samples
+                    and chosen > self.latency_switch_ratio * other):
+                decision = RouteDecision(other_model, "latency")
+
+        key = (endpoint, decision.model, decision.reason)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        ROUTING_DECISIONS.labels(*key).inc()
+        return decision
+
+    def hedge_delay(self, endpoint: str, model: str) -> Optional[float]:
+        """How long to give `model` before hedging, or None when there is too little history."""
+        if not self.hedge or self.latency.count(endpoint, model) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(endpoint, model, self.hedge_percentile)
+
+    async def _timed(self, endpoint: str, model: str, fn: Callable[[str], Awaitable[T]]) -> T:
+        start = time.monotonic()
+        try:
+            result = await fn(model)
+        except asyncio.CancelledError:
+            # A primary that keeps losing to its hedge must still look slow, or it is never routed around
+            self.latency.observe_at_least(endpoint, model, time.monotonic() - start)
+            raise
+        self.latency.observe(endpoint, model, time.monotonic() - start)
+        return result
+
+    async def call(self, endpoint: str, decision: RouteDecision, fn: Callable[[str], Awaitable[T]]) -> T:
+        """Runs fn(model), hedging onto the other model past the latency percentile."""
+        primary = asyncio.ensure_future(self._timed(endpoint, decision.model, fn))
+        delay = self.hedge_delay(endpoint, decision.model)
+        if delay is None:
+            return await primary
+
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            admission = self._admission
+            if not admission.try_acquire():
+                # No free slot: a second call would only add load where it is already too high
+                self.hedges_skipped += 1
+                HEDGES.labels(endpoint, "skipped_saturated").inc()
+                return await primary
+            self.hedges_started += 1
+            hedge = asyncio.ensure_future(self._timed(endpoint, self.alternate(decision.model), fn))
+            # Released however the hedge ends, even if cancelled before it ever ran
+            hedge.add_done_callback(lambda _: admission.release())
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        outcome = "hedge_won" if task is not primary else "primary_won"
+                        if task is primary:
+                            self.primary_wins += 1
+                        else:
+                            self.hedge_wins += 1
+                        HEDGES.labels(endpoint, outcome).inc()
+                        return task.result()
+            HEDGES.labels(endpoint, "both_failed").inc()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        decided = {}
+        for (endpoint, model, reason), count in self.decisions.items():
+            decided.setdefault(endpoint, {}).setdefault(model.rsplit("/", 1)[-1], {})[reason] = count
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.fast_model,
+            "strong_model": self.strong_model,
+            "decisions": decided,
+            "hedges_started": self.hedges_started,
+            "hedges_skipped": self.hedges_skipped,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges_started, 3) if self.hedges_started else 0.0,
+        }
+
+
+model_router = ModelRouter()
@@ -1,5 +1,10 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+import hashlib
+import json
+from pydantic import BaseModel, Field, PrivateAttr, StringConstraints, TypeAdapter, model_validator
+from pydantic.dataclasses import dataclass
+from typing import Annotated, List, Dict, Any, Optional
+
+from wire import decode_columnar, is_columnar
 
 # --- Shared Models ---
 
@@ -10,19 +15,111 @@ class DOMElement(BaseModel):
     className: str = ""
     selector: str = ""
 
+@dataclass(slots=True)
+class PageElement:
+    """
+    Compact in-memory form of a scanned element. Pages are validated into
+    these once, by pydantic-core, when the request body is parsed; everything
+    downstream reads attributes instead of indexing dicts. Treat instances as
+    read-only and use dataclasses.replace() to derive modified copies.
+    """
+    tagName: Annotated[str, StringConstraints(min_length=1, to_upper=True)]
+    text: str = ""
+    id: str = ""
+    className: str = ""
+    selector: str = ""
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"tagName": self.tagName, "text": self.text, "id": self.id,
+                "className": self.className, "selector": self.selector}
+
+@dataclass(slots=True)
+class AddedElement(PageElement):
+    """An element in a PageDelta, with the optional position to insert it at."""
+    index: Optional[int] = None
+
+    def element(self) -> PageElement:
+        return PageElement(self.tagName, self.text, self.id, self.className, self.selector)
+
+_elements_adapter = TypeAdapter(List[PageElement])
+
+def parse_elements(value: Any) -> List[PageElement]:
+    return _elements_adapter.validate_python(value)
+
 # --- Request/Response Models ---
 
 class PageContent(BaseModel):
     url: str
     title: str
-    elements: List[Dict[str, Any]]
+    elements: List[PageElement]
+
+    _fingerprint: Optional[str] = PrivateAttr(default=None)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _decode_columnar(cls, data: Any) -> Any:
+        # Compact clients send elements as columns (see wire.py); the model is the same either way
+        if isinstance(data, dict) and is_columnar(data.get("elements")):
+            return {**data, "elements": decode_columnar(data["elements"])}
+        return data
 
     def to_dom_elements(self) -> List[DOMElement]:
-        return [DOMElement(**el) for el in self.elements]
+        return [DOMElement(**el.as_dict()) for el in self.elements]
+
+    def fingerprint(self) -> str:
+        """
+        Canonical hash of the page: url without fragment, title and the
+        whitespace-normalized elements. className is left out because it
+        churns with UI state (hover/active classes) without changing content.
+        Computed once per instance; page updates build a new PageContent.
+        """
+        if self._fingerprint is not None:
+            return self._fingerprint
+
+        canonical = {
+            "url": self.url.split("#", 1)[0].rstrip("/"),
+            "title": " ".join(self.title.split()),
+            "elements": [
+                [el.tagName, " ".join(el.text.split()), el.id, el.selector]
+                for el in self.elements
+            ],
+        }
+        payload = json.dumps(canonical, separators=(",", ":"), ensure_ascii=False)
+        self._fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return self._fingerprint
 
 class ChatRequest(BaseModel):
     query: str
-    content: PageContent
+    # Either the full page, or the id of a page registered via POST /api/pages
+    content: Optional[PageContent] = None
+    page_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _require_page(self):
+        if self.content is None and self.page_id is None:
+            raise ValueError("Either 'content' or 'page_id' is required")
+        return self
+
+class ChatReply(BaseModel):
+    response: str
+    suggestions: List[str] = Field(default_factory=list)
+
+class PageDelta(BaseModel):
+    """
+    Changes to a registered page. Elements are matched by selector: a removed
+    selector drops that element, an added element replaces the one with the
+    same selector or is inserted at its optional "index" (appended otherwise).
+    """
+    removed: List[str] = Field(default_factory=list)
+    added: List[AddedElement] = Field(default_factory=list)
+    title: Optional[str] = None
+    url: Optional[str] = None
+
+class PageSessionInfo(BaseModel):
+    page_id: str
+    fingerprint: str
+    element_count: int
+    expires_in: float
 
 # --- LLM Structured Output Models ---
 
@@ -38,3 +135,16 @@ class TourPlan(BaseModel):
 class ChatResponse(BaseModel):
     answer: str = Field(description="The answer to the user's question based on the page content")
     suggestions: List[str] = Field(description="List of 3 short follow-up questions the user might ask next")
+
+class DigestElement(BaseModel):
+    element_selector: str = Field(description="Exact CSS selector of the element, copied from the element list")
+    description: str = Field(description="What the element shows or lets the user do, in a few words")
+
+class DigestSection(BaseModel):
+    title: str = Field(description="Title of the section, usually its heading")
+    summary: str = Field(description="One sentence on what the section covers")
+    key_elements: List[DigestElement] = Field(description="Up to 4 elements a tour of this section would point at")
+
+class PageDigest(BaseModel):
+    summary: str = Field(description="One or two sentences on what the page is for")
+    sections: List[DigestSection] = Field(description="The page's sections, in page order")
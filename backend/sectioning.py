@@ -0,0 +1,176 @@
+"""
+Map-reduce tours for large pages.
+
+split_sections() cuts the element list into document-order sections at
+headings and packs them into at most TOUR_MAX_SECTIONS chunks of similar
+size, so each chunk is one small tour generation that can run in parallel.
+TourMerger then stitches the per-section steps back together without another
+model call: steps are put in page order, repeated elements and near-identical
+narration are dropped, and the first step of each new section gets a short
+spoken transition.
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from compaction import HEADING_TAGS, compact_line
+from schemas import PageElement, TourStep
+from selector_repair import ALWAYS_VALID, element_selector, normalize_selector
+from text_utils import estimate_tokens, tokenize
+
+# Pages at or above either size are toured section by section
+TOUR_MAP_REDUCE_MIN_ELEMENTS = int(os.environ.get("TOUR_MAP_REDUCE_MIN_ELEMENTS", "400"))
+TOUR_MAP_REDUCE_MIN_TOKENS = int(os.environ.get("TOUR_MAP_REDUCE_MIN_TOKENS", "8000"))
+TOUR_MAX_SECTIONS = int(os.environ.get("TOUR_MAX_SECTIONS", "8"))
+TOUR_SECTION_MIN_TOKENS = int(os.environ.get("TOUR_SECTION_MIN_TOKENS", "1000"))
+TOUR_SECTION_CONCURRENCY = int(os.environ.get("TOUR_SECTION_CONCURRENCY", "8"))
+# Steps for the whole tour, shared out between the sections
+TOUR_MAX_STEPS = int(os.environ.get("TOUR_MAX_STEPS", "16"))
+
+# Headings that open a new section
+SECTION_TAGS = frozenset({"H1", "H2", "H3"})
+DUPLICATE_NARRATIVE_SIMILARITY = 0.8
+
+
+@dataclass
+class Section:
+    index: int
+    title: str
+    elements: List[PageElement]
+    tokens: int
+
+
+def element_tokens(el: PageElement) -> int:
+    return estimate_tokens(compact_line(el, with_selectors=True)) + 1
+
+
+def is_large_page(elements: List[PageElement]) -> bool:
+    if len(elements) >= TOUR_MAP_REDUCE_MIN_ELEMENTS:
+        return True
+    return sum(element_tokens(el) for el in elements) >= TOUR_MAP_REDUCE_MIN_TOKENS
+
+
+def _title(elements: List[PageElement], fallback: str) -> str:
+    first = elements[0]
+    if first.tagName in HEADING_TAGS and first.text.strip():
+        return " ".join(first.text.split())[:80]
+    return fallback
+
+
+def split_sections(elements: List[PageElement], page_title: str = "",
+                   max_sections: int = TOUR_MAX_SECTIONS, min_tokens: int = TOUR_SECTION_MIN_TOKENS) -> List[Section]:
+    """
+    Document-order sections of roughly equal token size, at most
+    `max_sections` of them. Boundaries fall on H1-H3 headings; a run without
+    headings larger than the target size is cut by size instead.
+    """
+    costs = [element_tokens(el) for el in elements]
+    total = sum(costs)
+    if not elements:
+        return []
+    target = max(min_tokens, math.ceil(total / max(1, max_sections)))
+
+    # Heading-delimited blocks, with oversized blocks cut to the target size
+    blocks: List[List[int]] = [[]]
+    size = 0
+    for i, el in enumerate(elements):
+        if blocks[-1] and (el.tagName in SECTION_TAGS or size + costs[i] > target):
+            blocks.append([])
+            size = 0
+        blocks[-1].append(i)
+        size += costs[i]
+
+    # Pack consecutive blocks into sections of about the target size
+    packed: List[List[int]] = []
+    size = 0
+    for block in blocks:
+        block_size = sum(costs[i] for i in block)
+        if packed and size + block_size / 2 <= target:
+            packed[-1] += block
+            size += block_size
+        else:
+            packed.append(list(block))
+            size = block_size
+
+    # Packing is greedy, so it can overshoot the count; merge the smallest neighbours
+    while len(packed) > max_sections:
+        sizes = [sum(costs[i] for i in section) for section in packed]
+        pair = min(range(len(packed) - 1), key=lambda k: sizes[k] + sizes[k + 1])
+        packed[pair:pair + 2] = [packed[pair] + packed[pair + 1]]
+
+    sections = []
+    title = page_title or "the start of the page"
+    for index, members in enumerate(packed):
+        section_elements = [elements[i] for i in members]
+        title = _title(section_elements, f"{title.removesuffix(' (continued)')} (continued)" if index else title)
+        sections.append(Section(index, title, section_elements, sum(costs[i] for i in members)))
+    return sections
+
+
+def steps_per_section(sections: int, max_steps: int = TOUR_MAX_STEPS) -> int:
+    # Rounded down so the last sections still get their share
+    return max(1, max_steps // max(1, sections))
+
+
+def section_intent(intent: str, section: Section, count: int, steps: int) -> str:
+    return (f"{intent}. This is part {section.index + 1} of {count} of a long page, the part about "
+            f"\"{section.title}\". Only cover the elements listed, in at most {steps} steps, and do not "
+            f"welcome the user or wrap up the tour unless this is the first or last part.")
+
+
+def transition(title: str, narrative: str) -> str:
+    """Short spoken bridge into the next section."""
+    lead = f"Moving on to {title.rstrip('.:!?')}."
+    return f"{lead} {narrative}" if not narrative.lower().startswith(("moving on", "next", "now")) else narrative
+
+
+class TourMerger:
+    """
+    Merges per-section steps in section order, as each section finishes, so
+    the result can be streamed. Steps inside a section are sorted by the
+    position of their element on the page.
+    """
+
+    def __init__(self, elements: List[PageElement], per_section: int, max_steps: int = TOUR_MAX_STEPS):
+        self.per_section = per_section
+        self.max_steps = max_steps
+        self._positions: Dict[str, int] = {}
+        for i, el in enumerate(elements):
+            selector = element_selector(el)
+            if selector:
+                self._positions.setdefault(normalize_selector(selector), i)
+        self._selectors: Set[str] = set()
+        self._narratives: List[Set[str]] = []
+        self.steps: List[TourStep] = []
+        self.duplicates = 0
+
+    def _position(self, step: TourStep) -> Optional[int]:
+        return self._positions.get(normalize_selector(step.element_selector))
+
+    def _duplicate(self, step: TourStep) -> bool:
+        selector = normalize_selector(step.element_selector)
+        if selector not in ALWAYS_VALID and selector in self._selectors:
+            return True
+        words = set(tokenize(step.narrative))
+        return bool(words) and any(
+            len(words & seen) >= DUPLICATE_NARRATIVE_SIMILARITY * len(words | seen) for seen in self._narratives)
+
+    def add(self, section: Section, steps: List[TourStep]) -> List[TourStep]:
+        """Adds one section's steps; returns the ones kept, ready to send."""
+        ordered = sorted(enumerate(steps), key=lambda pair: (self._position(pair[1]) is None,
+                                                             self._position(pair[1]) or 0, pair[0]))
+        kept = []
+        for _, step in ordered:
+            if len(self.steps) >= self.max_steps or len(kept) >= self.per_section:
+                break
+            if self._duplicate(step):
+                self.duplicates += 1
+                continue
+            if not kept and self.steps and section.title:
+                step = step.model_copy(update={"narrative": transition(section.title, step.narrative)})
+            self._selectors.add(normalize_selector(step.element_selector))
+            self._narratives.append(set(tokenize(step.narrative)))
+            self.steps.append(step)
+            kept.append(step)
+        return kept
@@ -0,0 +1,130 @@
+"""
+Checks the selectors in a generated TourPlan against the elements the
+extension actually scanned, before the plan is cached or returned.
+
+A step whose selector matches a scanned element (by selector, #id or tag#id)
+is kept as is. Otherwise the step is snapped to the element whose text best
+matches the step's narrative (BM25 over the page, shared with chat
+retrieval), and dropped when nothing matches at all.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from retrieval import page_retriever
+from schemas import PageElement, TourPlan, TourStep
+
+# Always present, used by fallback and single-step tours
+ALWAYS_VALID = frozenset({"body", "html"})
+# Noise in a made-up selector that says nothing about the element
+_SELECTOR_NOISE = re.compile(r"nth-of-type|nth-child|[^a-zA-Z]+")
+_COMBINATOR_SPACES = re.compile(r"\s*([>+~])\s*")
+
+
+def normalize_selector(selector: str) -> str:
+    selector = _COMBINATOR_SPACES.sub(r" \1 ", " ".join(selector.split()))
+    for prefix in ("html > body > ", "body > "):
+        if selector.startswith(prefix):
+            return selector[len(prefix):]
+    return selector
+
+
+def element_selector(el: PageElement) -> str:
+    return el.selector or (f"#{el.id}" if el.id else "")
+
+
+@dataclass
+class RepairReport:
+    valid: int = 0
+    repaired: int = 0
+    dropped: int = 0
+    seconds: float = 0.0
+
+
+class SelectorIndex:
+    """Lookup from every accepted spelling of a scanned element's selector to its position."""
+
+    def __init__(self, page_key: str, elements: List[PageElement]):
+        self.page_key = page_key
+        self.elements = elements
+        self._lookup: Dict[str, int] = {}
+        for i, el in enumerate(elements):
+            keys = []
+            if el.selector:
+                keys.append(normalize_selector(el.selector))
+            if el.id:
+                keys += [f"#{el.id}", f"{el.tagName.lower()}#{el.id}"]
+            for key in keys:
+                self._lookup.setdefault(key, i)
+
+    def find(self, selector: str) -> Optional[int]:
+        return self._lookup.get(normalize_selector(selector))
+
+    def closest(self, step: TourStep) -> Optional[int]:
+        if not self.elements:
+            return None
+        query = f"{step.narrative} {_SELECTOR_NOISE.sub(' ', step.element_selector)}"
+        # Separate cache key: chat indexes the compacted element list under the bare fingerprint
+        scores = page_retriever.index_for(f"{self.page_key}:selectors", self.elements).scores(query)
+        # Best first; ties keep document order
+        for i in (-scores).argsort(kind="stable"):
+            if scores[i] <= 0:
+                return None
+            if element_selector(self.elements[int(i)]):
+                return int(i)
+        return None
+
+    def resolve(self, step: TourStep) -> Tuple[Optional[TourStep], str]:
+        """(step, "valid" | "repaired" | "dropped"); the step is None when dropped."""
+        selector = step.element_selector.strip()
+        if selector in ALWAYS_VALID or self.find(selector) is not None:
+            return step, "valid"
+        match = self.closest(step)
+        if match is None:
+            return None, "dropped"
+        return step.model_copy(update={"element_selector": element_selector(self.elements[match])}), "repaired"
+
+
+class SelectorRepairer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.plans = 0
+        self.steps = 0
+        self.repaired = 0
+        self.dropped = 0
+        self.seconds = 0.0
+
+    def repair_step(self, index: SelectorIndex, step: TourStep, report: RepairReport) -> Optional[TourStep]:
+        start = time.perf_counter()
+        resolved, status = index.resolve(step)
+        setattr(report, status, getattr(report, status) + 1)
+        report.seconds += time.perf_counter() - start
+        return resolved
+
+    def repair(self, index: SelectorIndex, plan: TourPlan) -> Tuple[TourPlan, RepairReport]:
+        report = RepairReport()
+        steps = [step for step in (self.repair_step(index, step, report) for step in plan.steps) if step is not None]
+        self.record(report)
+        return TourPlan(steps=steps), report
+
+    def record(self, report: RepairReport):
+        with self._lock:
+            self.plans += 1
+            self.steps += report.valid + report.repaired + report.dropped
+            self.repaired += report.repaired
+            self.dropped += report.dropped
+            self.seconds += report.seconds
+
+    def stats(self) -> dict:
+        return {
+            "plans": self.plans,
+            "steps": self.steps,
+            "repaired": self.repaired,
+            "dropped": self.dropped,
+            "avg_us_per_step": round(self.seconds / self.steps * 1e6, 1) if self.steps else 0.0,
+        }
+
+
+selector_repairer = SelectorRepairer()
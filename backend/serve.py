@@ -0,0 +1,151 @@
+"""
+Production server: several worker processes behind one listening socket.
+
+    python serve.py --workers 4 --port 8000
+
+The parent loads the app and builds its chains once, then forks the workers,
+which share that memory copy-on-write and accept connections from the same
+socket. With more than one worker, tours, page digests, page sessions and chat
+answers live in the shared SQLite database (SHARED_STATE_DB, state.db unless
+set), so a result computed by one worker is a hit in every other, and each
+worker schedules against 1/N of the Gemini quota. A worker that dies is
+replaced.
+
+SIGTERM or SIGINT drains: every worker stops accepting connections, finishes
+the requests it has (streams included) for up to --drain seconds, and exits.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_DRAIN_SECONDS = float(os.environ.get("SERVER_DRAIN_SECONDS", "30"))
+# Idle keep-alive connections are closed after this; keep it above the idle timeout of any proxy in front
+SERVER_KEEP_ALIVE_SECONDS = int(os.environ.get("SERVER_KEEP_ALIVE_SECONDS", "5"))
+# A worker that dies sooner than this after starting is restarted only after a pause
+MIN_WORKER_UPTIME_SECONDS = 1.0
+SHUTDOWN_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def log(message: str):
+    print(f"[serve {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args) -> int:
+    import uvicorn
+
+    # uvicorn drains on these and then re-raises them; the exit code is ours to set
+    for sig in SHUTDOWN_SIGNALS:
+        signal.signal(sig, lambda *_: None)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, SHUTDOWN_SIGNALS)
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_graceful_shutdown=args.drain,
+                            timeout_keep_alive=args.keep_alive)
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def supervise(spawn, workers: int, drain: float):
+    """Keeps `workers` children running until SIGTERM/SIGINT, then waits for them to drain."""
+    children = {}
+    stopping = []
+
+    def stop(signum, frame):
+        if not stopping:
+            log(f"draining {len(children)} workers")
+            stopping.append(time.monotonic())
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for index in range(workers):
+        children[spawn()] = time.monotonic()
+
+    while children:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            # Workers stuck past their own drain timeout
+            if stopping and time.monotonic() - stopping[0] > drain + 5:
+                for child in children:
+                    os.kill(child, signal.SIGKILL)
+            time.sleep(0.1)
+            continue
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        log(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if time.monotonic() - started < MIN_WORKER_UPTIME_SECONDS:
+            time.sleep(MIN_WORKER_UPTIME_SECONDS)
+        if not stopping:
+            children[spawn()] = time.monotonic()
+    log("all workers stopped")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    parser.add_argument("--drain", type=float, default=SERVER_DRAIN_SECONDS, help="seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--keep-alive", type=int, default=SERVER_KEEP_ALIVE_SECONDS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Before the defaults below, so values from .env win over them
+    load_dotenv()
+    workers = max(args.workers, 1)
+    if workers > 1:
+        if not hasattr(os, "fork"):
+            sys.exit("serve.py needs fork() for more than one worker; use --workers 1")
+        os.environ.setdefault("SHARED_STATE_DB", "state.db")
+        os.environ.setdefault("GEMINI_QUOTA_SHARE", str(1 / workers))
+
+    # Loaded once here and inherited by every worker
+    import main
+    if main.llm_available():
+        main.registry.warm()
+
+    sock = bind(args.host, args.port)
+    if workers == 1:
+        sys.exit(run_worker(main.app, sock, args))
+
+    log(f"listening on {args.host}:{args.port} with {workers} workers, shared state in {os.environ['SHARED_STATE_DB']}")
+    # Keep the preloaded objects out of the collector, so it does not touch (and copy) their pages in every worker
+    gc.freeze()
+
+    def spawn() -> int:
+        # Held until the child has its own handlers: the parent's would signal the other workers
+        signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
+        pid = os.fork()
+        if pid == 0:
+            code = run_worker(main.app, sock, args)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, SHUTDOWN_SIGNALS)
+        return pid
+
+    supervise(spawn, workers, args.drain)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,220 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from schemas import PageContent, PageDelta
+from shared_state import SHARED_STATE_DB, Database
+
+PAGE_SESSION_MAX = int(os.environ.get("PAGE_SESSION_MAX", "2048"))
+PAGE_SESSION_IDLE_SECONDS = float(os.environ.get("PAGE_SESSION_IDLE_SECONDS", "1800"))
+
+
+class PageNotFound(Exception):
+    """The page_id was never registered or has expired; clients should re-register the page."""
+
+
+def apply_page_delta(content: PageContent, delta: PageDelta) -> PageContent:
+    removed = set(delta.removed)
+    elements = [el for el in content.elements if el.selector not in removed]
+
+    positions = {el.selector: i for i, el in enumerate(elements) if el.selector}
+    for added in delta.added:
+        el = added.element()
+        existing = positions.get(el.selector) if el.selector else None
+        if existing is not None:
+            elements[existing] = el
+            continue
+        if added.index is None or added.index >= len(elements):
+            elements.append(el)
+        else:
+            elements.insert(max(added.index, 0), el)
+        positions = {e.selector: j for j, e in enumerate(elements) if e.selector}
+
+    return PageContent(
+        url=delta.url if delta.url is not None else content.url,
+        title=delta.title if delta.title is not None else content.title,
+        elements=elements,
+    )
+
+
+class PageSessionStore:
+    """
+    Registered pages keyed by an opaque id. Bounded LRU; sessions idle for
+    longer than idle_seconds expire. Every read refreshes the idle timer.
+    """
+
+    def __init__(self, max_sessions: int = PAGE_SESSION_MAX, idle_seconds: float = PAGE_SESSION_IDLE_SECONDS):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def create(self, content: PageContent) -> str:
+        page_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._purge_expired()
+            self._sessions[page_id] = (time.monotonic(), content)
+            self.created += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return page_id
+
+    def _touch(self, page_id: str, content: Optional[PageContent] = None) -> PageContent:
+        """Caller holds the lock. Refreshes the session, optionally replacing its page."""
+        entry = self._sessions.get(page_id)
+        if entry is None:
+            raise PageNotFound(page_id)
+        last_used, current = entry
+        if time.monotonic() - last_used > self.idle_seconds:
+            del self._sessions[page_id]
+            self.expirations += 1
+            raise PageNotFound(page_id)
+        content = current if content is None else content
+        self._sessions[page_id] = (time.monotonic(), content)
+        self._sessions.move_to_end(page_id)
+        return content
+
+    def get(self, page_id: str) -> PageContent:
+        with self._lock:
+            return self._touch(page_id)
+
+    def update(self, page_id: str, delta: PageDelta) -> PageContent:
+        # Read, apply and write under one lock, so concurrent deltas to a page are not lost
+        with self._lock:
+            return self._touch(page_id, apply_page_delta(self._touch(page_id), delta))
+
+    def delete(self, page_id: str) -> Optional[PageContent]:
+        with self._lock:
+            entry = self._sessions.pop(page_id, None)
+        return entry[1] if entry else None
+
+    def _purge_expired(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        # Oldest-used first, so stop at the first live session
+        while self._sessions:
+            page_id, (last_used, _) = next(iter(self._sessions.items()))
+            if last_used > cutoff:
+                break
+            del self._sessions[page_id]
+            self.expirations += 1
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "idle_seconds": self.idle_seconds,
+            "created": self.created,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SharedPageSessionStore(PageSessionStore):
+    """
+    Page sessions in the shared database, so a page registered with one worker
+    can be chatted with through any other. Each row carries a version bumped on
+    every update; the parsed page is kept in memory per version, so a read only
+    re-parses the page JSON after another worker changed it.
+    """
+
+    def __init__(self, path: str, max_sessions: int = PAGE_SESSION_MAX, idle_seconds: float = PAGE_SESSION_IDLE_SECONDS):
+        super().__init__(max_sessions, idle_seconds)
+        self._db = Database(path, [
+            "CREATE TABLE IF NOT EXISTS page_sessions (page_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+            "last_used REAL NOT NULL, content TEXT NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS page_sessions_last_used ON page_sessions (last_used)",
+        ])
+
+    def _remember(self, page_id: str, version: int, content: PageContent):
+        with self._lock:
+            self._sessions[page_id] = (version, content)
+            self._sessions.move_to_end(page_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def create(self, content: PageContent) -> str:
+        page_id = secrets.token_urlsafe(12)
+        # Wall clock: monotonic time is not comparable across processes
+        now = time.time()
+        with self._db.transaction() as conn:
+            purged = conn.execute("DELETE FROM page_sessions WHERE last_used < ?", (now - self.idle_seconds,)).rowcount
+            conn.execute("INSERT INTO page_sessions VALUES (?, 1, ?, ?)", (page_id, now, content.model_dump_json()))
+            # Least recently used sessions past the bound
+            evicted = conn.execute(
+                "DELETE FROM page_sessions WHERE page_id IN (SELECT page_id FROM page_sessions "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_sessions,)).rowcount
+        with self._lock:
+            self.created += 1
+            self.expirations += purged
+            self.evictions += evicted
+        self._remember(page_id, 1, content)
+        return page_id
+
+    def _load(self, page_id: str):
+        rows = self._db.execute("SELECT version, last_used FROM page_sessions WHERE page_id = ?", (page_id,))
+        if not rows:
+            with self._lock:
+                self._sessions.pop(page_id, None)
+            raise PageNotFound(page_id)
+        version, last_used = rows[0]
+        if time.time() - last_used > self.idle_seconds:
+            self.delete(page_id)
+            with self._lock:
+                self.expirations += 1
+            raise PageNotFound(page_id)
+
+        with self._lock:
+            local = self._sessions.get(page_id)
+        if local is not None and local[0] == version:
+            return version, local[1]
+        rows = self._db.execute("SELECT version, content FROM page_sessions WHERE page_id = ?", (page_id,))
+        if not rows:
+            raise PageNotFound(page_id)
+        version, content = rows[0][0], PageContent.model_validate_json(rows[0][1])
+        self._remember(page_id, version, content)
+        return version, content
+
+    def get(self, page_id: str) -> PageContent:
+        _, content = self._load(page_id)
+        self._db.execute("UPDATE page_sessions SET last_used = ? WHERE page_id = ?", (time.time(), page_id))
+        return content
+
+    def update(self, page_id: str, delta: PageDelta) -> PageContent:
+        # Optimistic: if another worker updated the page meanwhile, apply the delta to its version
+        while True:
+            version, content = self._load(page_id)
+            content = apply_page_delta(content, delta)
+            with self._db.transaction() as conn:
+                changed = conn.execute(
+                    "UPDATE page_sessions SET version = ?, last_used = ?, content = ? WHERE page_id = ? AND version = ?",
+                    (version + 1, time.time(), content.model_dump_json(), page_id, version)).rowcount
+            if changed:
+                self._remember(page_id, version + 1, content)
+                return content
+
+    def delete(self, page_id: str) -> Optional[PageContent]:
+        with self._db.transaction() as conn:
+            row = conn.execute("SELECT content FROM page_sessions WHERE page_id = ?", (page_id,)).fetchone()
+            conn.execute("DELETE FROM page_sessions WHERE page_id = ?", (page_id,))
+        with self._lock:
+            self._sessions.pop(page_id, None)
+        return PageContent.model_validate_json(row[0]) if row else None
+
+    def stats(self) -> dict:
+        cutoff = time.time() - self.idle_seconds
+        return {
+            **super().stats(),
+            "sessions": self._db.execute("SELECT COUNT(*) FROM page_sessions WHERE last_used >= ?", (cutoff,))[0][0],
+            "shared": True,
+        }
+
+
+page_sessions = SharedPageSessionStore(SHARED_STATE_DB) if SHARED_STATE_DB else PageSessionStore()
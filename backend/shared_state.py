@@ -0,0 +1,72 @@
+"""
+State shared by the worker processes of serve.py.
+
+SHARED_STATE_DB names one SQLite database that holds the tour and digest
+caches, page sessions and chat answers. It runs in WAL mode, so readers never
+wait for the writer and a write from one worker is visible to the next read
+in any other. With it set, a tour planned or a page registered by one worker
+is a hit in all of them and survives restarts; unset, every store keeps its
+state in its own process as before.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+SHARED_STATE_DB: Optional[str] = os.environ.get("SHARED_STATE_DB") or None
+# How long a writer waits for another process's write to finish
+SHARED_STATE_BUSY_TIMEOUT_MS = int(os.environ.get("SHARED_STATE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class Database:
+    """
+    A SQLite connection opened lazily, once per process.
+
+    SQLite connections must not be used across fork(): a worker forked from a
+    parent that already touched the database opens its own connection on first
+    use. `schema` statements run on every new connection.
+    """
+
+    def __init__(self, path: str, schema: Sequence[str] = ()):
+        self.path = path
+        self.schema = list(schema)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        # The parent's connections are kept, not closed: closing one in a child
+        # would drop the child's own POSIX locks on the file
+        self._inherited = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            if self._conn is not None:
+                self._inherited.append(self._conn)
+                self._lock = threading.Lock()
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout = {SHARED_STATE_BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            # Durable at each checkpoint rather than each commit; losing the last
+            # few cache writes in a power cut is fine
+            conn.execute("PRAGMA synchronous = NORMAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def execute(self, sql: str, params: Sequence = ()) -> list:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Statements that must see and change the database atomically across processes."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
@@ -0,0 +1,200 @@
+"""
+Speculative answers to chat suggestions.
+
+After a chat answer goes out, the three follow-up questions it suggested are
+answered in the background at the lowest scheduler priority and kept per
+page + question, so tapping a suggestion is answered without a model call (or
+joins the speculation still in flight). Speculation is opt-in, limited by a
+tokens-per-minute budget and a cap on concurrent calls, and never starts while
+the server is busy. Answers nobody asked for before they expired or were
+evicted are counted as wasted tokens.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Optional, Set
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+import concurrency
+import ratelimit
+from ratelimit import TokenBucket, scheduling
+
+SPECULATION_ENABLED = os.environ.get("SPECULATIVE_SUGGESTIONS", "false").lower() == "true"
+SPECULATION_TOKENS_PER_MINUTE = int(os.environ.get("SPECULATION_TOKENS_PER_MINUTE", "20000"))
+SPECULATION_MAX_IN_FLIGHT = int(os.environ.get("SPECULATION_MAX_IN_FLIGHT", "2"))
+SPECULATION_MAX_ENTRIES = int(os.environ.get("SPECULATION_MAX_ENTRIES", "1000"))
+SPECULATION_TTL_SECONDS = float(os.environ.get("SPECULATION_TTL_SECONDS", "600"))
+# Busy: this share of the admission slots taken, anything queued, or a model out of quota
+SPECULATION_BUSY_FRACTION = float(os.environ.get("SPECULATION_BUSY_FRACTION", "0.5"))
+
+
+def server_busy() -> bool:
+    # Looked up on every call, so a controller or scheduler swapped in (tests, loadgen) is the one checked
+    admission = concurrency.llm_admission
+    return (admission.queued > 0
+            or admission.in_flight >= SPECULATION_BUSY_FRACTION * admission.max_concurrency
+            or ratelimit.quota_scheduler.backlogged())
+
+
+@dataclass
+class Speculation:
+    task: asyncio.Task
+    created: float
+    tokens: int = 0
+
+
+class Speculator:
+    """
+    Runs fn() for keys the user is likely to ask next and hands the result to
+    the first take() of the same key. `busy()` is checked before every
+    speculation; anything truthy skips it.
+    """
+
+    def __init__(self, enabled: bool = SPECULATION_ENABLED,
+                 tokens_per_minute: int = SPECULATION_TOKENS_PER_MINUTE,
+                 max_in_flight: int = SPECULATION_MAX_IN_FLIGHT,
+                 max_entries: int = SPECULATION_MAX_ENTRIES,
+                 ttl_seconds: float = SPECULATION_TTL_SECONDS,
+                 busy: Callable[[], bool] = server_busy):
+        self.enabled = enabled
+        self.budget = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.busy = busy
+        self._entries: "OrderedDict[Hashable, Speculation]" = OrderedDict()
+        self._running: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+        self.skipped_in_flight = 0
+        self.lookups = 0
+        self.hits = 0
+        self.hits_in_flight = 0
+        self.tokens_spent = 0
+        self.tokens_used = 0
+        self.tokens_wasted = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable[object]]) -> bool:
+        """Starts speculating on `key` unless it is known, over budget or the server is busy."""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                return False
+            if self.busy():
+                self.skipped_busy += 1
+                return False
+            if self.in_flight >= self.max_in_flight:
+                self.skipped_in_flight += 1
+                return False
+            if self.budget.time_until(1, now) > 0:
+                self.skipped_budget += 1
+                return False
+
+            entry = Speculation(task=None, created=now)
+            entry.task = asyncio.ensure_future(self._run(entry, fn))
+            self._entries[key] = entry
+            self._running.add(entry.task)
+            entry.task.add_done_callback(self._running.discard)
+            self.started += 1
+            while len(self._entries) > self.max_entries:
+                self._discard(self._entries.popitem(last=False)[1])
+        return True
+
+    async def _run(self, entry: Speculation, fn: Callable[[], Awaitable[object]]) -> Optional[object]:
+        """fn()'s result, or None when it failed; nobody may be waiting to see the exception."""
+        with get_usage_metadata_callback() as usage:
+            try:
+                with scheduling(priority="speculative"):
+                    result = await fn()
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                result = None
+            finally:
+                entry.tokens = sum(counts.get("total_tokens", 0) for counts in usage.usage_metadata.values())
+                self.budget.take(entry.tokens, time.monotonic())
+                self.tokens_spent += entry.tokens
+        return result
+
+    async def take(self, key: Hashable) -> Optional[object]:
+        """The speculative result for `key`, waiting for it if still running; None on a miss or failure."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._expire(time.monotonic())
+            self.lookups += 1
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+
+        pending = not entry.task.done()
+        result = await asyncio.shield(entry.task)
+        if result is None:
+            self.tokens_wasted += entry.tokens
+            return None
+        self.hits += 1
+        self.hits_in_flight += pending
+        self.tokens_used += entry.tokens
+        return result
+
+    def _expire(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.created < self.ttl_seconds:
+                return
+            del self._entries[key]
+            self._discard(entry)
+
+    def _discard(self, entry: Speculation):
+        if entry.task.done():
+            self.tokens_wasted += entry.tokens
+        else:
+            # Counted once it finishes
+            entry.task.add_done_callback(lambda _: setattr(self, "tokens_wasted", self.tokens_wasted + entry.tokens))
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._discard(entry)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "in_flight": self.in_flight,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped_busy": self.skipped_busy,
+            "skipped_budget": self.skipped_budget,
+            "skipped_in_flight": self.skipped_in_flight,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hits_in_flight": self.hits_in_flight,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "used_ratio": round(self.hits / self.completed, 3) if self.completed else 0.0,
+            "tokens_spent": self.tokens_spent,
+            "tokens_used": self.tokens_used,
+            "tokens_wasted": self.tokens_wasted,
+            "wasted_token_ratio": round(self.tokens_wasted / self.tokens_spent, 3) if self.tokens_spent else 0.0,
+        }
+
+
+speculator = Speculator()
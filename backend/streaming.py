@@ -0,0 +1,89 @@
+import json
+from typing import List
+
+from pydantic import ValidationError
+
+from schemas import TourStep
+
+
+class TourStepStreamParser:
+    """
+    Incrementally pulls complete TourStep objects out of a partially streamed
+    TourPlan JSON document.
+
+    The scanner tracks string/escape state and nesting depth, so it only has
+    to look at each character once no matter how the text is chunked. Anything
+    before the "steps" array (markdown fences, preamble) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.steps: List[TourStep] = []
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = -1
+        self._done = False
+
+    def feed(self, chunk: str) -> List[TourStep]:
+        self.buffer += chunk
+        if self._done:
+            return []
+        if not self._in_array and not self._find_array():
+            return []
+        return self._scan()
+
+    def _find_array(self) -> bool:
+        key = self.buffer.find('"steps"')
+        if key == -1:
+            return False
+        bracket = self.buffer.find("[", key)
+        if bracket == -1:
+            return False
+        self._in_array = True
+        self._pos = bracket + 1
+        return True
+
+    def _scan(self) -> List[TourStep]:
+        found = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._object_start != -1:
+                    step = self._parse_step(buffer[self._object_start:i + 1])
+                    self._object_start = -1
+                    if step is not None:
+                        self.steps.append(step)
+                        found.append(step)
+            elif ch == "]" and self._depth == 0:
+                # End of the steps array, nothing further to stream
+                self._done = True
+                return found
+        self._pos = len(buffer)
+        return found
+
+    @staticmethod
+    def _parse_step(text: str):
+        try:
+            return TourStep.model_validate(json.loads(text))
+        except (ValueError, ValidationError):
+            return None
@@ -0,0 +1,80 @@
+import asyncio
+import sys
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from schemas import ChatResponse
+from concurrency import AdmissionController, Overloaded
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+CHAT = {
+    "query": "What is this page?",
+    "content": {"url": "https://example.com", "title": "Example", "elements": [{"tagName": "H1", "text": "Example Domain"}]}
+}
+
+
+class SlowChatChain:
+    """Stub chain: holds the slot like a slow Gemini call without any network."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def ainvoke(self, inputs):
+        await asyncio.sleep(self.delay)
+        return ChatResponse(answer="ok", suggestions=[])
+
+
+def run_concurrent(controller, chain, requests):
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/api/chat", json={**CHAT, "query": f"Question {i}"}) for i in range(requests)))
+
+    with patch.object(main, "llm_admission", controller), \
+            patch.object(main, "get_chat_chain", lambda model=None: chain), \
+            patch.dict(os.environ, VALID_KEY):
+        return asyncio.run(go())
+
+
+def test_queue_full_and_timeout_are_rejected():
+    async def go():
+        controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.05)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await controller.acquire()
+        with pytest.raises(Overloaded):
+            await waiter
+        controller.release()
+        assert controller.in_flight == 0 and controller.queued == 0
+        assert controller.rejected_queue_full == 1 and controller.rejected_timeout == 1
+
+    asyncio.run(go())
+
+
+def test_async_path_holds_more_requests_than_the_threadpool():
+    # Starlette's threadpool caps sync handlers at 40 concurrent calls
+    controller = AdmissionController(max_concurrency=200, max_queue=0, queue_timeout=1)
+    responses = run_concurrent(controller, SlowChatChain(0.2), 200)
+
+    assert all(r.status_code == 200 for r in responses)
+    assert controller.peak_in_flight == 200
+
+
+def test_overload_returns_503_with_retry_after():
+    controller = AdmissionController(max_concurrency=2, max_queue=2, queue_timeout=5)
+    responses = run_concurrent(controller, SlowChatChain(0.1), 10)
+
+    codes = sorted(r.status_code for r in responses)
+    assert codes.count(200) == 4
+    assert codes.count(503) == 6
+    rejected = next(r for r in responses if r.status_code == 503)
+    assert int(rejected.headers["Retry-After"]) >= 1
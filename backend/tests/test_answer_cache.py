@@ -0,0 +1,105 @@
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from answer_cache import AnswerCache, question_features
+from schemas import ChatResponse
+
+client = TestClient(main.app)
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+URL = "https://example.com/pricing"
+ANSWER = {"answer": "Plans start at $10.", "suggestions": ["a", "b", "c"]}
+
+PAGE = {
+    "url": URL,
+    "title": "Pricing",
+    "elements": [{"tagName": "H1", "text": "Simple pricing for every team", "selector": "h1"}]
+}
+
+
+def test_exact_and_paraphrased_questions_hit():
+    cache = AnswerCache(enabled=True)
+    cache.set(URL, "page", "What is the pricing?", ANSWER)
+
+    assert cache.get(URL, "page", "  what is the PRICING ") == (ANSWER, "exact")
+    assert cache.get(URL, "page", "How much does it cost?") == (ANSWER, "similar")
+    assert cache.get(URL, "page", "How do I sign up?") == (None, "miss")
+    # Answers belong to one page
+    assert cache.get(URL, "other-page", "What is the pricing?") == (None, "miss")
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_near_miss_questions_do_not_share_answers():
+    cache = AnswerCache(enabled=True)
+    cache.set(URL, "page", "Does it support Python?", ANSWER)
+    cache.set(URL, "page", "How do I install it on Windows?", ANSWER)
+
+    assert cache.get(URL, "page", "Does it support Java?")[0] is None
+    assert cache.get(URL, "page", "How do I install it on Linux?")[0] is None
+
+
+def test_questions_that_differ_by_a_name_or_an_opposite_miss():
+    cache = AnswerCache(enabled=True)
+    cache.set(URL, "page", "What is the price of plan A?", ANSWER)
+    cache.set(URL, "page", "How much is the v1 license?", ANSWER)
+    cache.set(URL, "page", "Is it cheap?", ANSWER)
+    cache.set(URL, "page", "Can I get a refund?", ANSWER)
+
+    assert cache.get(URL, "page", "What is the price of plan B?")[0] is None
+    assert cache.get(URL, "page", "How much is the v2 license?")[0] is None
+    assert cache.get(URL, "page", "Is it expensive?")[0] is None
+    assert cache.get(URL, "page", "Can I get money?")[0] is None
+    # The same name still matches a paraphrase
+    assert cache.get(URL, "page", "How much does plan A cost?") == (ANSWER, "similar")
+
+
+def test_synonyms_and_phrases_fold_together():
+    assert "w:price" in question_features("How much is the fee?")
+    assert "w:signup" in question_features("where do I sign up")
+
+
+def test_lru_bounds_ttl_and_page_change():
+    cache = AnswerCache(enabled=True, max_entries=2, max_per_page=2, ttl_seconds=60)
+    cache.set(URL, "v1", "What is the pricing?", ANSWER)
+    cache.set(URL, "v1", "Is there a free trial?", ANSWER)
+    cache.get(URL, "v1", "What is the pricing?")
+    cache.set(URL, "v1", "Where are the docs?", ANSWER)
+    # The trial question was least recently used
+    assert cache.get(URL, "v1", "Is there a free trial?", record=False)[0] is None
+    assert cache.get(URL, "v1", "What is the pricing?", record=False)[0] == ANSWER
+
+    # The same URL with a new fingerprint drops the old version's answers
+    cache.get(URL + "#plans", "v2", "anything")
+    assert cache.stats()["size"] == 0 and cache.stats()["invalidations"] == 1
+
+    expiring = AnswerCache(enabled=True, ttl_seconds=0.01)
+    expiring.set(URL, "v1", "What is the pricing?", ANSWER)
+    time.sleep(0.02)
+    assert expiring.get(URL, "v1", "What is the pricing?")[0] is None
+
+
+@patch("main.get_chat_chain")
+def test_chat_serves_paraphrases_from_cache(mock_get_chain):
+    mock_chain = MagicMock()
+    mock_chain.ainvoke = AsyncMock(return_value=ChatResponse(**ANSWER))
+    mock_get_chain.return_value = mock_chain
+
+    with patch.dict(os.environ, VALID_KEY), patch.object(main, "answer_cache", AnswerCache(enabled=True)):
+        first = client.post("/api/chat", json={"query": "What is the pricing?", "content": PAGE})
+        second = client.post("/api/chat", json={"query": "how much does it cost", "content": PAGE})
+        changed = client.post("/api/chat", json={"query": "What is the pricing?", "content": {**PAGE, "title": "New pricing"}})
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT" and second.headers["X-Cache-Match"] == "similar"
+    assert second.json()["response"] == ANSWER["answer"]
+    assert changed.headers["X-Cache"] == "MISS"
+    assert mock_chain.ainvoke.await_count == 2
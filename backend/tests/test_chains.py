@@ -0,0 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chains import ChainRegistry
+
+def test_registry_builds_each_key_once():
+    registry = ChainRegistry()
+    built = []
+    registry.register("tour", lambda model, temperature: built.append((model, temperature)) or object())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        chains = list(pool.map(lambda _: registry.get("tour", "m", 0.7), range(32)))
+
+    assert len(built) == 1
+    assert all(chain is chains[0] for chain in chains)
+    assert registry.get("tour", "m", 0.2) is not chains[0]
+    assert registry.stats()["builds"] == 2
@@ -0,0 +1,68 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas import parse_elements
+from compaction import (CompactionPipeline, CompactionState, chat_compactor, compact_line, containment_dedup, near_dedup,
+                        token_budget)
+
+
+def state(elements, budget=10_000):
+    return CompactionState(elements=parse_elements(elements), render=compact_line, token_budget=budget)
+
+
+def test_near_duplicate_list_items_collapse():
+    words = ["now", "today", "fast", "securely", "anywhere", "instantly", "easily", "reliably"]
+    items = [{"tagName": "LI", "text": "This connector syncs your analytics data into the warehouse in minutes "
+                                      f"with no code and no maintenance required {word}"} for word in words]
+    s = state(items)
+    near_dedup(s)
+    assert len(s.elements) == 2
+
+
+def test_rows_differing_only_by_numbers_are_kept():
+    releases = [("1.2.0", 4), ("1.3.0", 7), ("2.0.0", 12), ("2.1.0", 3)]
+    items = [{"tagName": "LI", "text": f"Release {version} ships {fixes} bug fixes and performance improvements"}
+             for version, fixes in releases]
+    s = state(items)
+    near_dedup(s)
+    assert len(s.elements) == 4
+    # And chat never runs near_dedup: any row may be the one that answers the question
+    assert "near_dedup" not in chat_compactor.step_names
+
+
+def test_container_text_already_in_children_is_dropped():
+    para = "This paragraph explains the history of the company in detail."
+    elements = [
+        {"tagName": "SECTION", "text": f"Our history {para}", "selector": "main > section"},
+        {"tagName": "H2", "text": "Our history", "selector": "main > section > h2"},
+        {"tagName": "P", "text": para, "selector": "main > section > p"},
+    ]
+    s = state(elements)
+    containment_dedup(s)
+    assert [el.tagName for el in s.elements] == ["H2", "P"]
+
+
+def test_budget_keeps_headings_and_document_order():
+    elements = []
+    for i in range(10):
+        elements.append({"tagName": "H2", "text": f"Heading {i}"})
+        elements.append({"tagName": "P", "text": "word " * 60})
+    s = state(elements, budget=120)
+    token_budget(s)
+    headings = [el for el in s.elements if el.tagName == "H2"]
+    assert len(headings) == 10
+    assert s.elements == [el for el in parse_elements(elements) if el in s.elements]
+
+
+def test_pipeline_reports_savings_per_step():
+    nav = [{"tagName": "A", "text": "Pricing and plans", "id": "", "selector": f"nav > a:nth-of-type({i})"} for i in range(5)]
+    pipeline = CompactionPipeline(["exact_dedup", "compact_encoding"])
+    result = pipeline.run(parse_elements(nav), page_key="page")
+
+    assert len(result.elements) == 1
+    assert result.saved_by_step["exact_dedup"] > 0
+    assert result.saved_by_step["compact_encoding"] > 0
+    assert result.text == "a| Pricing and plans"
+    assert pipeline.run(parse_elements(nav), page_key="page") is result
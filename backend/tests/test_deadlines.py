@@ -0,0 +1,163 @@
+import asyncio
+import json
+import sys
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import deadlines
+from concurrency import AdmissionController
+from ratelimit import DeadlineExceeded, QuotaScheduler
+from singleflight import SingleFlight
+
+# Two seconds to the first token: every request below would hang that long if not cancelled
+SLOW = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "2000", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+PAGE = {
+    "url": "https://example.com/slow",
+    "title": "Slow",
+    "elements": [{"tagName": "H1", "text": "A page served by a slow model", "selector": "h1"}],
+}
+
+
+async def call(path: str, payload: dict, headers=(), disconnect_after=None):
+    """Drives the app like a server would; the client hangs up after `disconnect_after` seconds."""
+    sent = []
+    body_read = False
+
+    async def receive():
+        nonlocal body_read
+        if not body_read:
+            body_read = True
+            return {"type": "http.request", "body": json.dumps(payload).encode(), "more_body": False}
+        if disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "client": ("test", 1), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json"), *[(k.lower().encode(), v.encode()) for k, v in headers]],
+    }
+    start = time.perf_counter()
+    await main.app(scope, receive, send)
+    await asyncio.sleep(0)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, body, time.perf_counter() - start
+
+
+def run_slow(coro_fn):
+    controller = AdmissionController(max_concurrency=4)
+    flight = SingleFlight()
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, SLOW), patch.object(main, "llm_admission", controller), \
+                patch.object(main, "inflight", flight):
+            result = asyncio.run(coro_fn())
+    finally:
+        main.registry.clear()
+    return result, controller, flight
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/api/chat", {"query": "What is this?", "content": PAGE}),
+    ("/api/analyze", PAGE),
+])
+def test_disconnect_cancels_generation_and_frees_the_slot(path, payload):
+    (status, _, seconds), controller, flight = run_slow(lambda: call(path, payload, disconnect_after=0.1))
+
+    assert status == 499
+    assert seconds < 1
+    assert controller.in_flight == 0 and controller.queued == 0
+    assert flight.stats()["abandoned"] == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_stream_stops_when_the_client_goes_away():
+    (status, body, seconds), controller, _ = run_slow(
+        lambda: call("/api/analyze/stream", PAGE, headers=[("Cache-Control", "no-store")], disconnect_after=0.1))
+
+    assert status == 200 and body == b""
+    assert seconds < 1
+    assert controller.in_flight == 0
+
+
+def test_deadline_header_gives_a_clean_504():
+    (status, body, seconds), controller, _ = run_slow(
+        lambda: call("/api/chat", {"query": "What is this?", "content": PAGE}, headers=[("X-Request-Timeout", "0.2")]))
+
+    assert status == 504
+    assert "Deadline exceeded" in json.loads(body)["detail"]
+    assert 0.15 < seconds < 1
+    assert controller.in_flight == 0
+
+
+def test_stream_reports_deadline_and_releases_slot():
+    (status, body, seconds), controller, _ = run_slow(
+        lambda: call("/api/analyze/stream", PAGE, headers=[("X-Request-Timeout", "0.2"), ("Cache-Control", "no-store")]))
+
+    events = [json.loads(line) for line in body.decode().splitlines()]
+    assert status == 200
+    assert events[-1]["type"] == "error" and events[-1]["status"] == 504
+    assert seconds < 1
+    assert controller.in_flight == 0
+
+
+def test_client_timeouts_are_capped_by_the_server():
+    now = time.monotonic()
+    with patch.object(deadlines, "REQUEST_TIMEOUT_MAX_SECONDS", 30):
+        assert deadlines.request_deadline("chat", "5") - now == pytest.approx(5, abs=0.1)
+        assert deadlines.request_deadline("chat", "3600") - now == pytest.approx(30, abs=0.1)
+        # Missing or unusable values fall back to the priority's default
+        assert deadlines.request_deadline("chat", "soon") - now == pytest.approx(20, abs=0.1)
+        assert deadlines.request_deadline("chat", "-1") - now == pytest.approx(20, abs=0.1)
+
+
+def test_scheduler_bounds_the_call_itself():
+    async def go():
+        scheduler = QuotaScheduler()
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.call("model", 10, slow, deadline=time.monotonic() + 0.05)
+        return scheduler.stats()
+
+    stats = asyncio.run(go())
+    # Not retried: the budget is gone
+    assert stats["calls_timed_out"] == 1 and stats["retries"] == 0
+
+
+def test_shared_call_is_cancelled_when_every_waiter_leaves():
+    async def go():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("page", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 0.5)
+        return flight.stats()
+
+    stats = asyncio.run(go())
+    assert stats["abandoned"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,84 @@
+import sys
+import os
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from ratelimit import quota_scheduler
+from chains import build_tour_generator_chain, build_chat_chain, build_tour_stream_chain, tour_plan_parser
+from fake_llm import FakeGeminiChatModel
+from schemas import ChatResponse, TourPlan
+
+client = TestClient(main.app)
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+PAGE = {
+    "url": "https://example.com/fake",
+    "title": "Fake",
+    "elements": [
+        {"tagName": "H1", "text": "Welcome to the fake page", "selector": "h1"},
+        {"tagName": "P", "text": "It explains how the fake model works.", "selector": "main > p"},
+    ],
+}
+
+TOUR_INPUTS = {"user_intent": "Give me a general tour", "page_title": "Fake", "dom_elements": "h1 h1| Welcome\np main > p| Body text"}
+
+
+def test_tour_chain_returns_valid_plan_with_prompt_selectors():
+    with patch.dict(os.environ, FAST):
+        plan = build_tour_generator_chain().invoke(TOUR_INPUTS)
+
+    assert isinstance(plan, TourPlan)
+    assert [step.element_selector for step in plan.steps] == ["h1", "main > p"]
+
+
+def test_chat_chain_echoes_query():
+    with patch.dict(os.environ, FAST):
+        result = build_chat_chain().invoke({"page_title": "Fake", "page_content": "h1| Welcome", "query": "What is this?"})
+
+    assert isinstance(result, ChatResponse)
+    assert "What is this?" in result.answer
+    assert len(result.suggestions) == 3
+
+
+def test_stream_chain_chunks_parse_to_plan():
+    with patch.dict(os.environ, FAST):
+        chunks = list(build_tour_stream_chain().stream(TOUR_INPUTS))
+
+    assert len(chunks) > 1
+    assert len(tour_plan_parser.parse("".join(chunks)).steps) == 2
+
+
+def test_seeded_failures_are_deterministic():
+    def outcomes(seed):
+        model = FakeGeminiChatModel(ttft_seconds=0, tokens_per_second=1e6, rate_limit_rate=0.3, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                model.invoke("User Query: hi")
+                results.append("ok")
+            except Exception as e:
+                results.append(type(e).__name__)
+        return results
+
+    assert outcomes(7) == outcomes(7)
+    assert "FakeRateLimitError" in outcomes(7)
+
+
+def test_injected_429_serves_degraded_tour_and_chat():
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, {**FAST, "FAKE_LLM_429_RATE": "1"}), patch.object(quota_scheduler, "max_retries", 0):
+            tour = client.post("/api/analyze", json=PAGE, headers={"Cache-Control": "no-store"})
+            chat = client.post("/api/chat", json={"query": "Hi?", "content": PAGE})
+    finally:
+        main.registry.clear()
+
+    # A 429 that outlasts the retries is handled like exhausted quota, not a dead "quota exceeded" step
+    assert tour.status_code == 200 and tour.headers["X-Degraded"] == "rate-limited"
+    assert tour.json()["steps"] and tour.json()["steps"][0]["action"] != "none"
+    assert chat.status_code == 200 and chat.headers["X-Degraded"] == "rate-limited"
@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from schemas import PageContent, PageElement
+
+client = TestClient(app)
+
+
+def test_elements_are_validated_into_records():
+    content = PageContent.model_validate_json(
+        '{"url": "u", "title": "t", "elements": [{"tagName": "h1", "text": "Hello"}, {"tagName": "IMG"}]}'
+    )
+    assert content.elements == [PageElement(tagName="H1", text="Hello"), PageElement(tagName="IMG")]
+    assert content.model_dump()["elements"][0] == {"tagName": "H1", "text": "Hello", "id": "", "className": "", "selector": ""}
+
+
+def test_malformed_elements_are_rejected_on_both_endpoints():
+    page = {"url": "u", "title": "t", "elements": [{"text": "no tag"}]}
+    assert client.post("/api/analyze", json=page).status_code == 422
+    assert client.post("/api/chat", json={"query": "q", "content": page}).status_code == 422
@@ -0,0 +1,102 @@
+import sys
+import os
+import asyncio
+import random
+from unittest.mock import patch
+
+import httpx
+from langchain_core.callbacks import get_usage_metadata_callback
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from digest import digest_cache, digest_cache_key, intent_context, normalize_intent, prepare_digest
+from schemas import PageContent, PageDigest
+from tour_cache import tour_cache, tour_cache_key
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+TOPICS = ["pricing", "signup", "security", "integrations", "support", "limits"]
+WORDS = ("plan account workspace project request dashboard setting admin invoice report webhook region "
+         "backup audit session password email browser mobile storage upload download").split()
+
+
+def handbook() -> dict:
+    rng = random.Random(7)
+    elements = [{"tagName": "H1", "text": "Product handbook", "selector": "h1"}]
+    for topic in TOPICS:
+        elements.append({"tagName": "H2", "text": f"{topic.title()} guide", "selector": f"#{topic}"})
+        for p in range(30):
+            elements.append({"tagName": "P", "selector": f"#{topic} ~ p:nth-of-type({p + 1})",
+                             "text": f"Paragraph {p} about {topic}: " + " ".join(rng.choice(WORDS) for _ in range(20))})
+        elements.append({"tagName": "BUTTON", "text": f"Open {topic} settings", "selector": f"#{topic}-cta"})
+    return {"url": "https://example.com/handbook", "title": "Handbook", "elements": elements}
+
+
+def test_digest_selectors_are_checked_and_rendered():
+    content = PageContent(**handbook())
+    digest = PageDigest.model_validate({"summary": "A product handbook.", "sections": [
+        {"title": "Pricing guide", "summary": "What plans cost.", "key_elements": [
+            {"element_selector": "#pricing", "description": "Pricing heading"},
+            {"element_selector": "button.open-pricing", "description": "Open pricing settings"},
+            {"element_selector": "#nowhere", "description": "zzz"},
+        ]},
+    ]})
+
+    value = prepare_digest(content, digest)
+    keys = value["digest"]["sections"][0]["key_elements"]
+
+    # Made-up selectors are snapped to the matching element or dropped
+    assert [k["element_selector"] for k in keys] == ["#pricing", "#pricing-cta"]
+    assert value["dropped"] == 1
+    assert "section| 1. Pricing guide: What plans cost." in value["outline"]
+    assert "button #pricing-cta| Open pricing settings" in value["outline"]
+
+    context = intent_context(content, value, "open the security settings", top_k=3)
+    assert context.startswith(value["outline"])
+    assert "button #security-cta| Open security settings" in context
+    assert context.count("#pricing-cta") == 1
+
+
+def test_intents_are_normalized():
+    assert normalize_intent(None, main.TOUR_INTENT) == main.TOUR_INTENT
+    assert normalize_intent("  give me a GENERAL tour ", main.TOUR_INTENT) == main.TOUR_INTENT
+    assert normalize_intent(" show   me pricing ", main.TOUR_INTENT) == "show me pricing"
+
+
+def test_intent_tours_are_planned_from_the_cached_digest():
+    page = handbook()
+    content = PageContent(**page)
+    intents = ["Show me pricing", "Walk me through signup"]
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            results = []
+            for intent in intents + intents[:1]:
+                with get_usage_metadata_callback() as usage:
+                    response = await client.post("/api/analyze", params={"intent": intent}, json=page)
+                prompt = sum(counts["input_tokens"] for counts in usage.usage_metadata.values())
+                results.append((response, prompt))
+                # The first intent starts the digest in the background
+                await asyncio.gather(*main.digest_builds)
+            too_long = await client.post("/api/analyze", params={"intent": "x" * 500}, json=page)
+        return results, too_long
+
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST):
+            (first, second, repeat), too_long = asyncio.run(run())
+    finally:
+        main.registry.clear()
+        for intent in intents:
+            tour_cache.invalidate(tour_cache_key(content, intent))
+        cached_digest = digest_cache.get(digest_cache_key(content))
+        digest_cache.invalidate(digest_cache_key(content))
+
+    assert first[0].status_code == 200 and first[0].json()["steps"]
+    assert cached_digest is not None and cached_digest["digest"]["sections"]
+    # Later intents send the digest instead of the page
+    assert second[0].json()["steps"] and second[1] < first[1] / 2
+    assert repeat[0].headers["X-Cache"] == "HIT" and repeat[1] == 0
+    assert too_long.status_code == 422
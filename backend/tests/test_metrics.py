@@ -0,0 +1,94 @@
+import sys
+import os
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from ratelimit import quota_scheduler
+import metrics
+from fastapi import FastAPI
+
+client = TestClient(main.app)
+
+FAKE = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+PAGE = {
+    "url": "https://example.com/metrics",
+    "title": "Metrics",
+    "elements": [{"tagName": "H1", "text": "Observability page", "selector": "h1"}],
+}
+
+
+def sample(text, name, **labels):
+    """Value of one sample line in the exposition text, or None."""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    prefix = f"{name}{{{wanted}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.MetricsRegistry()
+    with patch.object(metrics, "REGISTRY", registry):
+        histogram = metrics.Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1))
+    histogram.labels("llm").observe(0.05)
+    histogram.labels("llm").observe(0.5)
+    histogram.labels("llm").observe(5)
+
+    text = registry.render()
+    assert sample(text, "tourguide_test_seconds_bucket", stage="llm", le="0.1") == 1
+    assert sample(text, "tourguide_test_seconds_bucket", stage="llm", le="1.0") == 2
+    assert sample(text, "tourguide_test_seconds_bucket", stage="llm", le="+Inf") == 3
+    assert sample(text, "tourguide_test_seconds_count", stage="llm") == 3
+    assert sample(text, "tourguide_test_seconds_sum", stage="llm") == 5.55
+
+
+def test_chat_request_records_stages_tokens_and_component_stats():
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAKE):
+            response = client.post("/api/chat", json={"query": "What is observability?", "content": PAGE})
+    finally:
+        main.registry.clear()
+    assert response.status_code == 200
+
+    text = client.get("/metrics").text
+    for stage_name in ("request_parse", "compaction", "retrieval", "prompt_render", "llm", "output_parse"):
+        assert sample(text, "tourguide_stage_seconds_count", endpoint="chat", stage=stage_name) >= 1, stage_name
+    assert sample(text, "tourguide_llm_tokens_total", endpoint="chat", kind="prompt") > 0
+    assert sample(text, "tourguide_llm_tokens_total", endpoint="chat", kind="completion") > 0
+    assert sample(text, "tourguide_llm_calls_in_flight", endpoint="chat") == 0
+    assert sample(text, "tourguide_http_request_seconds_count", method="POST", route="/api/chat", status="200") >= 1
+    assert sample(text, "tourguide_coalescing_calls") >= 1
+
+
+def test_errors_are_counted_by_class():
+    before = metrics.ERRORS.labels("tour", "rate_limited").value
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, {**FAKE, "FAKE_LLM_429_RATE": "1"}), patch.object(quota_scheduler, "max_retries", 0):
+            client.post("/api/analyze", json=PAGE, headers={"Cache-Control": "no-store"})
+    finally:
+        main.registry.clear()
+
+    assert metrics.ERRORS.labels("tour", "rate_limited").value == before + 1
+
+
+def test_server_timing_header_lists_stages():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware, server_timing_header=True)
+
+    @app.get("/work")
+    def work():
+        with metrics.stage("test", "compaction"):
+            pass
+        return {"ok": True}
+
+    header = TestClient(app).get("/work").headers["server-timing"]
+    assert header.startswith("compaction;dur=")
+    assert "total;dur=" in header
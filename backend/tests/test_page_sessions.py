@@ -0,0 +1,136 @@
+import threading
+import time
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sessions
+from main import app
+from schemas import ChatResponse, PageContent, PageDelta
+from sessions import PageNotFound, PageSessionStore, apply_page_delta
+
+client = TestClient(app)
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+PAGE = {
+    "url": "https://example.com",
+    "title": "Example",
+    "elements": [
+        {"tagName": "H1", "text": "Welcome to the example", "selector": "h1"},
+        {"tagName": "P", "text": "The first paragraph of text", "selector": "p:nth-of-type(1)"},
+        {"tagName": "P", "text": "The second paragraph of text", "selector": "p:nth-of-type(2)"},
+    ]
+}
+
+
+def chat_chain():
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(return_value=ChatResponse(answer="It is an example.", suggestions=["More?"]))
+    return chain
+
+
+def test_delta_removes_replaces_and_inserts_by_selector():
+    delta = PageDelta(
+        removed=["p:nth-of-type(1)"],
+        added=[
+            {"tagName": "P", "text": "Edited second paragraph", "selector": "p:nth-of-type(2)"},
+            {"tagName": "H2", "text": "A new heading", "selector": "h2", "index": 1},
+        ],
+    )
+    updated = apply_page_delta(PageContent(**PAGE), delta)
+    assert [el.text for el in updated.elements] == ["Welcome to the example", "A new heading", "Edited second paragraph"]
+    assert updated.fingerprint() != PageContent(**PAGE).fingerprint()
+
+
+
+def test_delta_moves_an_element_removed_and_added_again():
+    # The extension's diffElements sends a move as both, with the new position
+    delta = PageDelta(removed=["h1"], added=[{"tagName": "H1", "text": "Welcome to the example", "selector": "h1", "index": 2}])
+    updated = apply_page_delta(PageContent(**PAGE), delta)
+    assert [el.selector for el in updated.elements] == ["p:nth-of-type(1)", "p:nth-of-type(2)", "h1"]
+
+def test_store_is_bounded_and_expires_idle_sessions():
+    store = PageSessionStore(max_sessions=2, idle_seconds=60)
+    first = store.create(PageContent(**PAGE))
+    store.create(PageContent(**PAGE))
+    store.create(PageContent(**PAGE))
+    with pytest.raises(PageNotFound):
+        store.get(first)
+
+    idle = PageSessionStore(idle_seconds=0.01)
+    page_id = idle.create(PageContent(**PAGE))
+    time.sleep(0.02)
+    with pytest.raises(PageNotFound):
+        idle.get(page_id)
+    assert idle.expirations == 1
+
+
+def test_concurrent_deltas_to_one_page_are_all_applied():
+    store = PageSessionStore()
+    page_id = store.create(PageContent(**PAGE))
+    apply = sessions.apply_page_delta
+
+    def slow_apply(content, delta):
+        # Widens the read-modify-write window a lost update would need
+        time.sleep(0.01)
+        return apply(content, delta)
+
+    def add(i):
+        store.update(page_id, PageDelta(added=[{"tagName": "P", "text": f"Added {i}", "selector": f"p#added-{i}"}]))
+
+    with patch.object(sessions, "apply_page_delta", slow_apply):
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(store.get(page_id).elements) == 3 + 8
+
+
+@pytest.mark.parametrize("added", [
+    {"text": "No tag name", "selector": "p#x"},
+    {"tagName": "P", "text": ["not", "text"], "selector": "p#x"},
+    {"tagName": "P", "text": "Bad index", "selector": "p#x", "index": "first"},
+])
+def test_malformed_delta_is_rejected_with_422(added):
+    page_id = client.post("/api/pages", json=PAGE).json()["page_id"]
+    response = client.patch(f"/api/pages/{page_id}", json={"added": [added]})
+    assert response.status_code == 422
+
+
+def test_chat_by_page_id_with_delta_update():
+    registered = client.post("/api/pages", json=PAGE)
+    assert registered.status_code == 201
+    page_id = registered.json()["page_id"]
+    assert registered.json()["element_count"] == 3
+
+    chain = chat_chain()
+    with patch("main.get_chat_chain", return_value=chain), patch.dict(os.environ, VALID_KEY):
+        response = client.post("/api/chat", json={"query": "What is this?", "page_id": page_id})
+        assert response.json()["response"] == "It is an example."
+
+        updated = client.patch(f"/api/pages/{page_id}", json={"added": [{"tagName": "P", "text": "Pricing starts at $5", "selector": "p#price"}]})
+        assert updated.json()["element_count"] == 4
+
+        client.post("/api/chat", json={"query": "Pricing?", "page_id": page_id})
+        assert "Pricing starts at $5" in chain.ainvoke.await_args.args[0]["page_content"]
+
+        # Old clients sending the full payload keep working
+        legacy = client.post("/api/chat", json={"query": "What is this?", "content": PAGE})
+        assert legacy.status_code == 200
+
+
+def test_unknown_page_id_is_404_and_analyze_accepts_page_id():
+    assert client.post("/api/chat", json={"query": "Hi", "page_id": "missing"}).status_code == 404
+    assert client.post("/api/chat", json={"query": "Hi"}).status_code == 422
+
+    page_id = client.post("/api/pages", json=PAGE).json()["page_id"]
+    response = client.post(f"/api/analyze?page_id={page_id}")
+    assert response.status_code == 200
+    assert "Example" in response.json()["steps"][0]["narrative"]
@@ -0,0 +1,121 @@
+import sys
+import os
+import asyncio
+import json
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import prewarm
+from dom_extract import MAX_ELEMENTS, extract_elements, page_from_html
+from tour_cache import tour_cache
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+HTML = """<!doctype html>
+<html><head><title>Docs &amp; Guides</title><link rel="canonical" href="https://example.com/docs"></head>
+<body>
+  <nav><a href="/">Home</a></nav>
+  <main id="main">
+    <h1>Getting started with the toolkit</h1>
+    <section>
+      <p>Install the package with a single command.</p>
+      <p>Then configure your project in the settings file.<p>An implicitly closed paragraph here.
+    </section>
+    <div hidden><p>This paragraph is hidden from view.</p></div>
+    <p style="display: none">Also hidden by inline style.</p>
+    <script>var ignored = "script text is not content";</script>
+    <img src="logo.png">
+  </main>
+</body></html>"""
+
+
+def test_extraction_follows_dom_scanner_rules():
+    elements = extract_elements(HTML)
+    by_text = {el["text"]: el for el in elements}
+
+    # Short links and hidden content are skipped; images are kept without text
+    assert "Home" not in by_text
+    assert not any("hidden" in el["text"].lower() for el in elements)
+    assert [el["tagName"] for el in elements] == ["H1", "SECTION", "P", "P", "P", "IMG"]
+    assert by_text["Getting started with the toolkit"]["selector"] == "main#main > h1"
+    assert by_text["Then configure your project in the settings file."]["selector"] == "main#main > section > p:nth-of-type(2)"
+    assert by_text["An implicitly closed paragraph here."]["selector"] == "main#main > section > p:nth-of-type(3)"
+    assert "script" not in elements[1]["text"]
+
+
+def test_extraction_caps_elements_and_text():
+    html = "<body>" + "".join(f"<p>{'paragraph number %d ' % i * 30}</p>" for i in range(MAX_ELEMENTS + 100)) + "</body>"
+    elements = extract_elements(html)
+
+    assert len(elements) == MAX_ELEMENTS
+    assert max(len(el["text"]) for el in elements) == 300
+
+
+def test_page_from_html_uses_canonical_url_and_title():
+    page = page_from_html(HTML)
+
+    assert page.url == "https://example.com/docs"
+    assert page.title == "Docs & Guides"
+
+
+def write_pages(folder):
+    with open(os.path.join(folder, "docs.html"), "w") as f:
+        f.write(HTML)
+    with open(os.path.join(folder, "landing.json"), "w") as f:
+        json.dump({
+            "url": "https://example.com/",
+            "title": "Landing",
+            "elements": [
+                {"tagName": "H1", "text": "A landing page for prewarming", "selector": "h1"},
+                {"tagName": "P", "text": "It describes the product in a sentence.", "selector": "main > p"},
+            ],
+        }, f)
+
+
+def run_prewarm(folder, journal, **kwargs):
+    lines = []
+    results = asyncio.run(prewarm.prewarm([folder], journal, workers=2, progress=lines.append, **kwargs))
+    return {os.path.basename(entry["source"]): entry for entry in results}, lines
+
+
+def test_prewarm_fills_tour_cache_and_resumes(tmp_path):
+    write_pages(tmp_path)
+    journal = str(tmp_path / "journal.jsonl")
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST):
+            first, lines = run_prewarm(str(tmp_path), journal)
+            second, _ = run_prewarm(str(tmp_path), journal)
+    finally:
+        main.registry.clear()
+
+    try:
+        assert {name: entry["status"] for name, entry in first.items()} == {"docs.html": "ok", "landing.json": "ok"}
+        assert len(lines) == 2 and lines[0].startswith("[1/2]")
+        for entry in first.values():
+            assert tour_cache.get(entry["key"])["steps"]
+            assert entry["prompt_tokens"] > 0 and entry["cost_usd"] > 0
+
+        # Completed pages are skipped on the next run without touching the model
+        assert {entry["status"] for entry in second.values()} == {"resumed"}
+    finally:
+        for entry in first.values():
+            tour_cache.invalidate(entry["key"])
+
+
+def test_prewarm_skips_pages_already_cached(tmp_path):
+    write_pages(tmp_path)
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST):
+            first, _ = run_prewarm(str(tmp_path), str(tmp_path / "a.jsonl"))
+            # A fresh journal still finds the tours in the cache
+            second, _ = run_prewarm(str(tmp_path), str(tmp_path / "b.jsonl"))
+    finally:
+        main.registry.clear()
+        for entry in first.values():
+            tour_cache.invalidate(entry["key"])
+
+    assert {entry["status"] for entry in second.values()} == {"cached"}
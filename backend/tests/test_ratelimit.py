@@ -0,0 +1,140 @@
+import asyncio
+import sys
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import ratelimit
+from fake_llm import FakeGeminiChatModel
+from ratelimit import QuotaScheduler, RateLimited, ScheduledModel, TokenBucket
+
+client = TestClient(main.app)
+
+FAKE = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+PAGE = {
+    "url": "https://example.com/quota",
+    "title": "Quota",
+    "elements": [
+        {"tagName": "H1", "text": "Pricing plans", "selector": "h1"},
+        {"tagName": "P", "text": "The team plan costs ten dollars per seat.", "selector": "main > p"},
+        {"tagName": "H2", "text": "Frequently asked questions", "selector": "#faq"},
+    ],
+}
+
+
+def drained(rpm=600):
+    scheduler = QuotaScheduler(quotas={"m": (rpm, 10 ** 9)}, backoff_base=0.001, seed=1)
+    scheduler.quota("m").requests.level = 0
+    return scheduler
+
+
+def test_token_bucket_refill_time():
+    bucket = TokenBucket(per_minute=60)
+    now = time.monotonic()
+    bucket.take(60, now)
+    assert bucket.time_until(1, now) == pytest.approx(1.0)
+    assert bucket.time_until(1, now + 0.5) == pytest.approx(0.5)
+    # Larger than capacity waits for a full bucket rather than forever
+    assert bucket.time_until(1000, now) == pytest.approx(60.0, rel=0.01)
+
+
+def test_chat_is_admitted_before_queued_tours_and_prewarm():
+    scheduler = drained()
+    order = []
+
+    async def call(priority):
+        await scheduler.acquire("m", 10, priority)
+        order.append(priority)
+
+    async def run():
+        tasks = []
+        for priority in ("prewarm", "tour", "chat"):
+            tasks.append(asyncio.create_task(call(priority)))
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["chat", "tour", "prewarm"]
+    assert scheduler.waited == 3
+
+
+def test_wait_past_deadline_fails_fast():
+    scheduler = drained(rpm=1)
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(RateLimited):
+            await scheduler.acquire("m", 10, "chat", deadline=start + 1)
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.1
+    assert scheduler.deadline_exceeded == 1
+    assert scheduler.quota("m").waiters == []
+
+
+def test_fake_429s_are_retried_with_backoff():
+    scheduler = QuotaScheduler(quotas={}, max_retries=20, backoff_base=0.001, seed=1)
+    fake = FakeGeminiChatModel(ttft_seconds=0, tokens_per_second=1e6, rate_limit_rate=0.6, seed=3)
+    model = ScheduledModel(fake, "m", "chat", scheduler=scheduler)
+
+    result = asyncio.run(model.ainvoke("User Query: hello"))
+
+    assert "hello" in result.content
+    assert scheduler.retries > 0
+    assert scheduler.rate_limit_errors == scheduler.retries
+    assert scheduler.admitted == scheduler.retries + 1
+
+
+@pytest.mark.parametrize("usage_per_chunk", [False, True])
+def test_stream_settles_the_summed_usage_once(usage_per_chunk):
+    scheduler = QuotaScheduler(quotas={"m": (10 ** 6, 100000)}, seed=1)
+    # No refill while the test runs, so the level shows exactly what was settled
+    scheduler.quota("m").tokens.rate = 0
+    fake = FakeGeminiChatModel(ttft_seconds=0, tokens_per_second=1e6, usage_per_chunk=usage_per_chunk)
+    model = ScheduledModel(fake, "m", "chat", scheduler=scheduler)
+
+    async def run():
+        return [chunk async for chunk in model.astream("User Query: hello")]
+
+    chunks = asyncio.run(run())
+    used = sum(chunk.usage_metadata["total_tokens"] for chunk in chunks if chunk.usage_metadata)
+    assert len(chunks) > 3 and used > 0
+    # Each per-chunk delta refunding the reservation would leave the bucket (over)full
+    assert scheduler.quota("m").tokens.level == pytest.approx(100000 - used)
+
+
+def test_retries_stop_at_the_limit():
+    scheduler = QuotaScheduler(quotas={}, max_retries=2, backoff_base=0.001, seed=1)
+    fake = FakeGeminiChatModel(ttft_seconds=0, tokens_per_second=1e6, rate_limit_rate=1.0)
+    model = ScheduledModel(fake, "m", "chat", scheduler=scheduler)
+
+    with pytest.raises(RateLimited) as raised:
+        asyncio.run(model.ainvoke("User Query: hello"))
+    assert "429" in str(raised.value.__cause__)
+    assert scheduler.retries == 2
+
+
+def test_exhausted_quota_serves_degraded_tour_and_chat():
+    scheduler = QuotaScheduler(quotas={}, default_quota=(1, 10 ** 9))
+    for model in (main.model_router.fast_model, main.model_router.strong_model):
+        scheduler.quota(model).requests.level = 0
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAKE), patch.object(ratelimit, "quota_scheduler", scheduler):
+            tour = client.post("/api/analyze", json=PAGE, headers={"Cache-Control": "no-store"})
+            chat = client.post("/api/chat", json={"query": "How much does the team plan cost?", "content": PAGE})
+    finally:
+        main.registry.clear()
+
+    assert tour.headers["X-Degraded"] == "rate-limited"
+    assert [step["element_selector"] for step in tour.json()["steps"]] == ["h1", "#faq"]
+    assert chat.headers["X-Degraded"] == "rate-limited"
+    assert "ten dollars per seat" in chat.json()["response"]
+    assert scheduler.deadline_exceeded == 2
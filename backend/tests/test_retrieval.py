@@ -0,0 +1,46 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import BM25Index, PageRetriever
+from schemas import parse_elements
+
+FILLER = [{"tagName": "P", "text": f"Filler paragraph number {i} about company history and culture."} for i in range(200)]
+ELEMENTS = parse_elements(
+    FILLER[:50]
+    + [{"tagName": "H2", "text": "Pricing plans"}]
+    + FILLER[50:150]
+    + [{"tagName": "P", "text": "The Pro plan costs $20 per month, billed annually."}]
+    + FILLER[150:]
+)
+
+
+def test_bm25_ranks_matching_documents_first():
+    index = BM25Index(["cats and dogs", "pricing for the pro plan", "dogs only"])
+    scores = index.scores("what is the pricing of the pro plan?")
+    assert scores.argmax() == 1
+    assert scores[0] == 0
+
+
+def test_select_keeps_relevant_elements_in_document_order_within_budget():
+    retriever = PageRetriever()
+    selected = retriever.select("page", ELEMENTS, "How much does the pro plan cost? pricing", top_k=5, token_budget=200)
+
+    texts = [el.text for el in selected]
+    assert "Pricing plans" in texts
+    assert "The Pro plan costs $20 per month, billed annually." in texts
+    assert texts.index("Pricing plans") < texts.index("The Pro plan costs $20 per month, billed annually.")
+    assert len(selected) <= 5
+    assert retriever.stats()["prompt_reduction"] > 0.9
+
+
+def test_small_pages_pass_through_and_indexes_are_cached():
+    retriever = PageRetriever()
+    small = ELEMENTS[:3]
+    assert retriever.select("small", small, "anything") == small
+
+    retriever.select("page", ELEMENTS, "pricing", token_budget=100)
+    retriever.select("page", ELEMENTS, "history", token_budget=100)
+    stats = retriever.stats()
+    assert stats["index_builds"] == 1 and stats["index_hits"] == 1
@@ -0,0 +1,201 @@
+import asyncio
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from concurrency import AdmissionController
+from routing import ModelRouter, RouteDecision
+
+FAST, STRONG = "fast", "strong"
+
+
+def router(**kwargs):
+    options = dict(fast_model=FAST, strong_model=STRONG, fast_max_tokens={"chat": 1000}, hedge_min_samples=5)
+    options.update(kwargs)
+    return ModelRouter(**options)
+
+
+def warm(r, model, seconds, n=10, endpoint="chat"):
+    for _ in range(n):
+        r.latency.observe(endpoint, model, seconds)
+
+
+def test_routes_on_prompt_size():
+    r = router()
+    assert r.route("chat", 800) == RouteDecision(FAST, "small_prompt")
+    assert r.route("chat", 5000) == RouteDecision(STRONG, "large_prompt")
+    assert r.stats()["decisions"]["chat"] == {FAST: {"small_prompt": 1}, STRONG: {"large_prompt": 1}}
+
+
+def test_slow_model_is_routed_around():
+    r = router()
+    warm(r, FAST, 3.0)
+    warm(r, STRONG, 1.0)
+    assert r.route("chat", 800) == RouteDecision(STRONG, "latency")
+
+
+def test_disabled_router_uses_default_model():
+    r = router(enabled=False, default_model=STRONG)
+    assert r.route("chat", 10) == RouteDecision(STRONG, "disabled")
+
+
+def test_hedge_wins_when_primary_is_slow_and_loser_is_cancelled():
+    r = router()
+    warm(r, FAST, 0.02)
+    cancelled = []
+
+    async def call(model):
+        try:
+            await asyncio.sleep(1.0 if model == FAST else 0.05)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        return model
+
+    async def run():
+        result = await r.call("chat", RouteDecision(FAST, "small_prompt"), call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == STRONG
+    assert cancelled == [FAST]
+    assert r.stats()["hedge_win_rate"] == 1.0
+
+
+def test_hedge_takes_its_own_admission_slot_and_cancelled_loser_is_a_lower_bound():
+    admission = AdmissionController(max_concurrency=2)
+    assert admission.try_acquire()  # the request's own slot
+    r = router(admission=admission)
+    warm(r, FAST, 0.02)
+    peak = []
+
+    async def call(model):
+        peak.append(admission.in_flight)
+        await asyncio.sleep(1.0 if model == FAST else 0.05)
+        return model
+
+    async def run():
+        result = await r.call("chat", RouteDecision(FAST, "small_prompt"), call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == STRONG
+    assert peak == [1, 2] and admission.in_flight == 1
+    # The cancelled primary ran longer than it usually takes: its time so far counts
+    assert r.latency.count("chat", FAST) == 11 and r.latency.count("chat", STRONG) == 1
+    assert r.latency.ewma("chat", FAST) > 0.02
+
+
+def test_cancelled_hedge_shorter_than_usual_is_not_recorded():
+    r = router()
+    warm(r, FAST, 0.02)
+    warm(r, STRONG, 1.0)
+
+    async def call(model):
+        await asyncio.sleep(0.04 if model == FAST else 1.0)
+        return model
+
+    async def run():
+        r.hedge_delay = lambda endpoint, model: 0.01
+        result = await r.call("chat", RouteDecision(FAST, "small_prompt"), call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == FAST
+    assert r.hedges_started == 1 and r.latency.count("chat", STRONG) == 10
+
+
+def test_primary_that_slows_down_mid_run_is_routed_around():
+    r = router()
+    slow = False
+
+    async def call(model):
+        await asyncio.sleep(0.5 if model == FAST and slow else 0.005 if model == FAST else 0.01)
+        return model
+
+    async def run(n):
+        routed = []
+        for _ in range(n):
+            decision = r.route("chat", 800)
+            routed.append(decision)
+            await r.call("chat", decision, call)
+        await asyncio.sleep(0)
+        return routed
+
+    asyncio.run(run(10))
+    warm(r, STRONG, 0.01)
+    slow = True
+    routed = asyncio.run(run(20))
+
+    # Only cancelled calls say the fast model got slow; they are enough to move off it
+    assert RouteDecision(STRONG, "latency") in routed
+    switched = routed.index(RouteDecision(STRONG, "latency"))
+    assert all(decision.model == STRONG for decision in routed[switched:])
+    assert r.hedges_started <= switched
+
+
+def test_no_hedge_when_admission_is_saturated():
+    admission = AdmissionController(max_concurrency=1)
+    assert admission.try_acquire()
+    r = router(admission=admission)
+    warm(r, FAST, 0.01)
+    models = []
+
+    async def call(model):
+        models.append(model)
+        await asyncio.sleep(0.1)
+        return model
+
+    assert asyncio.run(r.call("chat", RouteDecision(FAST, "small_prompt"), call)) == FAST
+    assert models == [FAST]
+    assert r.stats()["hedges_skipped"] == 1 and r.hedges_started == 0
+    assert admission.in_flight == 1
+
+
+def test_fast_primary_is_not_hedged():
+    r = router()
+    warm(r, FAST, 0.5)
+    calls = []
+
+    async def call(model):
+        calls.append(model)
+        return model
+
+    assert asyncio.run(r.call("chat", RouteDecision(FAST, "small_prompt"), call)) == FAST
+    assert calls == [FAST]
+    assert r.hedges_started == 0
+
+
+def test_no_hedging_without_history():
+    r = router()
+    assert r.hedge_delay("chat", FAST) is None
+
+
+def test_failed_primary_falls_back_to_hedge_result():
+    r = router()
+    warm(r, FAST, 0.01)
+
+    async def call(model):
+        if model == FAST:
+            await asyncio.sleep(0.05)
+            raise RuntimeError("500 INTERNAL")
+        await asyncio.sleep(0.1)
+        return model
+
+    assert asyncio.run(r.call("chat", RouteDecision(FAST, "small_prompt"), call)) == STRONG
+    assert r.hedge_wins == 1
+
+
+def test_both_failing_raises_primary_error():
+    r = router()
+    warm(r, FAST, 0.01)
+
+    async def call(model):
+        await asyncio.sleep(0.05)
+        raise RuntimeError(f"{model} failed")
+
+    with pytest.raises(RuntimeError, match="fast failed"):
+        asyncio.run(r.call("chat", RouteDecision(FAST, "small_prompt"), call))
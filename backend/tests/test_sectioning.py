@@ -0,0 +1,139 @@
+import sys
+import os
+import json
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from concurrency import AdmissionController
+from schemas import PageContent, TourStep, parse_elements
+from sectioning import TourMerger, is_large_page, split_sections
+from tour_cache import tour_cache, tour_cache_key
+
+client = TestClient(main.app)
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+
+def long_page(chapters: int = 12, paragraphs: int = 60) -> dict:
+    elements = []
+    for c in range(chapters):
+        elements.append({"tagName": "H2", "text": f"Chapter {c} overview", "selector": f"#chapter-{c}"})
+        for p in range(paragraphs):
+            elements.append({"tagName": "P", "selector": f"#chapter-{c} ~ p:nth-of-type({p + 1})",
+                             "text": f"Chapter {c} paragraph {p}: " + " ".join(f"word{(c * 31 + p * 7 + i) % 97}" for i in range(20))})
+    return {"url": f"https://docs.example.com/long-{chapters}x{paragraphs}", "title": "Long docs", "elements": elements}
+
+
+def test_sections_follow_headings_and_document_order():
+    elements = parse_elements(long_page()["elements"])
+    sections = split_sections(elements, "Long docs", max_sections=4)
+
+    assert len(sections) == 4
+    assert [el for section in sections for el in section.elements] == elements
+    assert all(section.elements[0].tagName == "H2" for section in sections)
+    assert sections[1].title == sections[1].elements[0].text
+
+
+def test_headingless_runs_are_cut_by_size():
+    elements = parse_elements([{"tagName": "P", "text": "x" * 400, "selector": f"p:nth-of-type({i})"} for i in range(200)])
+    sections = split_sections(elements, "Wall of text", max_sections=5)
+
+    assert len(sections) == 5
+    assert sections[0].title == "Wall of text"
+    assert sections[1].title == "Wall of text (continued)"
+    assert max(s.tokens for s in sections) < 1.5 * min(s.tokens for s in sections)
+
+
+def test_merger_orders_dedupes_and_bridges_sections():
+    elements = parse_elements([{"tagName": "H2", "text": f"Heading {i}", "selector": f"#h{i}"} for i in range(6)])
+    sections = split_sections(elements, "Page", max_sections=2, min_tokens=1)
+    merger = TourMerger(elements, per_section=2)
+
+    first = merger.add(sections[0], [
+        TourStep(element_selector="#h2", narrative="The third heading covers deployment."),
+        TourStep(element_selector="#h0", narrative="Welcome, this heading introduces the guide."),
+    ])
+    second = merger.add(sections[1], [
+        TourStep(element_selector="#h0", narrative="Repeated element."),
+        TourStep(element_selector="#h4", narrative="Welcome, this heading introduces the guide."),
+        TourStep(element_selector="#h5", narrative="The last heading lists the limits."),
+    ])
+
+    assert [s.element_selector for s in first] == ["#h0", "#h2"]
+    assert [s.element_selector for s in second] == ["#h5"]
+    assert second[0].narrative.startswith(f"Moving on to {sections[1].title}.")
+    assert merger.duplicates == 2
+
+
+def test_large_page_tour_covers_the_whole_page():
+    page = long_page()
+    content = PageContent(**page)
+    assert is_large_page(content.elements)
+
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST):
+            response = client.post("/api/analyze", json=page, headers={"Cache-Control": "no-cache"})
+            streamed = client.post("/api/analyze/stream", json=page, headers={"Cache-Control": "no-store"})
+    finally:
+        main.registry.clear()
+        tour_cache.invalidate(tour_cache_key(content, main.TOUR_INTENT))
+
+    steps = response.json()["steps"]
+    sections = split_sections(content.elements, content.title)
+    owner = {el.selector: section.index for section in sections for el in section.elements}
+    # Every section contributed, so the tour reaches the end of the page
+    assert {owner.get(step["element_selector"]) for step in steps} >= set(range(len(sections)))
+    assert len({step["element_selector"] for step in steps}) == len(steps)
+
+    events = [json.loads(line) for line in streamed.text.splitlines()]
+    assert events[-1]["type"] == "plan"
+    assert [e["step"] for e in events if e["type"] == "step"] == events[-1]["plan"]["steps"]
+
+
+def test_failed_sections_are_skipped_and_not_cached():
+    page = long_page()
+    content = PageContent(**page)
+    key = tour_cache_key(content, main.TOUR_INTENT)
+    generate_section = main.generate_section
+
+    async def flaky(content, section, *args):
+        if section.index == 1:
+            raise RuntimeError("500 INTERNAL")
+        return await generate_section(content, section, *args)
+
+    tour_cache.invalidate(key)
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST), patch.object(main, "generate_section", flaky):
+            response = client.post("/api/analyze", json=page)
+    finally:
+        main.registry.clear()
+
+    assert response.status_code == 200 and response.json()["steps"]
+    assert tour_cache.get(key) is None
+
+
+def test_streamed_large_tour_takes_a_slot_per_section():
+    # MAX_CONCURRENT_LLM_CALLS=1: the stream must not hold a slot while its sections run, nor run them under one
+    page = long_page()
+    sections = split_sections(PageContent(**page).elements, page["title"])
+    controller = AdmissionController(max_concurrency=1, max_queue=16, queue_timeout=0.5)
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST), patch.object(main, "llm_admission", controller):
+            streamed = client.post("/api/analyze/stream", json=page, headers={"Cache-Control": "no-store"})
+    finally:
+        main.registry.clear()
+
+    events = [json.loads(line) for line in streamed.text.splitlines()]
+    assert not [e for e in events if e["type"] == "error"]
+    assert events[-1]["type"] == "plan" and events[-1]["plan"]["steps"]
+    # One admission check before the response starts, then one slot per section call
+    assert controller.admitted == len(sections) + 1
+    assert controller.peak_in_flight == 1
+    assert controller.rejected_timeout == 0 and controller.in_flight == 0
@@ -0,0 +1,95 @@
+import json
+import sys
+import os
+from unittest.mock import AsyncMock, patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from schemas import TourPlan, TourStep, parse_elements
+from selector_repair import RepairReport, SelectorIndex, SelectorRepairer
+
+client = TestClient(main.app)
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+ELEMENTS = [
+    {"tagName": "H1", "text": "Acme Cloud", "selector": "body > header > h1"},
+    {"tagName": "P", "text": "Pricing starts at ten dollars per seat each month.", "selector": "main > section:nth-of-type(2) > p"},
+    {"tagName": "A", "text": "Start free trial", "id": "signup", "selector": "main > a:nth-of-type(1)"},
+]
+
+PAGE = {"url": "https://example.com/repair", "title": "Repair", "elements": ELEMENTS}
+
+
+def step(selector, narrative="Here we are."):
+    return TourStep(element_selector=selector, narrative=narrative)
+
+
+def index():
+    return SelectorIndex("repair-test", parse_elements(ELEMENTS))
+
+
+def test_exact_and_equivalent_selectors_are_valid():
+    idx = index()
+    for selector in ("body > header > h1", "header>h1", "html > body > header > h1", "#signup", "a#signup", "body"):
+        assert idx.resolve(step(selector)) == (step(selector), "valid"), selector
+
+
+def test_made_up_selector_snaps_to_element_matching_the_narrative():
+    resolved, status = index().resolve(step(".pricing-text", "Let's look at the pricing: ten dollars per seat."))
+    assert status == "repaired"
+    assert resolved.element_selector == "main > section:nth-of-type(2) > p"
+    assert resolved.narrative == "Let's look at the pricing: ten dollars per seat."
+
+
+def test_unresolvable_step_is_dropped():
+    assert index().resolve(step("#newsletter", "Subscribe to the quarterly zine.")) == (None, "dropped")
+
+
+def test_repair_reports_counts():
+    plan = TourPlan(steps=[
+        step("header > h1"),
+        step("div.trial-button", "Click to start your free trial."),
+        step("#nowhere", "Completely unrelated words."),
+    ])
+    repaired, report = SelectorRepairer().repair(index(), plan)
+
+    assert [s.element_selector for s in repaired.steps] == ["header > h1", "main > a:nth-of-type(1)"]
+    assert (report.valid, report.repaired, report.dropped) == (1, 1, 1)
+
+
+def test_repair_is_well_under_a_millisecond_per_step():
+    corpus = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus", "listing.json")
+    with open(corpus) as f:
+        page = json.load(f)
+    elements = parse_elements(page["elements"])
+    idx = SelectorIndex("repair-bench", elements)
+    steps = [step(f".made-up-{i}", el.text) for i, el in enumerate(elements[:50])]
+    idx.resolve(steps[0])  # builds the BM25 index once, as the first request would
+
+    report = RepairReport()
+    repairer = SelectorRepairer()
+    for s in steps:
+        repairer.repair_step(idx, s, report)
+    assert report.seconds / len(steps) < 0.001
+
+
+@patch("main.get_tour_generator_chain")
+def test_analyze_reports_repaired_steps(mock_get_chain):
+    chain = AsyncMock()
+    chain.ainvoke.return_value = TourPlan(steps=[
+        step("header > h1", "Welcome to Acme Cloud."),
+        step("p.price", "Pricing starts at ten dollars per seat."),
+        step("#gone", "Nothing on the page says this."),
+    ])
+    mock_get_chain.return_value = chain
+
+    with patch.dict(os.environ, VALID_KEY):
+        response = client.post("/api/analyze", json=PAGE, headers={"Cache-Control": "no-store"})
+
+    assert response.headers["X-Tour-Repaired-Steps"] == "1"
+    assert response.headers["X-Tour-Dropped-Steps"] == "1"
+    assert [s["element_selector"] for s in response.json()["steps"]] == ["header > h1", "main > section:nth-of-type(2) > p"]
@@ -0,0 +1,121 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from answer_cache import SharedAnswerCache
+from schemas import PageContent, PageDelta
+from sessions import SharedPageSessionStore
+from tour_cache import TourCache
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE = {
+    "url": "https://example.com/pricing",
+    "title": "Pricing",
+    "elements": [{"tagName": "H1", "text": "Plans and pricing", "selector": "h1"}],
+}
+PLAN = {"steps": [{"element_selector": "h1", "narrative": "The title.", "action": "scroll", "url": None}]}
+
+
+def test_stores_share_state_between_workers(tmp_path):
+    db = str(tmp_path / "state.db")
+    # Two instances on one database stand in for two worker processes
+    tours = [TourCache(db_path=db, shared=True) for _ in range(2)]
+    sessions = [SharedPageSessionStore(db) for _ in range(2)]
+    answers = [SharedAnswerCache(db, enabled=True) for _ in range(2)]
+
+    tours[0].set("page:tour", PLAN)
+    assert tours[1].get("page:tour") == PLAN
+    tours[1].invalidate("page:tour")
+    assert tours[0].get("page:tour") is None
+
+    page_id = sessions[0].create(PageContent(**PAGE))
+    sessions[1].update(page_id, PageDelta(added=[{"tagName": "P", "text": "Pro is $20", "selector": "p#pro"}]))
+    assert [el.text for el in sessions[0].get(page_id).elements] == ["Plans and pricing", "Pro is $20"]
+    assert sessions[0].delete(page_id) is not None and sessions[1].delete(page_id) is None
+
+    fingerprint = PageContent(**PAGE).fingerprint()
+    answers[0].set(PAGE["url"], fingerprint, "How much does it cost?", {"response": "From $5."})
+    # Paraphrase matching works on the replica too
+    assert answers[1].get(PAGE["url"], fingerprint, "what's the price?") == ({"response": "From $5."}, "similar")
+    answers[1].invalidate_page(fingerprint)
+    assert answers[0].get(PAGE["url"], fingerprint, "How much does it cost?")[0] is None
+
+
+def test_shared_tables_are_bounded(tmp_path):
+    db = str(tmp_path / "state.db")
+    tours = TourCache(max_entries=3, db_path=db, shared=True)
+    for i in range(6):
+        tours.set(f"page{i}:tour", PLAN)
+    assert tours.stats()["size"] == 3 and tours.get("page0:tour") is None
+
+    answers = [SharedAnswerCache(db, enabled=True, max_entries=3) for _ in range(2)]
+    fingerprint = PageContent(**PAGE).fingerprint()
+    answers[0].set(PAGE["url"], fingerprint, "How much does it cost?", {"response": "From $5."})
+    assert answers[1].get(PAGE["url"], fingerprint, "How much does it cost?")[0] is not None
+    # The drop is pruned from the log before the second worker replays it
+    answers[0].invalidate_page(fingerprint)
+    for i in range(4):
+        answers[0].set(f"https://example.com/{i}", f"page{i}", "What is this?", {"response": f"Page {i}."})
+    assert answers[0]._db.execute("SELECT COUNT(*) FROM chat_answers")[0][0] == 3
+
+    assert answers[1].get(PAGE["url"], fingerprint, "How much does it cost?")[0] is None
+    assert answers[1].get("https://example.com/3", "page3", "What is this?")[0] == {"response": "Page 3."}
+    assert answers[1].stats()["resyncs"] == 1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, server: subprocess.Popen):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        assert server.poll() is None, server.stderr.read()
+        try:
+            return httpx.get(url)
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(url)
+
+
+def test_workers_share_tours_and_drain_on_sigterm(tmp_path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, "LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "500", "FAKE_LLM_TOKENS_PER_SECOND": "1000000",
+           "SHARED_STATE_DB": str(tmp_path / "state.db")}
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", "2", "--host", "127.0.0.1", "--port", str(port),
+                               "--log-level", "warning"], cwd=BACKEND, env=env, stderr=subprocess.PIPE, text=True)
+    try:
+        assert wait_until_up(url, server).json()["worker_pid"] != server.pid
+
+        first = httpx.post(f"{url}/api/analyze", json=PAGE, timeout=10)
+        # Fresh connections, so any worker may answer
+        repeats = [httpx.post(f"{url}/api/analyze", json=PAGE, timeout=10) for _ in range(6)]
+        assert first.headers["X-Cache"] == "MISS"
+        assert all(r.headers["X-Cache"] == "HIT" and r.json() == first.json() for r in repeats)
+
+        in_flight = {}
+        slow = threading.Thread(target=lambda: in_flight.update(response=httpx.post(
+            f"{url}/api/analyze", json={**PAGE, "url": "https://example.com/other", "title": "Other"}, timeout=10)))
+        slow.start()
+        time.sleep(0.2)
+        server.send_signal(signal.SIGTERM)
+        slow.join()
+
+        # The request already running finishes; the server then exits cleanly
+        assert in_flight["response"].status_code == 200 and in_flight["response"].json()["steps"]
+        assert server.wait(timeout=10) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
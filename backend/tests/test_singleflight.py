@@ -0,0 +1,94 @@
+import asyncio
+import sys
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from schemas import ChatResponse
+from singleflight import SingleFlight
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+
+def test_concurrent_callers_share_one_call():
+    async def go():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "plan"
+
+        results = await asyncio.gather(*(flight.do("page", work) for _ in range(10)))
+        assert results == ["plan"] * 10
+        assert calls == 1
+        assert flight.stats()["coalesced"] == 9
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(go())
+
+
+def test_failure_reaches_every_waiter():
+    async def go():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("429 quota")
+
+        results = await asyncio.gather(*(flight.do("page", work) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert flight.failures == 1
+
+    asyncio.run(go())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def go():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "plan"
+
+        first = asyncio.create_task(flight.do("page", work))
+        second = asyncio.create_task(flight.do("page", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "plan"
+
+    asyncio.run(go())
+
+
+def test_identical_chat_requests_are_coalesced():
+    calls = 0
+
+    class SlowChain:
+        async def ainvoke(self, inputs):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return ChatResponse(answer="Shared answer", suggestions=[])
+
+    payload = {"query": "What is this page?", "content": {"url": "https://viral.example", "title": "Viral", "elements": []}}
+
+    async def go():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            queries = ["What is this page?", "what is this page", "  What is THIS page?  "] * 4
+            return await asyncio.gather(*(client.post("/api/chat", json={**payload, "query": q}) for q in queries))
+
+    with patch.object(main, "get_chat_chain", lambda model=None: SlowChain()), patch.dict(os.environ, VALID_KEY):
+        responses = asyncio.run(go())
+
+    assert all(r.json()["response"] == "Shared answer" for r in responses)
+    assert calls == 1
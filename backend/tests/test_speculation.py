@@ -0,0 +1,126 @@
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from answer_cache import AnswerCache
+from fake_llm import FakeGeminiChatModel
+from speculation import Speculator
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+
+def fake_answer(ttft: float = 0.0, failure_rate: float = 0.0):
+    model = FakeGeminiChatModel(ttft_seconds=ttft, tokens_per_second=1e6, failure_rate=failure_rate)
+    return lambda: model.ainvoke("User Query: what is this page?")
+
+
+def test_speculated_answer_is_taken_once_and_counted():
+    async def run():
+        speculator = Speculator(enabled=True, busy=lambda: False)
+        assert speculator.submit("q", fake_answer())
+        assert not speculator.submit("q", fake_answer())  # already speculating
+        await asyncio.sleep(0.05)
+        first = await speculator.take("q")
+        second = await speculator.take("q")
+        return speculator.stats(), first, second
+
+    stats, first, second = asyncio.run(run())
+
+    assert "what is this page?" in first.content
+    assert second is None
+    assert stats["hits"] == 1 and stats["lookups"] == 2
+    assert stats["tokens_spent"] > 0 and stats["tokens_used"] == stats["tokens_spent"]
+    assert stats["wasted_token_ratio"] == 0.0
+
+
+def test_take_waits_for_speculation_in_flight():
+    async def run():
+        speculator = Speculator(enabled=True, busy=lambda: False)
+        speculator.submit("q", fake_answer(ttft=0.05))
+        result = await speculator.take("q")
+        return speculator.stats(), result
+
+    stats, result = asyncio.run(run())
+
+    assert result is not None
+    assert stats["hits_in_flight"] == 1
+
+
+def test_busy_server_budget_and_concurrency_cap_skip_speculation():
+    async def run():
+        busy = Speculator(enabled=True, busy=lambda: True)
+        assert not busy.submit("q", fake_answer())
+
+        capped = Speculator(enabled=True, busy=lambda: False, max_in_flight=1)
+        assert capped.submit("a", fake_answer(ttft=0.05))
+        assert not capped.submit("b", fake_answer())
+
+        # One answer spends more than the whole per-minute budget
+        budgeted = Speculator(enabled=True, busy=lambda: False, tokens_per_minute=10)
+        assert budgeted.submit("a", fake_answer())
+        await asyncio.sleep(0.05)
+        assert not budgeted.submit("b", fake_answer())
+        return busy.stats(), capped.stats(), budgeted.stats()
+
+    busy, capped, budgeted = asyncio.run(run())
+
+    assert busy["skipped_busy"] == 1 and busy["started"] == 0
+    assert capped["skipped_in_flight"] == 1
+    assert budgeted["skipped_budget"] == 1
+
+
+def test_expired_and_failed_speculations_are_wasted():
+    async def run():
+        expiring = Speculator(enabled=True, busy=lambda: False, ttl_seconds=0.01)
+        expiring.submit("q", fake_answer())
+        await asyncio.sleep(0.05)
+        missed = await expiring.take("q")
+
+        failing = Speculator(enabled=True, busy=lambda: False)
+        failing.submit("q", fake_answer(failure_rate=1.0))
+        failed = await failing.take("q")
+        return expiring.stats(), missed, failing.stats(), failed
+
+    expiring, missed, failing, failed = asyncio.run(run())
+
+    assert missed is None
+    assert expiring["wasted_token_ratio"] == 1.0
+    assert failed is None and failing["failed"] == 1 and failing["hits"] == 0
+
+
+def test_tapping_a_suggestion_is_served_from_speculation():
+    page = {
+        "url": "https://example.com/spec",
+        "title": "Spec",
+        "elements": [{"tagName": "H1", "text": "A page about speculation", "selector": "h1"}],
+    }
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/api/chat", json={"query": "What is this?", "content": page})
+            await asyncio.sleep(0.05)
+            suggestion = first.json()["suggestions"][0]
+            second = await client.post("/api/chat", json={"query": suggestion, "content": page})
+        return first, second
+
+    speculator = Speculator(enabled=True, busy=lambda: False, max_in_flight=3)
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST), patch.object(main, "speculator", speculator), \
+                patch.object(main, "answer_cache", AnswerCache(enabled=True)):
+            first, second = asyncio.run(run())
+    finally:
+        main.registry.clear()
+
+    assert "X-Speculative" not in first.headers
+    assert second.headers["X-Speculative"] == "hit"
+    assert second.json()["response"]
+    # The fake suggests the same three questions every time, and the one just taken is now in the answer cache
+    assert speculator.stats()["started"] == 3
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import random
+import sys
+import os
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from chains import tour_plan_parser
+from streaming import TourStepStreamParser
+
+client = TestClient(main.app)
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+PAGE = {"url": "https://example.com/stream", "title": "Stream", "elements": [
+    {"tagName": "H1", "text": "Streaming page", "selector": "h1"},
+    {"tagName": "P", "text": "Our history.", "selector": "section:nth-of-type(2) > p"},
+    {"tagName": "A", "text": "Sign up", "id": "signup", "selector": "body > a:nth-of-type(1)"},
+]}
+
+LLM_OUTPUT = """```json
+{
+  "steps": [
+    {"element_selector": "h1", "narrative": "Welcome! Here's the {title} \\"quoted\\" ]", "action": "scroll"},
+    {"element_selector": "section:nth-of-type(2) > p", "narrative": "Moving down, we see the history.", "action": "scroll", "url": null},
+    {"element_selector": "a#signup", "narrative": "Finally, sign up here.", "action": "click"}
+  ]
+}
+```"""
+
+
+class StubStreamChain:
+    def __init__(self, text, chunk_size=7):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    async def astream(self, inputs):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def test_incremental_parse_matches_full_parse_for_any_chunking():
+    expected = tour_plan_parser.parse(LLM_OUTPUT).steps
+    rng = random.Random(7)
+    for _ in range(50):
+        parser = TourStepStreamParser()
+        streamed = []
+        i = 0
+        while i < len(LLM_OUTPUT):
+            size = rng.randint(1, 20)
+            streamed.extend(parser.feed(LLM_OUTPUT[i:i + size]))
+            i += size
+        assert streamed == expected
+
+
+def test_steps_are_emitted_before_the_document_completes():
+    parser = TourStepStreamParser()
+    cut = LLM_OUTPUT.index("section:nth-of-type")
+    assert len(parser.feed(LLM_OUTPUT[:cut])) == 1
+    assert parser.feed(LLM_OUTPUT[cut:]) and len(parser.steps) == 3
+
+
+def test_stream_endpoint_emits_steps_then_identical_plan():
+    main.tour_cache.clear()
+    with patch.object(main, "get_tour_stream_chain", lambda model=None: StubStreamChain(LLM_OUTPUT)), \
+            patch.dict(os.environ, VALID_KEY):
+        response = client.post("/api/analyze/stream", json=PAGE)
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["type"] for e in events] == ["step", "step", "step", "plan"]
+    assert events[-1]["plan"] == tour_plan_parser.parse(LLM_OUTPUT).model_dump()
+    assert [e["step"] for e in events[:-1]] == events[-1]["plan"]["steps"]
+    assert main.llm_admission.in_flight == 0
@@ -0,0 +1,89 @@
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+from schemas import PageContent
+from tour_cache import TourCache, tour_cache, tour_cache_key
+
+client = TestClient(app)
+
+VALID_KEY = {"GOOGLE_API_KEY": "AIza" + "x" * 35}
+
+PAGE = {
+    "url": "https://example.com/#top",
+    "title": "Example Domain",
+    "elements": [
+        {"tagName": "H1", "text": "Example   Domain", "id": "", "className": "hero", "selector": "h1"}
+    ]
+}
+
+PLAN = {"steps": [{"element_selector": "h1", "narrative": "This is the title.", "action": "scroll", "url": None}]}
+
+def test_cache_key_ignores_cosmetic_differences():
+    a = PageContent(**PAGE)
+    b = PageContent(**{**PAGE, "url": "https://example.com", "elements": [
+        {"tagName": "h1", "text": "Example Domain", "id": "", "className": "hero active", "selector": "h1"}
+    ]})
+    c = PageContent(**{**PAGE, "title": "Other"})
+    assert tour_cache_key(a, "Give me a tour") == tour_cache_key(b, "give me a  tour")
+    assert tour_cache_key(a, "Give me a tour") != tour_cache_key(c, "Give me a tour")
+    assert tour_cache_key(a, "Give me a tour") != tour_cache_key(a, "Show me pricing")
+
+def test_lru_eviction_and_ttl():
+    cache = TourCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", PLAN)
+    cache.set("b", PLAN)
+    cache.get("a")
+    cache.set("c", PLAN)
+    assert cache.get("b") is None
+    assert cache.get("a") == PLAN
+    assert cache.evictions == 1
+
+    expired = TourCache(ttl_seconds=-1)
+    expired.set("a", PLAN)
+    assert expired.get("a") is None
+    assert expired.expirations == 1
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    db_path = str(tmp_path / "tours.db")
+    TourCache(db_path=db_path).set("a", PLAN)
+
+    restarted = TourCache(db_path=db_path)
+    assert restarted.get("a") == PLAN
+    assert restarted.stats()["disk_hits"] == 1
+
+def test_sqlite_tier_is_bounded_by_count(tmp_path):
+    db_path = str(tmp_path / "tours.db")
+    cache = TourCache(max_entries=2, db_path=db_path, db_max_entries=3)
+    for key in "abcde":
+        cache.set(key, PLAN)
+
+    restarted = TourCache(db_path=db_path, db_max_entries=3)
+    assert restarted.stats()["db_max_entries"] == 3
+    # The oldest rows were dropped from disk, not only from memory
+    assert [restarted.get(key) is not None for key in "abcde"] == [False, False, True, True, True]
+
+@patch("main.get_tour_generator_chain")
+def test_analyze_serves_repeat_requests_from_cache(mock_get_chain):
+    tour_cache.clear()
+    mock_chain = MagicMock()
+    mock_chain.ainvoke = AsyncMock(return_value=PLAN)
+    mock_get_chain.return_value = mock_chain
+
+    with patch.dict(os.environ, VALID_KEY):
+        first = client.post("/api/analyze", json=PAGE)
+        second = client.post("/api/analyze", json=PAGE)
+        bypass = client.post("/api/analyze", json=PAGE, headers={"Cache-Control": "no-cache"})
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert bypass.headers["X-Cache"] == "MISS"
+    assert second.json() == first.json()
+    assert mock_chain.ainvoke.await_count == 2
+
+    stats = client.get("/").json()["tour_cache"]
+    assert stats["hits"] >= 1 and stats["misses"] >= 1
@@ -0,0 +1,121 @@
+import glob
+import gzip
+import json
+import sys
+import os
+import zlib
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import wire
+from main import app
+from schemas import PageContent
+from wire import decode_columnar, encode_columnar
+
+client = TestClient(app)
+
+FAST = {"LLM_BACKEND": "fake", "FAKE_LLM_TTFT_MS": "0", "FAKE_LLM_TOKENS_PER_SECOND": "1000000"}
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus")
+
+
+def corpus_page() -> dict:
+    with open(os.path.join(CORPUS, "docs.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compact(page: dict) -> dict:
+    return {**page, "elements": encode_columnar(page["elements"])}
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(CORPUS, "*.json"))))
+def test_columnar_round_trip_is_exact(path):
+    with open(path, encoding="utf-8") as f:
+        page = json.load(f)
+    assert decode_columnar(encode_columnar(page["elements"])) == page["elements"]
+    assert PageContent(**compact(page)).fingerprint() == PageContent(**page).fingerprint()
+
+
+def test_columnar_keeps_id_selectors_and_empty_ones():
+    elements = [
+        {"tagName": "H1", "text": "Title", "id": "top", "className": "", "selector": "#top"},
+        {"tagName": "P", "text": "No selector", "id": "", "className": "x y", "selector": ""},
+        {"tagName": "P", "text": "Nested", "id": "", "className": "x y", "selector": "main#app > p:nth-of-type(2)"},
+    ]
+    encoded = encode_columnar(elements)
+    assert decode_columnar(encoded) == elements
+    assert encoded["classes"] == ["", "x y"]
+
+
+@pytest.mark.parametrize("broken", [
+    {"tag": [0, 0]},
+    {"tag": [5]},
+    {"selector": [99]},
+    {"path_parent": [3]},
+])
+def test_malformed_columnar_elements_are_rejected(broken):
+    elements = [{"tagName": "H1", "text": "A heading", "id": "", "className": "", "selector": "body > h1"}]
+    payload = {"url": "https://example.com", "title": "T", "elements": {**encode_columnar(elements), **broken}}
+    assert client.post("/api/pages", json=payload).status_code == 422
+
+
+def test_gzip_columnar_page_matches_plain_upload():
+    page = corpus_page()
+    plain = client.post("/api/pages", json=page).json()
+    body = gzip.compress(json.dumps(compact(page)).encode())
+
+    response = client.post("/api/pages", content=body,
+                           headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    assert response.status_code == 201
+    assert response.json()["fingerprint"] == plain["fingerprint"]
+    assert response.json()["element_count"] == len(page["elements"])
+
+
+def test_bad_request_encodings():
+    headers = {"Content-Type": "application/json"}
+    unknown = client.post("/api/pages", content=b"{}", headers={**headers, "Content-Encoding": "zstd"})
+    assert unknown.status_code == 415
+    assert "gzip" in unknown.headers["accept-encoding"]
+
+    corrupt = client.post("/api/pages", content=b"not gzip", headers={**headers, "Content-Encoding": "gzip"})
+    assert corrupt.status_code == 400
+
+    bomb = zlib.compress(b" " * (wire.REQUEST_MAX_DECOMPRESSED_BYTES + 1))
+    too_large = client.post("/api/pages", content=bomb, headers={**headers, "Content-Encoding": "deflate"})
+    assert too_large.status_code == 413
+
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it():
+    assert client.get("/metrics", headers={"Accept-Encoding": "gzip"}).headers.get("content-encoding") == "gzip"
+    # Small bodies and clients without Accept-Encoding get plain responses
+    small = client.post("/api/pages", json=corpus_page(), headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in client.get("/metrics", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_streamed_tour_still_arrives_line_by_line_when_gzipped():
+    main.registry.clear()
+    try:
+        with patch.dict(os.environ, FAST):
+            with client.stream("POST", "/api/analyze/stream", json=compact(corpus_page()),
+                               headers={"Accept-Encoding": "gzip", "Cache-Control": "no-store"}) as response:
+                assert response.headers["content-encoding"] == "gzip"
+                events = [json.loads(line) for line in response.iter_lines() if line]
+    finally:
+        main.registry.clear()
+    assert events[-1]["type"] == "plan"
+    assert any(event["type"] == "step" for event in events)
+
+
+def test_brotli_request_and_response():
+    brotli = pytest.importorskip("brotli")
+    body = brotli.compress(json.dumps(corpus_page()).encode())
+    response = client.post("/api/pages", content=body, headers={
+        "Content-Type": "application/json", "Content-Encoding": "br", "Accept-Encoding": "gzip, br"})
+    assert response.status_code == 201
+    assert client.get("/metrics", headers={"Accept-Encoding": "gzip;q=0.5, br"}).headers["content-encoding"] == "br"
@@ -0,0 +1,24 @@
+import re
+from typing import List
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my of on or so "
+    "that the this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric words with common English stopwords removed."""
+    return [w for w in _WORD.findall(text.lower()) if w not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap LLM token estimate (~4 characters per token for English prose)."""
+    return (len(text) + 3) // 4
+
+
+def normalize_query(query: str) -> str:
+    """Lowercased, whitespace-collapsed question without trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
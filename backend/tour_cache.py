@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from schemas import PageContent
+from shared_state import SHARED_STATE_DB, Database
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("TOUR_CACHE_MAX_ENTRIES", "512"))
+DEFAULT_TTL_SECONDS = float(os.environ.get("TOUR_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+# Rows kept on disk; unset means the same bound as in memory
+DB_MAX_ENTRIES = int(os.environ["TOUR_CACHE_DB_MAX_ENTRIES"]) if os.environ.get("TOUR_CACHE_DB_MAX_ENTRIES") else None
+
+
+def tour_cache_key(content: PageContent, intent: str) -> str:
+    """Content address of a tour: the canonical page fingerprint plus the intent."""
+    return f"{content.fingerprint()}:{' '.join(intent.lower().split())}"
+
+
+class SQLiteTier:
+    """
+    Optional on-disk tier so cached tours survive restarts.
+    Rows past their expiry are ignored on read and purged on write, and each
+    write evicts the rows closest to expiry beyond `max_entries`.
+    """
+
+    def __init__(self, path: str, table: str = "tours", max_entries: Optional[int] = None):
+        self._table = table
+        self.max_entries = max_entries
+        self._db = Database(path, [
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)",
+        ])
+
+    def get(self, key: str) -> Optional[dict]:
+        rows = self._db.execute(f"SELECT value FROM {self._table} WHERE key = ? AND expires_at > ?", (key, time.time()))
+        return json.loads(rows[0][0]) if rows else None
+
+    def set(self, key: str, value: dict, expires_at: float) -> int:
+        """Stores the row; returns how many live rows were evicted to stay within max_entries."""
+        with self._db.transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            conn.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+            if self.max_entries is None:
+                return 0
+            # Every row gets the same TTL, so the earliest expiry is the oldest write
+            return conn.execute(
+                f"DELETE FROM {self._table} WHERE key IN (SELECT key FROM {self._table} "
+                "ORDER BY expires_at DESC, rowid DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+
+    def delete(self, key: str):
+        self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+
+    def clear(self):
+        self._db.execute(f"DELETE FROM {self._table}")
+
+    def count(self) -> int:
+        return self._db.execute(f"SELECT COUNT(*) FROM {self._table} WHERE expires_at > ?", (time.time(),))[0][0]
+
+
+class TourCache:
+    """
+    In-memory LRU with TTL in front of the tour chain, optionally backed by SQLite.
+    Values are plain TourPlan dicts (page digests, in the digest cache).
+
+    A `shared` database is also written and invalidated by other worker
+    processes, so it is the only tier: a copy kept in memory here would outlive
+    another worker's DELETE /api/analyze/cache. Its rows are bounded by
+    db_max_entries like any disk tier.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 db_path: Optional[str] = None, table: str = "tours", shared: bool = False,
+                 db_max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = SQLiteTier(db_path, table, db_max_entries or max_entries) if db_path else None
+        self.shared = shared and self._disk is not None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        if self.shared:
+            value = self._disk.get(key)
+            with self._lock:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return value
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._put(key, value, now + self.ttl_seconds)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict):
+        expires_at = time.time() + self.ttl_seconds
+        if not self.shared:
+            with self._lock:
+                self._put(key, value, expires_at)
+        if self._disk is not None:
+            evicted = self._disk.set(key, value, expires_at)
+            if evicted and self.shared:
+                # Otherwise the in-memory LRU already counts its own evictions
+                with self._lock:
+                    self.evictions += evicted
+
+    def _put(self, key: str, value: dict, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._disk is not None:
+            self._disk.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": self._disk.count() if self.shared else len(self._entries),
+            "max_entries": self.max_entries,
+            "db_max_entries": self._disk.max_entries if self._disk is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self._disk is not None,
+            "shared": self.shared,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+tour_cache = TourCache(db_path=os.environ.get("TOUR_CACHE_DB") or SHARED_STATE_DB, shared=SHARED_STATE_DB is not None,
+                       db_max_entries=DB_MAX_ENTRIES)
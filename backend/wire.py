@@ -0,0 +1,258 @@
+"""
+Compact wire formats for page snapshots and responses.
+
+Requests: a page's `elements` may be sent as columns instead of a list of
+objects (encode_columnar below). Tag names and class strings become indexes
+into small dictionaries, selectors become nodes of a shared path trie (each
+"a > b > c" prefix is sent once) and texts stay a plain array. PageContent
+decodes it into the usual list of PageElement, so handlers never see the
+difference. Bodies may also be compressed (Content-Encoding: gzip, deflate,
+or br with the optional brotli package); RequestDecompressionMiddleware
+inflates them before FastAPI reads the body. Plain JSON keeps working.
+
+Responses are compressed when the client accepts it: brotli if installed
+and accepted, gzip otherwise. Streamed tours are flushed chunk by chunk, so
+steps still arrive as they are generated.
+"""
+import os
+import zlib
+from typing import Any, Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.responses import PlainTextResponse
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+# Inflated request bodies larger than this are refused with 413
+REQUEST_MAX_DECOMPRESSED_BYTES = int(os.environ.get("REQUEST_MAX_DECOMPRESSED_BYTES", str(8 * 1024 * 1024)))
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1000"))
+RESPONSE_COMPRESSION_LEVEL = int(os.environ.get("RESPONSE_COMPRESSION_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "5"))
+
+COLUMNAR = "columnar"
+SELECTOR_SEPARATOR = " > "
+
+
+# --- Columnar elements ---
+
+def encode_columnar(elements: List[Dict[str, str]]) -> Dict[str, Any]:
+    """The columnar form of a list of element dicts (what domScanner.ts produces)."""
+    tags: Dict[str, int] = {}
+    classes: Dict[str, int] = {"": 0}
+    nodes: Dict[tuple, int] = {}
+    parents: List[int] = []
+    steps: List[str] = []
+    columns = {"tag": [], "text": [], "class": [], "selector": [], "ids": []}
+
+    for i, el in enumerate(elements):
+        columns["tag"].append(tags.setdefault(el["tagName"], len(tags)))
+        columns["text"].append(el.get("text", ""))
+        columns["class"].append(classes.setdefault(el.get("className", ""), len(classes)))
+        if el.get("id"):
+            columns["ids"].append([i, el["id"]])
+        node = -1
+        selector = el.get("selector", "")
+        if selector:
+            for step in selector.split(SELECTOR_SEPARATOR):
+                key = (node, step)
+                if key not in nodes:
+                    nodes[key] = len(steps)
+                    parents.append(node)
+                    steps.append(step)
+                node = nodes[key]
+        columns["selector"].append(node)
+
+    return {"encoding": COLUMNAR, "tags": list(tags), "classes": list(classes),
+            "path_parent": parents, "path_step": steps, **columns}
+
+
+def is_columnar(value: Any) -> bool:
+    return isinstance(value, dict) and value.get("encoding") == COLUMNAR
+
+
+def decode_columnar(value: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Element dicts from the columnar form, for PageElement validation. Raises
+    ValueError (a 422 through pydantic) on mismatched columns or bad indexes.
+    """
+    try:
+        tags, classes = value["tags"], value["classes"]
+        tag, text, cls, selector = value["tag"], value["text"], value["class"], value["selector"]
+        parents, steps = value.get("path_parent", []), value.get("path_step", [])
+        ids = dict(value.get("ids", []))
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"malformed columnar elements: {e}") from None
+    count = len(tag)
+    if not (len(text) == len(cls) == len(selector) == count) or len(parents) != len(steps):
+        raise ValueError("columnar element arrays differ in length")
+
+    # Parents always come before their children, so one forward pass builds every path
+    paths: List[str] = []
+    for parent, step in zip(parents, steps):
+        if not isinstance(parent, int) or not -1 <= parent < len(paths):
+            raise ValueError("selector path refers to an unknown parent")
+        paths.append(step if parent < 0 else f"{paths[parent]}{SELECTOR_SEPARATOR}{step}")
+
+    try:
+        return [
+            {"tagName": tags[tag[i]], "text": text[i], "id": ids.get(i, ""), "className": classes[cls[i]],
+             "selector": paths[selector[i]] if selector[i] >= 0 else ""}
+            for i in range(count)
+        ]
+    except (IndexError, TypeError):
+        raise ValueError("columnar element index out of range") from None
+
+
+# --- Content-Encoding ---
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def decoders() -> Dict[str, Any]:
+    codings = {"gzip": lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), "deflate": lambda: zlib.decompressobj()}
+    if brotli is not None:
+        codings["br"] = brotli.Decompressor
+    return codings
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def decompress(body: bytes, coding: str, limit: int = REQUEST_MAX_DECOMPRESSED_BYTES) -> bytes:
+    """Inflates `body`, stopping as soon as the output passes `limit` (compression bombs)."""
+    decoder = decoders()[coding]()
+    if coding == "br":
+        # No output limit in the brotli API: feed small pieces and check as we go
+        out = []
+        size = 0
+        for start in range(0, len(body), 4096):
+            chunk = decoder.process(body[start:start + 4096])
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+            out.append(chunk)
+        if not decoder.is_finished():
+            raise ValueError("truncated brotli body")
+        return b"".join(out)
+
+    out = decoder.decompress(body, limit + 1)
+    if len(out) > limit or decoder.unconsumed_tail:
+        raise BodyTooLarge()
+    if not decoder.eof:
+        raise ValueError("truncated body")
+    return out
+
+
+class RequestDecompressionMiddleware:
+    """
+    Pure ASGI middleware that inflates compressed request bodies and rewrites
+    the headers, so everything inside sees a plain body. Unknown encodings get
+    415 (with the supported ones in Accept-Encoding), corrupt bodies 400 and
+    bodies that inflate past the limit 413.
+    """
+
+    def __init__(self, app, max_bytes: int = REQUEST_MAX_DECOMPRESSED_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = Headers(scope=scope).get("content-encoding", "").strip().lower()
+        if coding in ("", "identity"):
+            await self.app(scope, receive, send)
+            return
+
+        if coding not in decoders():
+            response = PlainTextResponse(f"Unsupported Content-Encoding: {coding}", status_code=415,
+                                         headers={"Accept-Encoding": ", ".join(decoders())})
+            await response(scope, receive, send)
+            return
+
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        try:
+            body = decompress(b"".join(chunks), coding, self.max_bytes)
+        except BodyTooLarge:
+            await PlainTextResponse("Decompressed body too large", status_code=413)(scope, receive, send)
+            return
+        except (zlib.error, ValueError, Exception if brotli is None else brotli.error) as e:
+            await PlainTextResponse(f"Corrupt {coding} body: {e}", status_code=400)(scope, receive, send)
+            return
+
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        headers.append((b"content-length", str(len(body)).encode()))
+        delivered = False
+
+        async def inflated_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Later calls wait for the disconnect, as with the original body
+            return await receive()
+
+        await self.app({**scope, "headers": headers}, inflated_receive, send)
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = RESPONSE_BROTLI_QUALITY):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        # Flush every streamed chunk so NDJSON steps are not held back
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware that prefers brotli when the client accepts it and the brotli package is installed."""
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES,
+                 compresslevel: int = RESPONSE_COMPRESSION_LEVEL, brotli_quality: Optional[int] = RESPONSE_BROTLI_QUALITY):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality if brotli is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        br, gzip = accepted.get("br", 0), accepted.get("gzip", 0)
+        if self.brotli_quality is not None and br > 0 and br >= gzip:
+            await BrotliResponder(self.app, self.minimum_size, self.brotli_quality)(scope, receive, send)
+        elif gzip > 0:
+            await super().__call__(scope, receive, send)
+        else:
+            # Plain clients go straight through: no buffering of the response start
+            await self.app(scope, receive, send)
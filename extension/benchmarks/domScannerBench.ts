@@ -0,0 +1,168 @@
+// In-browser benchmark of the incremental DOM scanner against the previous full scan.
+//
+//   npm run dev   then open http://localhost:5173/benchmarks/domScanner.html
+//
+// Builds a large synthetic page (nested sections with many siblings, long and
+// short text, hidden blocks), then times a full legacy scan, a cold incremental
+// scan, a rescan with no changes and rescans after typical page updates. Each
+// row also checks that the incremental scan returns exactly what a full scan
+// would, and the update rows compare the delta sent to the backend with the
+// full element list.
+import { diffElements, getScanStats, resetScanner, scanPage } from '../src/content/domScanner';
+import type { SimplifiedElement } from '../src/content/domScanner';
+
+const WORDS = 'plan account workspace project request dashboard setting admin invoice report webhook region backup audit session password'.split(' ');
+
+let seed = 1;
+const random = () => {
+    seed = (seed * 16807) % 2147483647;
+    return seed / 2147483647;
+};
+const sentence = (words: number) => Array.from({ length: words }, () => WORDS[Math.floor(random() * WORDS.length)]).join(' ');
+
+const buildSection = (index: number, depth: number): HTMLElement => {
+    const section = document.createElement('section');
+    let parent: HTMLElement = section;
+    // Deep wrappers with siblings, like component-heavy single-page apps
+    for (let level = 0; level < depth; level++) {
+        for (let s = 0; s < 3; s++) parent.appendChild(document.createElement('span'));
+        const wrapper = document.createElement('div');
+        parent.appendChild(wrapper);
+        parent = wrapper;
+    }
+    parent.insertAdjacentHTML('beforeend', `<h2>Section ${index}: ${sentence(4)}</h2>`);
+    for (let p = 0; p < 12; p++) parent.insertAdjacentHTML('beforeend', `<p>${sentence(30)}</p>`);
+    const list = document.createElement('ul');
+    for (let i = 0; i < 8; i++) list.insertAdjacentHTML('beforeend', `<li>${i % 2 ? 'Short' : sentence(8)}</li>`);
+    parent.appendChild(list);
+    parent.insertAdjacentHTML('beforeend', `<a href="#">More</a><button>Open ${sentence(3)}</button>`);
+    parent.insertAdjacentHTML('beforeend', `<div class="hidden"><p>${sentence(20)}</p><p>${sentence(20)}</p></div>`);
+    return section;
+};
+
+// The scanner before it was made incremental, for comparison
+const legacyScan = (): SimplifiedElement[] => {
+    const relevantTags = ['H1', 'H2', 'H3', 'P', 'BUTTON', 'A', 'IMG', 'LI', 'TABLE', 'ARTICLE', 'SECTION'];
+    const getSelector = (el: Element): string => {
+        if (el.id) return `#${el.id}`;
+        const path = [];
+        while (el.nodeType === Node.ELEMENT_NODE) {
+            let selector = el.nodeName.toLowerCase();
+            if (el.id) {
+                selector += `#${el.id}`;
+                path.unshift(selector);
+                break;
+            } else {
+                let sib = el, nth = 1;
+                while (sib.previousElementSibling) {
+                    sib = sib.previousElementSibling;
+                    if (sib.nodeName.toLowerCase() === selector) nth++;
+                }
+                if (nth != 1) selector += `:nth-of-type(${nth})`;
+            }
+            path.unshift(selector);
+            el = el.parentNode as Element;
+        }
+        return path.join(' > ');
+    };
+    const elements: SimplifiedElement[] = [];
+    document.querySelectorAll(relevantTags.join(',')).forEach((node) => {
+        const el = node as HTMLElement;
+        const text = el.innerText.trim();
+        if (node.tagName !== 'IMG' && text.length < 15) return;
+        if (el.offsetParent === null) return;
+        elements.push({ tagName: el.tagName, text: text.substring(0, 300), id: el.id, className: el.className, selector: getSelector(el) });
+    });
+    return elements.slice(0, 3000);
+};
+
+const median = (values: number[]) => [...values].sort((a, b) => a - b)[Math.floor(values.length / 2)];
+
+interface Row {
+    scenario: string;
+    ms: number;
+    layoutReads: number | string;
+    matchesFullScan: string;
+    payload: string;
+}
+
+const bytes = (value: unknown) => new TextEncoder().encode(JSON.stringify(value)).length;
+
+const run = (sections: number, depth: number, runs: number): Row[] => {
+    const page = document.getElementById('page')!;
+    page.replaceChildren();
+    seed = 1;
+    for (let i = 0; i < sections; i++) page.appendChild(buildSection(i, depth));
+    const rows: Row[] = [];
+
+    const timeLegacy: number[] = [];
+    let full: SimplifiedElement[] = [];
+    for (let r = 0; r < runs; r++) {
+        const start = performance.now();
+        full = legacyScan();
+        timeLegacy.push(performance.now() - start);
+    }
+    rows.push({ scenario: `legacy full scan (${full.length} elements)`, ms: median(timeLegacy), layoutReads: 'all', matchesFullScan: '-', payload: `${bytes(full)} B` });
+
+    const cold: number[] = [];
+    let reads = 0;
+    let scanned: SimplifiedElement[] = [];
+    for (let r = 0; r < runs; r++) {
+        resetScanner();
+        scanned = scanPage();
+        cold.push(getScanStats().ms);
+        reads = getScanStats().layoutReads;
+    }
+    rows.push({ scenario: 'incremental, cold', ms: median(cold), layoutReads: reads, matchesFullScan: String(JSON.stringify(scanned) === JSON.stringify(full)), payload: '' });
+
+    const warm: number[] = [];
+    for (let r = 0; r < runs; r++) {
+        scanned = scanPage();
+        warm.push(getScanStats().ms);
+        reads = getScanStats().layoutReads;
+    }
+    rows.push({ scenario: 'incremental, no changes', ms: median(warm), layoutReads: reads, matchesFullScan: String(JSON.stringify(scanned) === JSON.stringify(legacyScan())), payload: '' });
+
+    const updates: [string, () => void][] = [
+        ['edit 20 paragraphs', () => {
+            const paragraphs = page.querySelectorAll('p');
+            for (let i = 0; i < 20; i++) paragraphs[Math.floor(random() * paragraphs.length)].textContent = sentence(30);
+        }],
+        ['append a section', () => page.appendChild(buildSection(sections, depth))],
+        ['insert a section at the top', () => page.prepend(buildSection(sections + 1, depth))],
+        ['hide one section', () => page.children[Math.floor(page.children.length / 2)].classList.add('hidden')],
+    ];
+    for (const [name, update] of updates) {
+        const before = scanPage();
+        update();
+        const after = scanPage();
+        const stats = getScanStats();
+        const delta = diffElements(before, after);
+        rows.push({
+            scenario: `after: ${name}`,
+            ms: stats.ms,
+            layoutReads: stats.layoutReads,
+            matchesFullScan: String(JSON.stringify(after) === JSON.stringify(legacyScan())),
+            payload: delta ? `delta ${bytes(delta)} B vs full ${bytes(after)} B` : `full ${bytes(after)} B (delta too large)`,
+        });
+    }
+    return rows;
+};
+
+const format = (rows: Row[]) => {
+    const header = `${'scenario'.padEnd(42)} ${'ms'.padStart(9)} ${'layout reads'.padStart(13)}  matches  payload`;
+    return [header, ...rows.map((row) =>
+        `${row.scenario.padEnd(42)} ${row.ms.toFixed(1).padStart(9)} ${String(row.layoutReads).padStart(13)}  ${row.matchesFullScan.padEnd(7)}  ${row.payload}`)].join('\n');
+};
+
+document.getElementById('run')!.addEventListener('click', () => {
+    const value = (id: string) => Number((document.getElementById(id) as HTMLInputElement).value);
+    const results = document.getElementById('results')!;
+    results.textContent = 'Running...';
+    // Let the status paint before the page freezes
+    setTimeout(() => {
+        const rows = run(value('sections'), value('depth'), value('runs'));
+        console.table(rows);
+        results.textContent = format(rows);
+    }, 50);
+});
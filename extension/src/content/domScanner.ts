@@ -7,60 +7,248 @@ export interface SimplifiedElement {
     selector: string;
 }
 
-export const scanPage = (): SimplifiedElement[] => {
-    // We want to capture semantically important elements
-    const relevantTags = ['H1', 'H2', 'H3', 'P', 'BUTTON', 'A', 'IMG', 'LI', 'TABLE', 'ARTICLE', 'SECTION'];
-
-    // Helper to generate a unique selector using nth-of-type for robustness
-    const getSelector = (el: Element): string => {
-        if (el.id) return `#${el.id}`;
-
-        let path = [];
-        while (el.nodeType === Node.ELEMENT_NODE) {
-            let selector = el.nodeName.toLowerCase();
-            if (el.id) {
-                selector += `#${el.id}`;
-                path.unshift(selector);
-                break;
+// Changes to a page the backend already has (PATCH /api/pages/{id}); see PageDelta in backend/schemas.py
+export interface PageDelta {
+    removed: string[];
+    added: (SimplifiedElement & { index: number })[];
+}
+
+// We want to capture semantically important elements
+const RELEVANT_TAGS = ['H1', 'H2', 'H3', 'P', 'BUTTON', 'A', 'IMG', 'LI', 'TABLE', 'ARTICLE', 'SECTION'];
+const RELEVANT_SELECTOR = RELEVANT_TAGS.join(',');
+// Shorter text is noise, unless it's an image
+const MIN_TEXT_LENGTH = 15;
+// Long pages are toured section by section on the backend, so keep the bottom half too
+const MAX_ELEMENTS = 3000;
+
+// --- Per-node caches ---
+// Scans are incremental: everything read from a node is kept until the
+// MutationObserver reports a change that could affect it. Weak maps, so
+// removed nodes are collected with their entries.
+
+interface NodeRecord {
+    text: string;
+    visible: boolean;
+}
+
+// `tag` or `tag:nth-of-type(n)` of each element among its siblings
+let steps = new WeakMap<Element, string>();
+// Selector path from the root (or the nearest ancestor with an id)
+let paths = new WeakMap<Element, string>();
+// innerText and visibility: the reads that force layout
+let records = new WeakMap<Element, NodeRecord>();
+
+let observer: MutationObserver | null = null;
+
+export interface ScanStats {
+    candidates: number;
+    layoutReads: number;
+    ms: number;
+}
+
+let lastScan: ScanStats = { candidates: 0, layoutReads: 0, ms: 0 };
+
+// Computes the step of every child of `parent` in one pass over its children
+const computeSteps = (parent: Element) => {
+    const counts = new Map<string, number>();
+    for (let child = parent.firstElementChild; child; child = child.nextElementSibling) {
+        const tag = child.nodeName.toLowerCase();
+        const nth = (counts.get(tag) ?? 0) + 1;
+        counts.set(tag, nth);
+        steps.set(child, nth !== 1 ? `${tag}:nth-of-type(${nth})` : tag);
+    }
+};
+
+const stepOf = (el: Element): string => {
+    let step = steps.get(el);
+    if (step === undefined) {
+        if (el.parentElement) computeSteps(el.parentElement);
+        step = steps.get(el) ?? el.nodeName.toLowerCase();
+        steps.set(el, step);
+    }
+    return step;
+};
+
+// Same selectors as before (nth-of-type path, cut at the nearest id), memoized per node
+const pathOf = (el: Element): string => {
+    let path = paths.get(el);
+    if (path === undefined) {
+        if (el.id) {
+            path = `${el.nodeName.toLowerCase()}#${el.id}`;
+        } else {
+            const parent = el.parentElement;
+            path = parent ? `${pathOf(parent)} > ${stepOf(el)}` : stepOf(el);
+        }
+        paths.set(el, path);
+    }
+    return path;
+};
+
+const getSelector = (el: Element): string => (el.id ? `#${el.id}` : pathOf(el));
+
+// --- Invalidation ---
+
+const forgetUp = (node: Node | null) => {
+    // An element's innerText includes its descendants', so a change inside it changes its text
+    for (let el = node instanceof Element ? node : node?.parentElement ?? null; el; el = el.parentElement) {
+        records.delete(el);
+    }
+};
+
+const forgetSubtree = (root: Element, { layout, selectors }: { layout: boolean, selectors: boolean }) => {
+    const forget = (el: Element) => {
+        if (layout) records.delete(el);
+        if (selectors) paths.delete(el);
+    };
+    forget(root);
+    const descendants = root.getElementsByTagName('*');
+    for (let i = 0; i < descendants.length; i++) forget(descendants[i]);
+};
+
+// Stylesheet changes and resizes (media queries) can show or hide anything
+const forgetLayout = () => {
+    records = new WeakMap();
+};
+
+const isStylesheet = (node: Node) => node.nodeName === 'STYLE' || node.nodeName === 'LINK';
+
+const applyMutations = (mutations: MutationRecord[]) => {
+    for (const mutation of mutations) {
+        if (mutation.type === 'childList' &&
+            (Array.from(mutation.addedNodes).some(isStylesheet) || Array.from(mutation.removedNodes).some(isStylesheet))) {
+            forgetLayout();
+        }
+        forgetUp(mutation.target);
+        const target = mutation.target;
+        if (!(target instanceof Element)) continue;
+
+        if (mutation.type === 'childList') {
+            // Siblings shifted: every child's nth-of-type, and so every path below, may have changed
+            for (let child = target.firstElementChild; child; child = child.nextElementSibling) steps.delete(child);
+            for (let i = 0; i < target.children.length; i++) {
+                forgetSubtree(target.children[i], { layout: false, selectors: true });
+            }
+            // Nodes moved here from elsewhere keep stale records
+            mutation.addedNodes.forEach((node) => {
+                if (node instanceof Element) forgetSubtree(node, { layout: true, selectors: true });
+            });
+        } else if (mutation.type === 'attributes') {
+            if (mutation.attributeName === 'id') {
+                forgetSubtree(target, { layout: false, selectors: true });
             } else {
-                let sib = el, nth = 1;
-                while (sib.previousElementSibling) {
-                    sib = sib.previousElementSibling;
-                    if (sib.nodeName.toLowerCase() === selector)
-                        nth++;
-                }
-                if (nth != 1)
-                    selector += `:nth-of-type(${nth})`;
+                // class, style or hidden: anything below may have been shown or hidden
+                forgetSubtree(target, { layout: true, selectors: false });
             }
-            path.unshift(selector);
-            el = el.parentNode as Element;
         }
-        return path.join(" > ");
     }
+};
 
-    const elements: SimplifiedElement[] = [];
+const observe = () => {
+    if (observer || typeof MutationObserver === 'undefined') return;
+    observer = new MutationObserver(applyMutations);
+    observer.observe(document.documentElement, {
+        subtree: true,
+        childList: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: ['id', 'class', 'style', 'hidden'],
+    });
+    window.addEventListener('resize', forgetLayout, { passive: true });
+};
+
+// Stops observing and drops every cached read; the next scan starts from scratch
+export const resetScanner = () => {
+    observer?.disconnect();
+    observer = null;
+    window.removeEventListener('resize', forgetLayout);
+    steps = new WeakMap();
+    paths = new WeakMap();
+    forgetLayout();
+};
 
-    // Select all relevant tags
-    const nodes = document.querySelectorAll(relevantTags.join(','));
+export const getScanStats = (): ScanStats => lastScan;
 
-    nodes.forEach((node) => {
-        const el = node as HTMLElement;
-        const text = el.innerText.trim();
+export const scanPage = (): SimplifiedElement[] => {
+    const start = performance.now();
+    observe();
+    // Changes made since the observer last ran, e.g. just before this call
+    if (observer) applyMutations(observer.takeRecords());
 
-        // Filter out empty or very short elements (noise), unless it's an image
-        if (node.tagName !== 'IMG' && text.length < 15) return;
+    const nodes = document.querySelectorAll<HTMLElement>(RELEVANT_SELECTOR);
 
+    // Layout reads, batched: no DOM writes in between, and only for nodes without a current record.
+    // textContent needs no layout; innerText only drops hidden text and adds line breaks, so a
+    // node whose textContent is already too short is skipped without reading layout.
+    let layoutReads = 0;
+    for (let i = 0; i < nodes.length; i++) {
+        const el = nodes[i];
+        if (records.has(el)) continue;
+        if (el.tagName !== 'IMG' && (el.textContent ?? '').trim().length < MIN_TEXT_LENGTH) {
+            // Too short to be kept either way
+            records.set(el, { text: '', visible: false });
+            continue;
+        }
+        layoutReads++;
         // Skip hidden elements
-        if (el.offsetParent === null) return;
+        const visible = el.offsetParent !== null;
+        records.set(el, { text: visible ? el.innerText.trim() : '', visible });
+    }
+
+    const elements: SimplifiedElement[] = [];
+    for (let i = 0; i < nodes.length && elements.length < MAX_ELEMENTS; i++) {
+        const el = nodes[i];
+        const record = records.get(el)!;
+        if (!record.visible) continue;
+        if (el.tagName !== 'IMG' && record.text.length < MIN_TEXT_LENGTH) continue;
 
         elements.push({
             tagName: el.tagName,
-            text: text.substring(0, 300), // Slightly larger context
+            text: record.text.substring(0, 300), // Slightly larger context
             id: el.id,
             className: el.className,
             selector: getSelector(el)
         });
+    }
+
+    lastScan = { candidates: nodes.length, layoutReads, ms: performance.now() - start };
+    return elements;
+};
+
+const sameElement = (a: SimplifiedElement, b: SimplifiedElement) =>
+    a.tagName === b.tagName && a.text === b.text && a.id === b.id && a.className === b.className;
+
+// What changed between two scans of the same page, as a PageDelta the backend
+// applies to its copy (matched by selector). Returns null when resending the
+// whole page is the better choice: selectors are not unique, or most of it changed.
+export const diffElements = (previous: SimplifiedElement[], next: SimplifiedElement[]): PageDelta | null => {
+    const before = new Map<string, number>();
+    previous.forEach((el, i) => before.set(el.selector, i));
+    if (before.size !== previous.length || new Set(next.map((el) => el.selector)).size !== next.length) return null;
+
+    const removed: string[] = [];
+    const added: PageDelta['added'] = [];
+    const kept = new Set<string>();
+    // Kept elements must stay in their old relative order; one that moved back is removed and re-inserted
+    let last = -1;
+    next.forEach((el, index) => {
+        const position = before.get(el.selector);
+        if (position === undefined) {
+            added.push({ ...el, index });
+            return;
+        }
+        kept.add(el.selector);
+        if (position < last) {
+            removed.push(el.selector);
+            added.push({ ...el, index });
+            return;
+        }
+        last = position;
+        if (!sameElement(previous[position], el)) added.push({ ...el, index });
+    });
+    previous.forEach((el) => {
+        if (!kept.has(el.selector)) removed.push(el.selector);
     });
 
-    return elements.slice(0, 500); // Increased limit significantly
+    if (added.length > next.length / 2) return null;
+    return { removed, added };
 };
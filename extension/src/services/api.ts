@@ -1,5 +1,7 @@
 import axios from 'axios';
+import { diffElements } from '../content/domScanner';
 import type { SimplifiedElement } from '../content/domScanner';
+import { postPage } from './wire';
 
 const API_BASE_URL = 'http://localhost:8000/api';
 
@@ -13,34 +15,143 @@ export interface TourPlan {
     steps: TourStep[];
 }
 
-export const generateTour = async (pageTitle: string, elements: SimplifiedElement[]): Promise<TourPlan> => {
+// An intent ("show me pricing") asks for a tour of just that; without one the tour covers the whole page.
+export const generateTour = async (pageTitle: string, elements: SimplifiedElement[], intent?: string): Promise<TourPlan> => {
     try {
-        const response = await axios.post(`${API_BASE_URL}/analyze`, {
+        const query = intent ? `?${new URLSearchParams({ intent })}` : '';
+        const response = await postPage(`${API_BASE_URL}/analyze${query}`, {
             url: window.location.href,
             title: pageTitle,
             elements: elements
         });
+        if (!response.ok) {
+            throw new Error(`Tour request failed with status ${response.status}`);
+        }
 
         // Handle the LangChain result structure
         // If it returns { tool_calls: ... } or just raw JSON, adapt here.
         // Assuming backend returns direct TourPlan object or similar.
-        return response.data;
+        return await response.json();
     } catch (error) {
         console.error('Error generating tour:', error);
         throw error;
     }
 };
 
+// Streams the tour as NDJSON so the first step can start before the whole plan is generated.
+// onStep fires for each step as it arrives; the resolved TourPlan is the complete, final plan.
+export const generateTourStream = async (
+    pageTitle: string,
+    elements: SimplifiedElement[],
+    onStep: (step: TourStep, index: number) => void,
+    intent?: string
+): Promise<TourPlan> => {
+    const query = intent ? `?${new URLSearchParams({ intent })}` : '';
+    const response = await postPage(`${API_BASE_URL}/analyze/stream${query}`, {
+        url: window.location.href,
+        title: pageTitle,
+        elements: elements
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`Tour stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let plan: TourPlan | null = null;
+
+    const handleLine = (line: string) => {
+        if (!line.trim()) return;
+        const event = JSON.parse(line);
+        if (event.type === 'step') onStep(event.step, event.index);
+        else if (event.type === 'plan') plan = event.plan;
+        else if (event.type === 'error') throw new Error(event.detail);
+    };
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop() ?? '';
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered);
+
+    if (!plan) throw new Error('Tour stream ended without a plan');
+    return plan;
+};
+
+// --- Page sessions ---
+// The page is uploaded once via POST /pages and later chats refer to it by id.
+// A cheap signature of the scanned elements tells us when the page changed;
+// the server's copy is then patched with just the changed elements.
+
+interface PageSession {
+    pageId: string;
+    url: string;
+    title: string;
+    signature: string;
+    elements: SimplifiedElement[];
+}
+
+let pageSession: PageSession | null = null;
+
+const elementsSignature = (elements: SimplifiedElement[]): string => {
+    let hash = 0;
+    for (const el of elements) {
+        const key = `${el.selector}|${el.text}`;
+        for (let i = 0; i < key.length; i++) {
+            hash = (hash * 31 + key.charCodeAt(i)) | 0;
+        }
+    }
+    return `${elements.length}:${hash}`;
+};
+
+const ensurePageSession = async (pageTitle: string, elements: SimplifiedElement[]): Promise<string> => {
+    const url = window.location.href;
+    const signature = elementsSignature(elements);
+    if (pageSession && pageSession.url === url) {
+        if (pageSession.signature === signature && pageSession.title === pageTitle) {
+            return pageSession.pageId;
+        }
+        const delta = diffElements(pageSession.elements, elements);
+        if (delta) {
+            await axios.patch(`${API_BASE_URL}/pages/${pageSession.pageId}`, { ...delta, title: pageTitle });
+            pageSession = { ...pageSession, title: pageTitle, signature, elements };
+            return pageSession.pageId;
+        }
+    }
+
+    const response = await postPage(`${API_BASE_URL}/pages`, { url, title: pageTitle, elements });
+    if (!response.ok) {
+        throw new Error(`Page upload failed with status ${response.status}`);
+    }
+    const { page_id: pageId } = await response.json();
+    pageSession = { pageId, url, title: pageTitle, signature, elements };
+    return pageSession.pageId;
+};
+
 export const sendChatMessage = async (query: string, pageTitle: string, elements: SimplifiedElement[]): Promise<{ text: string, suggestions: string[] }> => {
+    const postChat = async () => {
+        const pageId = await ensurePageSession(pageTitle, elements);
+        return axios.post(`${API_BASE_URL}/chat`, { query: query, page_id: pageId });
+    };
+
     try {
-        const response = await axios.post(`${API_BASE_URL}/chat`, {
-            query: query,
-            content: {
-                url: window.location.href,
-                title: pageTitle,
-                elements: elements
+        let response;
+        try {
+            response = await postChat();
+        } catch (error) {
+            // Session expired on the server: register the page again and retry once
+            if (axios.isAxiosError(error) && error.response?.status === 404) {
+                pageSession = null;
+                response = await postChat();
+            } else {
+                throw error;
             }
-        });
+        }
         return {
             text: response.data.response,
             suggestions: response.data.suggestions || []
@@ -0,0 +1,97 @@
+// Compact request bodies for page uploads; decoded by backend/wire.py.
+//
+// Elements go as columns: tag names and class strings as indexes into small
+// dictionaries, selectors as nodes of a path trie (each shared "a > b > c"
+// prefix is sent once), texts as a plain array. Bodies over COMPRESS_MIN_BYTES
+// are gzipped with CompressionStream. If the server rejects the compact form
+// (an older backend), the request is retried as plain JSON and later requests
+// stay plain.
+import type { SimplifiedElement } from '../content/domScanner';
+
+const SELECTOR_SEPARATOR = ' > ';
+const COMPRESS_MIN_BYTES = 1024;
+
+export interface ColumnarElements {
+    encoding: 'columnar';
+    tags: string[];
+    classes: string[];
+    path_parent: number[];
+    path_step: string[];
+    tag: number[];
+    text: string[];
+    class: number[];
+    selector: number[];
+    ids: [number, string][];
+}
+
+export const encodeColumnar = (elements: SimplifiedElement[]): ColumnarElements => {
+    const tags = new Map<string, number>();
+    const classes = new Map<string, number>([['', 0]]);
+    const nodes = new Map<string, number>();
+    const columns: ColumnarElements = {
+        encoding: 'columnar', tags: [], classes: [''], path_parent: [], path_step: [],
+        tag: [], text: [], class: [], selector: [], ids: [],
+    };
+    const indexOf = (map: Map<string, number>, list: string[], value: string) => {
+        let index = map.get(value);
+        if (index === undefined) {
+            index = list.length;
+            map.set(value, index);
+            list.push(value);
+        }
+        return index;
+    };
+
+    elements.forEach((el, i) => {
+        columns.tag.push(indexOf(tags, columns.tags, el.tagName));
+        columns.text.push(el.text);
+        columns.class.push(indexOf(classes, columns.classes, el.className));
+        if (el.id) columns.ids.push([i, el.id]);
+        let node = -1;
+        if (el.selector) {
+            for (const step of el.selector.split(SELECTOR_SEPARATOR)) {
+                const key = `${node}\u0000${step}`;
+                let next = nodes.get(key);
+                if (next === undefined) {
+                    next = columns.path_step.length;
+                    nodes.set(key, next);
+                    columns.path_parent.push(node);
+                    columns.path_step.push(step);
+                }
+                node = next;
+            }
+        }
+        columns.selector.push(node);
+    });
+    return columns;
+};
+
+// Cleared when the server turns down a compact body
+let compactWire = true;
+
+const gzip = async (text: string): Promise<ArrayBuffer> =>
+    new Response(new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'))).arrayBuffer();
+
+const compactBody = async (payload: { elements: SimplifiedElement[] }): Promise<{ body: BodyInit, headers: Record<string, string> }> => {
+    const json = JSON.stringify({ ...payload, elements: encodeColumnar(payload.elements) });
+    const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+    if (json.length < COMPRESS_MIN_BYTES || typeof CompressionStream === 'undefined') return { body: json, headers };
+    return { body: await gzip(json), headers: { ...headers, 'Content-Encoding': 'gzip' } };
+};
+
+// POSTs a page payload ({url, title, elements, ...}), compact when the server accepts it
+export const postPage = async (url: string, payload: { elements: SimplifiedElement[] }): Promise<Response> => {
+    const plain = () => fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+    });
+    if (!compactWire) return plain();
+
+    const response = await fetch(url, { method: 'POST', ...(await compactBody(payload)) });
+    if (![400, 415, 422].includes(response.status)) return response;
+    // Maybe an older backend: only stop sending compact bodies if the plain one is accepted
+    const retried = await plain();
+    if (retried.ok) compactWire = false;
+    return retried;
+};